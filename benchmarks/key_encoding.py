@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+"""
+Compare sorting and merging by encoded keys to tuple keys.
+
+Encoding a key in python costs about as much as sorting by a tuple
+key, so a single in memory sort isn't faster with it, nor is a
+descending sort that can be done as a stable sort per column. The
+encoding pays off where the key is computed once then compared many
+times, as when merging the decorated runs of an external sort,
+where bytes compare faster than tuples::
+
+    python benchmarks/key_encoding.py [rows]
+"""
+from __future__ import print_function
+from operator import itemgetter
+import os
+import random
+import sys
+import timeit
+
+karld_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if karld_path not in sys.path:
+    sys.path.insert(0, karld_path)
+
+from karld.key_encoding import key_encoder
+from karld.merger import decorated_key
+from karld.merger import i_decorate
+from karld.merger import merge
+
+
+def make_rows(total, seed=1):
+    """
+    Make rows of a text, an int and a float column.
+    """
+    rnd = random.Random(seed)
+    return [(u'name{0}'.format(rnd.randint(0, 1000)),
+             rnd.randint(-10 ** 6, 10 ** 6),
+             rnd.random())
+            for _ in range(total)]
+
+
+def sort_descending_by_passes(rows):
+    """
+    Sort by the first column descending then the second ascending
+    without an encoded key, a stable sort per column.
+    """
+    ordered = sorted(rows, key=itemgetter(1))
+    ordered.sort(key=itemgetter(0), reverse=True)
+    return ordered
+
+
+def merge_runs(key, runs):
+    for _ in merge(*runs, key=key):
+        pass
+
+
+def best(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rows = make_rows(total)
+    tuple_key = itemgetter(0, 1)
+    encoded = key_encoder(itemgetter(0, 1))
+    descending = key_encoder(itemgetter(0, 1), descending=[0])
+
+    results = [
+        ("encode keys",
+         best(lambda: [encoded(row) for row in rows])),
+        ("sort, tuple key",
+         best(lambda: sorted(rows, key=tuple_key))),
+        ("sort, encoded key",
+         best(lambda: sorted(rows, key=encoded))),
+        ("sort desc, two passes",
+         best(lambda: sort_descending_by_passes(rows))),
+        ("sort desc, encoded key",
+         best(lambda: sorted(rows, key=descending))),
+    ]
+
+    # Runs of (key, row) pairs, keyed once, as the decorate mode
+    # of the external sort spills them.
+    tuple_runs = [sorted(i_decorate(tuple_key, rows[start::64]),
+                         key=decorated_key)
+                  for start in range(64)]
+    encoded_runs = [sorted(i_decorate(encoded, rows[start::64]),
+                           key=decorated_key)
+                    for start in range(64)]
+    results.extend([
+        ("merge 64 runs, tuple key",
+         best(lambda: merge_runs(decorated_key, tuple_runs))),
+        ("merge 64 runs, encoded key",
+         best(lambda: merge_runs(decorated_key, encoded_runs))),
+    ])
+
+    for name, seconds in results:
+        print("{0:<28} {1:>8.3f}s".format(name, seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+
+"""
+Compare merge and block_merge across fan-in sizes.
+
+Run from anywhere, the karld of this checkout is used::
+
+    python benchmarks/merge_fan_in.py [total_rows]
+"""
+from __future__ import print_function
+from operator import itemgetter
+import os
+import random
+import sys
+import timeit
+
+karld_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if karld_path not in sys.path:
+    sys.path.insert(0, karld_path)
+
+from karld.merger import block_merge
+from karld.merger import merge
+
+
+def make_runs(fan_in, total, seed=1):
+    """
+    Make fan_in sorted runs of (key, value) rows,
+    about total rows in all.
+    """
+    rnd = random.Random(seed)
+    per_run = max(1, total // fan_in)
+    return [sorted(((rnd.random(), index) for index in range(per_run)),
+                   key=itemgetter(0))
+            for _ in range(fan_in)]
+
+
+def time_merge(merger, runs, repeat=3):
+    """
+    Best time, in seconds, to fully consume the merge of runs.
+    """
+    def run():
+        for _ in merger(*runs, key=itemgetter(0)):
+            pass
+
+    return min(timeit.repeat(run, number=1, repeat=repeat))
+
+
+def main():
+    """
+    Compare merge and block_merge across fan-in sizes.
+
+    usage: python merge_fan_in.py [total_rows]
+    """
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+
+    print("{0:>8} {1:>10} {2:>10} {3:>8}".format(
+        "fan-in", "merge", "block", "speedup"))
+    for fan_in in (2, 16, 128, 1024, 5000):
+        runs = make_runs(fan_in, total)
+        heap_seconds = time_merge(merge, runs)
+        block_seconds = time_merge(block_merge, runs)
+        print("{0:>8} {1:>9.3f}s {2:>9.3f}s {3:>7.2f}x".format(
+            fan_in, heap_seconds, block_seconds,
+            heap_seconds / block_seconds))
+
+
+if __name__ == "__main__":
+    main()
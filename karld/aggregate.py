@@ -0,0 +1,336 @@
+"""
+Aggregate streams of items in bounded memory, without sorting them.
+
+The functions that take a batch of items can be given to a pool
+runner, such as `karld.run_together.distribute_multi_run_to_runners`,
+and their partial results combined in the parent by the matching
+merge function.
+
+Per key aggregates are computed with a hash table of mergeable
+aggregator states::
+
+    >>> aggregations = [(COUNT, None), (SUM, itemgetter(2))]
+    >>> list(i_hash_aggregate(rows, itemgetter(0), aggregations))
+    [('a', (2, 7)), ('b', (1, 3))]
+"""
+from collections import namedtuple
+import heapq
+from itertools import chain
+from operator import add
+
+from karld.merger import MAX_IN_MEMORY
+from karld.merger import decorated_key
+from karld.spill import SPILL_PARTITIONS
+from karld.spill import can_partition
+from karld.spill import i_partitioned
+
+__all__ = ['Aggregator',
+           'COUNT',
+           'MAX',
+           'MEAN',
+           'MIN',
+           'SUM',
+           'aggregate_states',
+           'i_hash_aggregate',
+           'i_merge_states',
+           'merge_top_k',
+           'merge_top_k_by_key',
+           'top_k',
+           'top_k_by_key']
+
+
+def top_k(k, items, key=None):
+    """
+    Get the k largest items, holding no more than k items in memory.
+
+    Give `partial(top_k, 100, key=itemgetter(2))` to a pool runner
+    and combine its results with merge_top_k.
+
+    :param k: Number of items to keep.
+    :type k: int
+    :param items: An iterable of items.
+    :param key: Function to get the value to compare items by,
+     defaults to the item itself.
+    :returns: `list` of up to k items, largest first.
+    """
+    return heapq.nlargest(k, items, key=key)
+
+
+def merge_top_k(k, partials, key=None):
+    """
+    Combine partial top k results into the overall top k.
+
+    :param k: Number of items to keep.
+    :type k: int
+    :param partials: An iterable of results of top_k.
+    :param key: Function to get the value to compare items by,
+     the same as given to top_k.
+    :returns: `list` of up to k items, largest first.
+    """
+    return heapq.nlargest(k, chain.from_iterable(partials), key=key)
+
+
+def top_k_by_key(k, items, group_key, key=None):
+    """
+    Get the k largest items of each key, holding no more than
+    k items per key in memory.
+
+    :param k: Number of items to keep per key.
+    :type k: int
+    :param items: An iterable of items.
+    :param group_key: Function to get the key to group items by,
+     key values must be hashable.
+    :param key: Function to get the value to compare items by,
+     defaults to the item itself.
+    :returns: `dict` of each key value to a `list` of up to k items,
+     largest first.
+    """
+    assert k > 0
+    heaps = {}
+    heappush, heappushpop = heapq.heappush, heapq.heappushpop
+    for index, item in enumerate(items):
+        # The negative index breaks ties without comparing items,
+        # keeping the earlier of equal items, like top_k.
+        entry = (item if key is None else key(item), -index, item)
+        group_value = group_key(item)
+        heap = heaps.get(group_value)
+        if heap is None:
+            heaps[group_value] = [entry]
+        elif len(heap) < k:
+            heappush(heap, entry)
+        else:
+            heappushpop(heap, entry)
+
+    return dict((group_value, [entry[2] for entry in sorted(heap,
+                                                            reverse=True)])
+                for group_value, heap in heaps.items())
+
+
+def merge_top_k_by_key(k, partials, key=None):
+    """
+    Combine partial top k by key results into the overall top k
+    of each key.
+
+    :param k: Number of items to keep per key.
+    :type k: int
+    :param partials: An iterable of results of top_k_by_key.
+    :param key: Function to get the value to compare items by,
+     the same as given to top_k_by_key.
+    :returns: `dict` of each key value to a `list` of up to k items,
+     largest first.
+    """
+    combined = {}
+    for partial_result in partials:
+        for group_value, group_items in partial_result.items():
+            if group_value in combined:
+                combined[group_value] = heapq.nlargest(
+                    k, chain(combined[group_value], group_items), key=key)
+            else:
+                combined[group_value] = list(group_items)
+    return combined
+
+
+#: A mergeable aggregate. create makes a state from a value, add
+#: adds a value to a state, merge combines two states and result
+#: gets the aggregate of a state. The functions must be picklable
+#: for states to be spilled or made in a pool.
+Aggregator = namedtuple('Aggregator', ['create', 'add', 'merge', 'result'])
+
+
+def _identity(value):
+    return value
+
+
+def _one(value):
+    return 1
+
+
+def _increment(count, value):
+    return count + 1
+
+
+def _mean_create(value):
+    return value, 1
+
+
+def _mean_add(state, value):
+    return state[0] + value, state[1] + 1
+
+
+def _mean_merge(state, other):
+    return state[0] + other[0], state[1] + other[1]
+
+
+def _mean_result(state):
+    return state[0] / float(state[1])
+
+
+COUNT = Aggregator(_one, _increment, add, _identity)
+SUM = Aggregator(_identity, add, add, _identity)
+MIN = Aggregator(_identity, min, min, _identity)
+MAX = Aggregator(_identity, max, max, _identity)
+MEAN = Aggregator(_mean_create, _mean_add, _mean_merge, _mean_result)
+
+
+def _values(aggregations, item):
+    return [item if value is None else value(item)
+            for _, value in aggregations]
+
+
+def _create_states(aggregations, item):
+    return [aggregator.create(item_value)
+            for (aggregator, _), item_value
+            in zip(aggregations, _values(aggregations, item))]
+
+
+def _add_values(aggregations, states, item):
+    for index, ((aggregator, _), item_value) in enumerate(
+            zip(aggregations, _values(aggregations, item))):
+        states[index] = aggregator.add(states[index], item_value)
+
+
+def _merge_states(aggregations, states, other):
+    for index, (aggregator, _) in enumerate(aggregations):
+        states[index] = aggregator.merge(states[index], other[index])
+
+
+def _results(aggregations, states):
+    return tuple(aggregator.result(state)
+                 for (aggregator, _), state in zip(aggregations, states))
+
+
+def aggregate_states(key, aggregations, items):
+    """
+    Aggregate a batch of items by key, in memory, to the
+    partial states of the aggregations of each key.
+
+    Give `partial(aggregate_states, key, aggregations)` to a pool
+    runner and combine its results with i_merge_states.
+
+    :param key: Key function, key values must be hashable.
+    :param aggregations: Sequence of tuples of an Aggregator, such
+     as COUNT or SUM, and a function to get the value it aggregates
+     from an item, or None for the item itself.
+    :param items: An iterable of items.
+    :returns: `list` of tuples of a key value and a `list` of the
+     states of its aggregations.
+    """
+    table = {}
+    for item in items:
+        key_value = key(item)
+        states = table.get(key_value)
+        if states is None:
+            table[key_value] = _create_states(aggregations, item)
+        else:
+            _add_values(aggregations, states, item)
+    return list(table.items())
+
+
+def _i_merge_states(aggregations, pairs, table, max_in_memory, partitions,
+                    tmp_dir, depth):
+    """
+    Generator of the key values and results, merging the states
+    of the pairs into table, until table is full, then partitioning
+    the table and the rest of the pairs to disk.
+    """
+    pairs = iter(pairs)
+    for key_value, states in pairs:
+        table_states = table.get(key_value)
+        if table_states is None:
+            table[key_value] = list(states)
+            if len(table) >= max_in_memory and can_partition(depth):
+                break
+        else:
+            _merge_states(aggregations, table_states, states)
+    else:
+        for key_value, states in table.items():
+            yield key_value, _results(aggregations, states)
+        return
+
+    def finish(part_depth, part):
+        return _i_merge_states(aggregations, part, {}, max_in_memory,
+                               partitions, tmp_dir, part_depth)
+
+    spilled_table = list(table.items())
+    table.clear()
+    for result in i_partitioned([chain(spilled_table, pairs)],
+                                [decorated_key], finish,
+                                partitions=partitions, depth=depth,
+                                dir=tmp_dir):
+        yield result
+
+
+def i_merge_states(aggregations, partials, max_in_memory=MAX_IN_MEMORY,
+                   partitions=SPILL_PARTITIONS, tmp_dir=None):
+    """
+    Generator of the aggregate results of each key, combining
+    partial states, such as the results of aggregate_states
+    run by a pool runner.
+
+    Up to max_in_memory keys are held in a hash table, beyond that
+    the table and the rest of the states are hash partitioned to
+    temporary files, and each partition is finished in turn.
+
+    :param aggregations: The aggregations the states were made with.
+    :param partials: An iterable of iterables of key value and
+     states pairs.
+    :param max_in_memory: Max number of keys to hold in memory.
+    :type max_in_memory: int
+    :param partitions: Number of partitions to spill to.
+    :type partitions: int
+    :param tmp_dir: Directory for spilled partitions, defaults to the
+     system temporary directory.
+    :yields: tuples of a key value and a tuple of the result of each
+     aggregation, in no particular order.
+    """
+    return _i_merge_states(aggregations, chain.from_iterable(partials), {},
+                           max_in_memory, partitions, tmp_dir, 0)
+
+
+def i_hash_aggregate(iterable, key, aggregations, max_in_memory=MAX_IN_MEMORY,
+                     partitions=SPILL_PARTITIONS, tmp_dir=None):
+    """
+    Generator of the aggregates of the items of each key, without
+    sorting, such as the count, sum, min and max per key.
+
+    Items are aggregated into a hash table of up to max_in_memory
+    keys, beyond that the states and the rest of the items are hash
+    partitioned to temporary files and each partition is finished in
+    turn. Key values and states must be picklable to be spilled.
+
+    :param iterable: An iterable of items.
+    :param key: Key function, key values must be hashable.
+    :param aggregations: Sequence of tuples of an Aggregator and a
+     function to get the value it aggregates from an item, or None
+     for the item itself. See aggregate_states.
+    :param max_in_memory: Max number of keys to hold in memory.
+    :type max_in_memory: int
+    :param partitions: Number of partitions to spill to.
+    :type partitions: int
+    :param tmp_dir: Directory for spilled partitions, defaults to the
+     system temporary directory.
+    :yields: tuples of a key value and a tuple of the result of each
+     aggregation, in no particular order.
+    """
+    assert key is not None
+    items = iter(iterable)
+    table = {}
+    for item in items:
+        key_value = key(item)
+        states = table.get(key_value)
+        if states is None:
+            table[key_value] = _create_states(aggregations, item)
+            if len(table) >= max_in_memory:
+                break
+        else:
+            _add_values(aggregations, states, item)
+    else:
+        for key_value, states in table.items():
+            yield key_value, _results(aggregations, states)
+        return
+
+    pairs = ((key(item), _create_states(aggregations, item))
+             for item in items)
+    for result in _i_merge_states(aggregations, pairs, table, max_in_memory,
+                                  partitions, tmp_dir, 0):
+        yield result
@@ -0,0 +1,281 @@
+"""
+Keep a growing data set sorted by a key, as levels of sorted run
+files, so adding new data doesn't mean merging all of it again.
+
+Each batch of new items is sorted into a run file of its own. Once
+fan_in runs of about the same size sit next to each other, they are
+merged into one run, fan_in times larger, on the next level up. So
+each item is rewritten only about once per level, and adding data
+costs about the size of the new data, amortized. Reading the whole
+data set merges the current runs::
+
+    >>> store = RunStore('history', key=itemgetter(0), dedup=True)
+    >>> store.add(i_get_csv_data('todays_shard.csv'))
+    >>> for row in store:
+    ...     pass
+
+With dedup, only the most recently added item of each key is kept,
+last write wins.
+
+Runs are pickled with `karld.spill`, and named for the range of
+batches they hold, their level and their number of items. A run
+file is written under a temporary name then renamed, and runs left
+behind by an interrupted merge are ignored, so the store stays
+consistent if a process dies while adding. The leftovers are
+removed when the store compacts, or by calling
+`RunStore.remove_stale`, never just by opening the store, so
+readers can open it while another process adds to it.
+"""
+from itertools import groupby
+import os
+import re
+
+from karld.loadump import ensure_dir
+from karld.merger import MAX_IN_MEMORY
+from karld.merger import external_sort
+from karld.merger import merge
+from karld.spill import i_read_run_file
+from karld.spill import write_run
+
+FAN_IN = 4
+MIN_RUN_SIZE = 10000
+
+RUN_NAME = "{0:012d}-{1:012d}_L{2}_{3}.run"
+RUN_NAME_PATTERN = re.compile(r'^(\d+)-(\d+)_L(\d+)_(\d+)\.run$')
+TMP_SUFFIX = ".tmp"
+TMP_NAME = "{0:012d}-{1:012d}" + TMP_SUFFIX
+
+__all__ = ['RunStore',
+           'i_first_of_keys',
+           'i_last_of_keys']
+
+
+def i_first_of_keys(key, items):
+    """
+    Generator of the first item of each run of items with equal keys.
+    """
+    for _, group in groupby(items, key=key):
+        yield next(group)
+
+
+def i_last_of_keys(key, items):
+    """
+    Generator of the last item of each run of items with equal keys.
+    """
+    for _, group in groupby(items, key=key):
+        for item in group:
+            pass
+        yield item
+
+
+class Run(object):
+    """
+    A sorted run file of a RunStore.
+
+    :param path: Path of the run file.
+    :param first: Sequence number of the first batch in the run.
+    :param last: Sequence number of the last batch in the run.
+    :param level: Level of the run.
+    :param count: Number of items in the run.
+    """
+    def __init__(self, path, first, last, level, count):
+        self.path = path
+        self.first = first
+        self.last = last
+        self.level = level
+        self.count = count
+
+    def __repr__(self):
+        return "Run({0!r}, {1}, {2}, {3}, {4})".format(
+            self.path, self.first, self.last, self.level, self.count)
+
+
+class RunStore(object):
+    """
+    A directory of sorted runs that new items are added to
+    incrementally. See the module documentation.
+
+    :param directory: Path of the directory of the runs.
+    :param key: Sort key function. It must be the same every
+     time the directory is opened.
+    :param fan_in: Number of runs of a level merged together.
+    :type fan_in: int
+    :param dedup: Keep only the last added item of each key.
+    :type dedup: bool
+    :param min_run_size: Number of items of a run of the first level,
+     runs of each level up are fan_in times larger.
+    :type min_run_size: int
+    :param max_in_memory: Max number of items to sort in memory at
+     once when adding, see `karld.merger.external_sort`.
+    :type max_in_memory: int
+    :param tmp_dir: Directory for spilled sort runs, defaults to the
+     system temporary directory.
+    """
+    def __init__(self, directory, key=None, fan_in=FAN_IN, dedup=False,
+                 min_run_size=MIN_RUN_SIZE, max_in_memory=MAX_IN_MEMORY,
+                 tmp_dir=None):
+        assert key is not None
+        assert fan_in > 1
+        self.directory = directory
+        self.key = key
+        self.fan_in = fan_in
+        self.dedup = dedup
+        self.min_run_size = min_run_size
+        self.max_in_memory = max_in_memory
+        self.tmp_dir = tmp_dir
+        ensure_dir(directory)
+
+    def _scan(self):
+        """
+        Find the current runs and the runs covered by them.
+
+        :returns: `tuple` of a `list` of the current Run, oldest
+         first, and a `list` of the covered Run.
+        """
+        runs = []
+        for name in os.listdir(self.directory):
+            match = RUN_NAME_PATTERN.match(name)
+            if match:
+                first, last, level, count = map(int, match.groups())
+                runs.append(Run(os.path.join(self.directory, name),
+                                first, last, level, count))
+        # Larger ranges first, so a run covered by another comes after it.
+        runs.sort(key=lambda run: (run.first, -run.last))
+        current = []
+        covered = []
+        for run in runs:
+            if not current or run.first > current[-1].last:
+                current.append(run)
+            else:
+                covered.append(run)
+        return current, covered
+
+    def runs(self):
+        """
+        Get the current runs, oldest first.
+
+        Runs whose batches are all in another run, left behind by
+        an interrupted merge, are left out.
+
+        :returns: `list` of Run.
+        """
+        return self._scan()[0]
+
+    def remove_stale(self):
+        """
+        Remove the files left behind by an interrupted add or merge,
+        runs whose batches are all in another run, and temporary
+        files of runs that were never finished.
+
+        Not safe while another process adds to the store.
+
+        :returns: `list` of the current Run.
+        """
+        current, covered = self._scan()
+        for run in covered:
+            os.remove(run.path)
+        for name in os.listdir(self.directory):
+            if name.endswith(TMP_SUFFIX):
+                os.remove(os.path.join(self.directory, name))
+        return current
+
+    def level_of(self, count):
+        """
+        Get the level of a run of count items.
+        """
+        level = 0
+        size = self.min_run_size * self.fan_in
+        while count >= size:
+            level += 1
+            size *= self.fan_in
+        return level
+
+    def _write_run(self, items, first, last, min_level=0):
+        """
+        Write sorted items to a new run file.
+
+        :returns: Run
+        """
+        tmp_path = os.path.join(self.directory,
+                                TMP_NAME.format(first, last))
+        with open(tmp_path, 'wb') as run_file:
+            count = write_run(items, run_file)
+        level = max(min_level, self.level_of(count))
+        path = os.path.join(self.directory,
+                            RUN_NAME.format(first, last, level, count))
+        os.rename(tmp_path, path)
+        return Run(path, first, last, level, count)
+
+    def _i_merged(self, runs):
+        """
+        Generator of the items of the runs merged, deduplicated
+        if dedup.
+        """
+        readers = [i_read_run_file(run.path) for run in runs]
+        if not self.dedup:
+            return merge(*readers, key=self.key)
+        # Newest first, so the merge puts the last write of each
+        # key first.
+        readers.reverse()
+        return i_first_of_keys(self.key, merge(*readers, key=self.key))
+
+    def add(self, items, presorted=False):
+        """
+        Add a batch of items as a new run, then merge runs of the
+        same size.
+
+        :param items: An iterable of picklable items.
+        :param presorted: Whether items are already sorted by key.
+        :type presorted: bool
+        :returns: `list` of the current Run.
+        """
+        runs = self.runs()
+        sequence = runs[-1].last + 1 if runs else 0
+        if not presorted:
+            items = external_sort(items, key=self.key,
+                                  max_in_memory=self.max_in_memory,
+                                  tmp_dir=self.tmp_dir)
+        if self.dedup:
+            items = i_last_of_keys(self.key, items)
+        run = self._write_run(items, sequence, sequence)
+        if not run.count:
+            os.remove(run.path)
+        return self.compact()
+
+    def compact(self):
+        """
+        Merge fan_in runs in a row of the same level into one run,
+        until there are none left to merge.
+
+        :returns: `list` of the current Run.
+        """
+        runs = self.remove_stale()
+        while True:
+            start = self._find_window(runs)
+            if start is None:
+                return runs
+            merging = runs[start:start + self.fan_in]
+            merged = self._write_run(self._i_merged(merging),
+                                     merging[0].first, merging[-1].last,
+                                     min_level=merging[0].level + 1)
+            for run in merging:
+                os.remove(run.path)
+            runs[start:start + self.fan_in] = [merged]
+
+    def _find_window(self, runs):
+        """
+        Index of the first of fan_in runs in a row of the same level.
+        """
+        fan_in = self.fan_in
+        for start in range(len(runs) - fan_in + 1):
+            level = runs[start].level
+            if all(run.level == level
+                   for run in runs[start + 1:start + fan_in]):
+                return start
+        return None
+
+    def __iter__(self):
+        """
+        Iterate all the items in key order, merging the current runs.
+        """
+        return iter(self._i_merged(self.runs()))
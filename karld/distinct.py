@@ -0,0 +1,236 @@
+"""
+Drop duplicate items from a stream, without sorting it.
+
+i_distinct is exact. It remembers the keys it has seen, up to a
+memory budget, then hash partitions the keys it has seen and the
+rest of the items to disk and finishes a partition at a time.
+
+i_distinct_approximate remembers keys in a Bloom filter of fixed
+size, and may drop a small fraction of distinct items.
+"""
+from itertools import chain
+import math
+
+from karld import is_py3
+from karld.merger import MAX_IN_MEMORY
+from karld.partition import hash_positions
+from karld.spill import SPILL_PARTITIONS
+from karld.spill import can_partition
+from karld.spill import i_partitioned
+
+if is_py3():
+    unicode = str
+    long = int
+
+__all__ = ['BloomFilter',
+           'distinct_items',
+           'i_distinct',
+           'i_distinct_approximate',
+           'i_distinct_results']
+
+
+def _identity(value):
+    return value
+
+
+def _type_tagged(value):
+    """
+    Pair a value, and each item of a tuple or list, with a tag of
+    its type, so values of different types hash differently.
+    """
+    if isinstance(value, (tuple, list)):
+        return tuple(_type_tagged(item) for item in value)
+    if isinstance(value, bytes):
+        tag = b'b'
+    elif isinstance(value, unicode):
+        tag = b'u'
+    elif isinstance(value, bool):
+        tag = b'?'
+    elif isinstance(value, (int, long)):
+        tag = b'i'
+    elif isinstance(value, float):
+        tag = b'f'
+    else:
+        tag = type(value).__name__.encode('utf-8')
+    return tag, value
+
+
+class BloomFilter(object):
+    """
+    A set of values that uses a fixed amount of memory, at the
+    cost of sometimes reporting a value is in it when it isn't.
+
+    Values of different types are different values, so 1, 1.0,
+    True, u'1' and b'1' are all distinct, although some of them
+    are equal in python.
+
+    :param capacity: Number of values expected to be added.
+    :type capacity: int
+    :param error_rate: Chance of a false positive when the
+     filter holds capacity values.
+    :type error_rate: float
+    """
+    def __init__(self, capacity, error_rate=0.001):
+        assert capacity > 0
+        assert 0 < error_rate < 1
+        self.bit_count = int(math.ceil(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(
+            self.bit_count / float(capacity) * math.log(2))))
+        self._bits = bytearray((self.bit_count + 7) // 8)
+
+    def _positions(self, value):
+        """
+        The bit positions of a value and its type, from double hashing.
+        """
+        return hash_positions(_type_tagged(value), self.hash_count,
+                              self.bit_count)
+
+    def add(self, value):
+        """
+        Add a value.
+
+        :returns: Whether the value was probably already in the filter.
+        """
+        bits = self._bits
+        present = True
+        for position in self._positions(value):
+            byte_index, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte_index] & mask:
+                present = False
+                bits[byte_index] |= mask
+        return present
+
+    def __contains__(self, value):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+
+def _i_cleared(values):
+    """
+    Generator of the values of a set, clearing it after the last.
+    """
+    for value in values:
+        yield value
+    values.clear()
+
+
+def _i_distinct(items, key, seen, max_in_memory, partitions, tmp_dir, depth):
+    """
+    Generator of the items with keys not in seen, adding them to seen,
+    until seen is full, then partitioning to disk.
+    """
+    items = iter(items)
+    item_key = _identity if key is None else key
+    for item in items:
+        key_value = item_key(item)
+        if key_value in seen:
+            continue
+        seen.add(key_value)
+        yield item
+        if len(seen) >= max_in_memory and can_partition(depth):
+            break
+    else:
+        return
+
+    def finish(part_depth, seen_part, item_part):
+        return _i_distinct(item_part, key, set(seen_part), max_in_memory,
+                           partitions, tmp_dir, part_depth)
+
+    for item in i_partitioned([_i_cleared(seen), items],
+                              [_identity, item_key], finish,
+                              partitions=partitions, depth=depth,
+                              dir=tmp_dir):
+        yield item
+
+
+def i_distinct(iterable, key=None, max_in_memory=MAX_IN_MEMORY,
+               partitions=SPILL_PARTITIONS, tmp_dir=None):
+    """
+    Generator of the first item of each key, dropping duplicates.
+
+    Items are yielded in their input order until max_in_memory distinct
+    keys have been seen. Then the seen keys and the rest of the items
+    are hash partitioned to temporary files, and each partition is
+    finished in turn, so the order of the rest of the items changes.
+
+    :param iterable: An iterable of items.
+    :param key: Key function, defaults to the item itself. Key values
+     must be hashable and picklable.
+    :param max_in_memory: Max number of keys to hold in memory.
+    :type max_in_memory: int
+    :param partitions: Number of partitions to spill to.
+    :type partitions: int
+    :param tmp_dir: Directory for spilled partitions, defaults to the
+     system temporary directory.
+    """
+    return _i_distinct(iterable, key, set(), max_in_memory, partitions,
+                       tmp_dir, 0)
+
+
+def i_distinct_approximate(iterable, capacity, key=None, error_rate=0.001):
+    """
+    Generator of the first item of each key, dropping duplicates,
+    using a Bloom filter to remember the keys seen.
+
+    Memory is fixed by capacity and error_rate. Every duplicate is
+    dropped, but about error_rate of the distinct items are also
+    dropped, more if there are more than capacity distinct keys.
+
+    :param iterable: An iterable of items.
+    :param capacity: Number of distinct keys expected.
+    :type capacity: int
+    :param key: Key function, defaults to the item itself.
+    :param error_rate: Chance of dropping a distinct item.
+    :type error_rate: float
+    """
+    seen = BloomFilter(capacity, error_rate=error_rate)
+    item_key = _identity if key is None else key
+    for item in iterable:
+        if not seen.add(item_key(item)):
+            yield item
+
+
+def distinct_items(items, key=None):
+    """
+    Drop duplicates from a batch of items, in memory.
+
+    Give this to a pool runner, such as
+    `karld.run_together.distribute_multi_run_to_runners`, to
+    drop the duplicates within each batch in the workers,
+    then drop the duplicates across batches with i_distinct_results.
+
+    :param items: An iterable of items.
+    :param key: Key function, defaults to the item itself.
+    :returns: `list` of the first item of each key.
+    """
+    item_key = _identity if key is None else key
+    seen = set()
+    distinct = []
+    for item in items:
+        key_value = item_key(item)
+        if key_value not in seen:
+            seen.add(key_value)
+            distinct.append(item)
+    return distinct
+
+
+def i_distinct_results(results, key=None, max_in_memory=MAX_IN_MEMORY,
+                       partitions=SPILL_PARTITIONS, tmp_dir=None):
+    """
+    Generator of the distinct items of the results of pool workers.
+
+    :param results: An iterable of iterables of items, such as the
+     results of distinct_items run by a pool runner.
+    :param key: Key function, defaults to the item itself.
+    :param max_in_memory: Max number of keys to hold in memory.
+    :type max_in_memory: int
+    :param partitions: Number of partitions to spill to.
+    :type partitions: int
+    :param tmp_dir: Directory for spilled partitions, defaults to the
+     system temporary directory.
+    """
+    return i_distinct(chain.from_iterable(results), key=key,
+                      max_in_memory=max_in_memory, partitions=partitions,
+                      tmp_dir=tmp_dir)
@@ -9,14 +9,20 @@ from karld.loadump import is_file_csv
 from karld.loadump import i_get_json_data
 from karld.loadump import is_file_json
 
+from karld.loadump import i_read_mapped_file
+
 from karld.loadump import raw_line_reader
 
 from karld.loadump import split_csv_file
 from karld.loadump import split_file
+from karld.loadump import split_file_blocks
 
 from karld.loadump import split_file_output
 from karld.loadump import split_file_output_csv
 from karld.loadump import split_file_output_json
+from karld.loadump import split_file_output_partitioned
+from karld.loadump import split_file_output_partitioned_csv
+from karld.loadump import split_file_output_partitioned_json
 
 from karld.loadump import write_as_csv
 from karld.loadump import write_as_json
@@ -0,0 +1,267 @@
+"""
+Join streams of items on a key.
+
+The sort-merge joins take iterables that are already sorted by the
+join key, such as sorted csv shards, and stream the joined rows in
+key order. Only the items of one key are held in memory at a time.
+
+The hash join takes unsorted iterables. It holds the right iterable
+in a hash table, and when that is larger than its memory budget,
+hash partitions both iterables to disk and joins them a partition
+at a time.
+"""
+from itertools import chain
+from itertools import groupby
+from itertools import islice
+from itertools import product
+
+from karld.loadump import i_get_csv_data
+from karld.merger import MAX_IN_MEMORY
+from karld.merger import decorated_key
+from karld.merger import merge
+from karld.path import i_walk_csv_paths
+from karld.spill import SPILL_PARTITIONS
+from karld.spill import can_partition
+from karld.spill import i_partitioned
+
+INNER = 'inner'
+LEFT = 'left'
+OUTER = 'outer'
+
+JOIN_TYPES = (INNER, LEFT, OUTER)
+
+__all__ = ['INNER',
+           'LEFT',
+           'OUTER',
+           'i_hash_join',
+           'i_merge_join',
+           'i_merge_join_dirs']
+
+
+def _i_tag(key, number, iterable):
+    """
+    Generator of the key value, input number, and item
+    of each item of the iterable.
+    """
+    for item in iterable:
+        yield key(item), number, item
+
+
+def _check_how(how):
+    if how not in JOIN_TYPES:
+        raise ValueError("Unknown join type {0}, use one of {1}".format(
+            how, JOIN_TYPES))
+
+
+def _i_join_sides(key_value, sides, how, fill):
+    """
+    Generator of the joined rows of one key, given the items of the
+    key from each input.
+    """
+    if how == INNER:
+        if not all(sides):
+            return
+    elif how == LEFT:
+        if not sides[0]:
+            return
+    sides = [side if side else [fill] for side in sides]
+    for rows in product(*sides):
+        yield key_value, rows
+
+
+def i_merge_join(iterables, key=None, how=INNER, keys=None, fill=None):
+    """
+    Sort-merge join iterables that are sorted by a key.
+
+    For each key value, yields one joined row for each combination of
+    the items of each iterable with that key. Inner joins only yield
+    keys found in every iterable, left joins keys found in the first,
+    and outer joins keys found in any of them. Where an iterable has
+    no items of the key, fill is used in its place.
+
+    ::
+
+        >>> people = [(1, 'John'), (2, 'Sally'), (4, 'Ann')]
+        >>> pets = [(1, 'cat'), (1, 'dog'), (3, 'fish')]
+        >>> list(i_merge_join([people, pets], key=itemgetter(0)))
+        [(1, ((1, 'John'), (1, 'cat'))), (1, ((1, 'John'), (1, 'dog')))]
+
+    :param iterables: A sequence of iterables, each sorted by key.
+    :param key: Key function, used for every iterable.
+    :param how: INNER, LEFT or OUTER.
+    :param keys: Sequence of a key function for each iterable, used
+     instead of key when the join columns differ.
+    :param fill: Value in place of an item of an iterable missing a key.
+    :returns: Generator of tuples of the key value and a tuple of an
+     item from each iterable. An unknown how raises ValueError here,
+     rather than when the generator is first advanced.
+    """
+    _check_how(how)
+    iterables = list(iterables)
+    if keys is None:
+        assert key is not None
+        keys = [key] * len(iterables)
+    assert len(keys) == len(iterables)
+
+    tagged = [_i_tag(item_key, number, iterable)
+              for number, (item_key, iterable)
+              in enumerate(zip(keys, iterables))]
+    return _i_merge_join(tagged, how, fill)
+
+
+def _i_merge_join(tagged, how, fill):
+    """
+    Generator of the joined rows of iterables of tagged items,
+    see i_merge_join.
+    """
+    for key_value, group in groupby(merge(*tagged, key=decorated_key),
+                                    key=decorated_key):
+        sides = [[] for _ in tagged]
+        for _, number, item in group:
+            sides[number].append(item)
+        for joined in _i_join_sides(key_value, sides, how, fill):
+            yield joined
+
+
+def i_merge_join_dirs(in_dirs, key=None, how=INNER, keys=None, fill=None,
+                      reader=i_get_csv_data, walker=i_walk_csv_paths):
+    """
+    Sort-merge join directories of sorted files.
+
+    The files of each directory are each sorted by key and are
+    merged together, then the directories are joined with
+    i_merge_join.
+
+    :param in_dirs: Sequence of paths of directories.
+    :param key: Key function, used for every directory.
+    :param how: INNER, LEFT or OUTER.
+    :param keys: Sequence of a key function for each directory, used
+     instead of key when the join columns differ.
+    :param fill: Value in place of an item of a directory missing a key.
+    :param reader: Callable that takes a path and returns an iterator
+     of its items, defaults to reading csv.
+    :param walker: Callable that takes a directory and returns
+     the paths of the files to read, defaults to csv files.
+    :yields: tuples of the key value and a tuple of an item
+     from each directory.
+    """
+    in_dirs = list(in_dirs)
+    if keys is None:
+        assert key is not None
+        keys = [key] * len(in_dirs)
+
+    iterables = [merge(*[reader(path) for path in walker(in_dir)],
+                       key=dir_key)
+                 for dir_key, in_dir in zip(keys, in_dirs)]
+
+    return i_merge_join(iterables, how=how, keys=keys, fill=fill)
+
+
+def _hash_table(key, items):
+    """
+    Dict of key values to the list of items with the key value.
+    """
+    table = {}
+    for item in items:
+        key_value = key(item)
+        if key_value in table:
+            table[key_value].append(item)
+        else:
+            table[key_value] = [item]
+    return table
+
+
+def _i_probe(table, left, left_key, how, fill):
+    """
+    Generator joining the left items with the hash table
+    of the right items.
+    """
+    matched = set()
+    for item in left:
+        key_value = left_key(item)
+        right_items = table.get(key_value)
+        if right_items:
+            if how == OUTER:
+                matched.add(key_value)
+            for right_item in right_items:
+                yield key_value, (item, right_item)
+        elif how != INNER:
+            yield key_value, (item, fill)
+
+    if how == OUTER:
+        for key_value, right_items in table.items():
+            if key_value not in matched:
+                for right_item in right_items:
+                    yield key_value, (fill, right_item)
+
+
+def i_hash_join(left, right, key=None, how=INNER, left_key=None,
+                right_key=None, fill=None, max_in_memory=MAX_IN_MEMORY,
+                partitions=SPILL_PARTITIONS, tmp_dir=None, depth=0):
+    """
+    Hash join two iterables that aren't sorted.
+
+    The right iterable is read into a hash table, so make it the
+    smaller one, then the left iterable is streamed past it. If the
+    right iterable has more than max_in_memory items, both iterables
+    are hash partitioned to temporary files, and each pair of
+    partitions is joined the same way, re-partitioning with a
+    different hash if a partition is still too large.
+
+    Joined rows are not in key order. Inner joins yield keys found
+    in both iterables, left joins keys found in left, and outer
+    joins keys found in either. Where an iterable has no items of
+    the key, fill is used in its place.
+
+    :param left: An iterable of items, streamed.
+    :param right: An iterable of items, held in memory.
+    :param key: Key function, used for both iterables. Key values
+     must be hashable.
+    :param how: INNER, LEFT or OUTER.
+    :param left_key: Key function for left, instead of key.
+    :param right_key: Key function for right, instead of key.
+    :param fill: Value in place of an item of an iterable missing a key.
+    :param max_in_memory: Max number of right items to hold in memory.
+    :type max_in_memory: int
+    :param partitions: Number of partitions to spill to.
+    :type partitions: int
+    :param tmp_dir: Directory for spilled partitions, defaults to the
+     system temporary directory.
+    :param depth: How many times the items have been partitioned.
+    :type depth: int
+    :returns: Generator of tuples of the key value and a tuple of a
+     left and right item. An unknown how raises ValueError here,
+     rather than when the generator is first advanced.
+    """
+    _check_how(how)
+    left_key = left_key or key
+    right_key = right_key or key
+    assert left_key is not None and right_key is not None
+    return _i_hash_join(left, right, how, left_key, right_key, fill,
+                        max_in_memory, partitions, tmp_dir, depth)
+
+
+def _i_hash_join(left, right, how, left_key, right_key, fill,
+                 max_in_memory, partitions, tmp_dir, depth):
+    """
+    Generator of the joined rows of a hash join, see i_hash_join.
+    """
+    right = iter(right)
+    head = list(islice(right, max_in_memory + 1))
+    if len(head) <= max_in_memory or not can_partition(depth):
+        table = _hash_table(right_key, chain(head, right))
+        for joined in _i_probe(table, left, left_key, how, fill):
+            yield joined
+        return
+
+    def finish(part_depth, right_part, left_part):
+        return _i_hash_join(left_part, right_part, how, left_key,
+                            right_key, fill, max_in_memory, partitions,
+                            tmp_dir, part_depth)
+
+    streams = [chain(head, right), left]
+    del head
+    for joined in i_partitioned(streams, [right_key, left_key], finish,
+                                partitions=partitions, depth=depth,
+                                dir=tmp_dir):
+        yield joined
@@ -0,0 +1,301 @@
+"""
+Encode keys of multiple columns into bytes that sort in the same order
+as the keys, so sorting and merging compare plain bytes instead of
+tuples of mixed types.
+
+Each column may be sorted ascending or descending::
+
+    >>> encode = key_encoder(itemgetter(2, 0), descending=[1])
+    >>> sorted(rows, key=encode)
+
+Use the encoder as the key of `karld.merger.sort_iterables`,
+`merge`, `external_sort` and friends. With the decorate mode of
+`karld.merger.i_sort_merge_group`, the encoded key is computed once per
+item and is what gets spilled to run files.
+
+Encoding costs about as much as a sort by a tuple key, so it isn't
+worth it for one sort in memory. It is worth it where keys are
+computed once then compared many times, such as merging the runs of
+an external sort with decorate, which benchmarks/key_encoding.py
+shows about twice as fast as with tuple keys, or where columns of
+mixed directions can't otherwise be sorted in one pass.
+
+Supported column types are None, bool, int, float, unicode strings and
+bytes. Values of different types sort by type, in that order, so ints
+and floats in the same column don't sort by value, keep each column
+to one type.
+"""
+import binascii
+from functools import partial
+import struct
+
+from karld import is_py3
+
+if is_py3():
+    unicode = str
+    long = int
+
+NONE_TAG = 0x01
+BOOL_TAG = 0x02
+INT_TAG = 0x03
+FLOAT_TAG = 0x04
+UNICODE_TAG = 0x05
+BYTES_TAG = 0x06
+
+_ESCAPED_ZERO = b'\x00\xff'
+_TERMINATOR = b'\x00\x00'
+
+# Table for bytes.translate that inverts every byte.
+_INVERT_TABLE = bytes(bytearray(0xff - byte for byte in range(256)))
+
+_NONE = bytes(bytearray([NONE_TAG]))
+_FALSE = bytes(bytearray([BOOL_TAG, 0]))
+_TRUE = bytes(bytearray([BOOL_TAG, 1]))
+_ZERO = bytes(bytearray([INT_TAG, 0x01, 0]))
+# Prefixes of positive and negative ints, by the length of the
+# magnitude.
+_POSITIVE_INT = [bytes(bytearray([INT_TAG, 0x01, length]))
+                 for length in range(256)]
+_NEGATIVE_INT = [bytes(bytearray([INT_TAG, 0x00, 255 - length]))
+                 for length in range(256)]
+_FLOAT = bytes(bytearray([FLOAT_TAG]))
+_UNICODE = bytes(bytearray([UNICODE_TAG]))
+_BYTES = bytes(bytearray([BYTES_TAG]))
+
+_SIGN_BIT = 1 << 63
+_ALL_BITS = (1 << 64) - 1
+
+_pack_double = struct.Struct('>d').pack
+_pack_bits = struct.Struct('>Q').pack
+_unpack_bits = struct.Struct('>Q').unpack
+
+__all__ = ['decode_key',
+           'encode_key',
+           'encode_value',
+           'key_encoder']
+
+
+if hasattr(int, 'to_bytes'):
+    def _int_bytes(number):
+        """
+        Big-endian bytes of a non-negative int, without leading zeros.
+        """
+        return number.to_bytes((number.bit_length() + 7) // 8, 'big')
+
+    def _bytes_int(data):
+        return int.from_bytes(data, 'big')
+else:
+    def _int_bytes(number):
+        """
+        Big-endian bytes of a non-negative int, without leading zeros.
+        """
+        if not number:
+            return b''
+        hex_digits = '%x' % number
+        if len(hex_digits) % 2:
+            hex_digits = '0' + hex_digits
+        return binascii.unhexlify(hex_digits.encode('ascii'))
+
+    def _bytes_int(data):
+        return int(binascii.hexlify(bytes(data)), 16) if data else 0
+
+
+def _invert(data):
+    return data.translate(_INVERT_TABLE)
+
+
+def _escape(data):
+    return data.replace(b'\x00', _ESCAPED_ZERO) + _TERMINATOR
+
+
+def _encode_int(value):
+    if not value:
+        return _ZERO
+    if value > 0:
+        magnitude = _int_bytes(value)
+        prefixes = _POSITIVE_INT
+    else:
+        magnitude = _invert(_int_bytes(-value))
+        prefixes = _NEGATIVE_INT
+    if len(magnitude) > 255:
+        raise ValueError("int too large to encode: {0}".format(value))
+    return prefixes[len(magnitude)] + magnitude
+
+
+def _encode_float(value):
+    if value == 0:
+        value = 0.0
+    bits = _unpack_bits(_pack_double(value))[0]
+    if bits & _SIGN_BIT:
+        bits ^= _ALL_BITS
+    else:
+        bits |= _SIGN_BIT
+    return _FLOAT + _pack_bits(bits)
+
+
+def _encode_unicode(value):
+    return _UNICODE + _escape(value.encode('utf-8'))
+
+
+def _encode_bytes(value):
+    return _BYTES + _escape(value)
+
+
+_ENCODERS = {
+    type(None): lambda value: _NONE,
+    bool: lambda value: _TRUE if value else _FALSE,
+    int: _encode_int,
+    long: _encode_int,
+    float: _encode_float,
+    unicode: _encode_unicode,
+    bytes: _encode_bytes,
+}
+
+
+def encode_value(value):
+    """
+    Encode one value into bytes that sort like the value.
+
+    The encoding is prefix free, which keeps the order when values
+    are concatenated, or inverted for descending order.
+
+    :param value: None, bool, int, float, unicode or bytes.
+    :returns: bytes
+    """
+    encoder = _ENCODERS.get(type(value))
+    if encoder is None:
+        # Subclasses, checked in the order bool before int.
+        for value_type in (bool, int, long, float, unicode, bytes):
+            if isinstance(value, value_type):
+                encoder = _ENCODERS[value_type]
+                break
+        else:
+            raise TypeError("Can't encode a key value of type {0}".format(
+                type(value)))
+    return encoder(value)
+
+
+def encode_key(values, descending=()):
+    """
+    Encode a sequence of column values into order preserving bytes.
+
+    :param values: A sequence of values.
+    :param descending: Collection of the positions in values
+     of the columns to sort descending.
+    :returns: bytes
+    """
+    # Look up the encoders of exact types directly, only going
+    # through encode_value for subclasses and unsupported types.
+    encoders = _ENCODERS
+    try:
+        if not descending:
+            return b''.join([encoders[type(value)](value)
+                             for value in values])
+        return b''.join([_invert(encoders[type(value)](value))
+                         if position in descending
+                         else encoders[type(value)](value)
+                         for position, value in enumerate(values)])
+    except KeyError:
+        return b''.join([_invert(encode_value(value))
+                         if position in descending else encode_value(value)
+                         for position, value in enumerate(values)])
+
+
+def encoded_key(key, descending, item):
+    """
+    Encode the key of an item. See key_encoder.
+    """
+    return encode_key(key(item), descending)
+
+
+def key_encoder(key, descending=()):
+    """
+    Create a key function that returns the order preserving
+    bytes of the columns returned by key.
+
+    :param key: Function that takes an item and returns a sequence
+     of column values, such as `itemgetter(2, 0)`. For a single
+     column, it must still return a sequence of one value.
+    :param descending: Collection of the positions in the key
+     of the columns to sort descending.
+    :returns: picklable key function.
+    """
+    return partial(encoded_key, key, frozenset(descending))
+
+
+def _unescape(data, start):
+    """
+    Read an escaped, terminated string from data at start.
+
+    :returns: the bytes and the position after the terminator.
+    """
+    parts = []
+    position = start
+    while True:
+        zero_at = data.index(b'\x00', position)
+        parts.append(bytes(data[position:zero_at]))
+        if data[zero_at + 1] == 0x00:
+            return b'\x00'.join(parts), zero_at + 2
+        position = zero_at + 2
+
+
+def _decode_value(data, position):
+    """
+    Decode the ascending encoded value in data at position.
+
+    :returns: the value and the position after it.
+    """
+    tag = data[position]
+    position += 1
+    if tag == NONE_TAG:
+        return None, position
+    if tag == BOOL_TAG:
+        return bool(data[position]), position + 1
+    if tag == INT_TAG:
+        negative = data[position] == 0x00
+        length = data[position + 1]
+        start = position + 2
+        if negative:
+            length = 255 - length
+            magnitude = _invert(data[start:start + length])
+        else:
+            magnitude = data[start:start + length]
+        number = _bytes_int(bytes(magnitude))
+        return -number if negative else number, start + length
+    if tag == FLOAT_TAG:
+        packed = bytearray(data[position:position + 8])
+        if packed[0] & 0x80:
+            packed[0] &= 0x7f
+        else:
+            packed = _invert(packed)
+        return struct.unpack('>d', bytes(packed))[0], position + 8
+    if tag == UNICODE_TAG:
+        raw, position = _unescape(data, position)
+        return raw.decode('utf-8'), position
+    if tag == BYTES_TAG:
+        return _unescape(data, position)
+    raise ValueError("Unknown key tag {0}".format(tag))
+
+
+def decode_key(data):
+    """
+    Decode bytes from encode_key back into the column values.
+
+    Descending columns are recognized by their inverted tags.
+
+    :param data: bytes from encode_key.
+    :returns: `tuple` of the column values.
+    """
+    data = bytearray(data)
+    values = []
+    position = 0
+    while position < len(data):
+        if data[position] & 0x80:
+            # A descending column, decode the inverted copy of the
+            # rest, then skip the length of the value.
+            value, end = _decode_value(_invert(data[position:]), 0)
+            position += end
+        else:
+            value, position = _decode_value(data, position)
+        values.append(value)
+    return tuple(values)
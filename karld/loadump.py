@@ -1,4 +1,8 @@
 import codecs
+from collections import OrderedDict
+import errno
+import io
+import mmap
 import os
 from os import walk
 import json
@@ -20,34 +24,63 @@ from operator import itemgetter
 from iter_karld_tools import i_batch
 
 from karld import is_py3
+from karld.partition import hash_partitioner
 from karld.unicode_io import csv_reader
 from karld.unicode_io import get_csv_row_writer
 
 LINE_BUFFER_SIZE = 5000
 FILE_BUFFER_SIZE = 10485760  # -1  # 419430400
+PARTITION_FILE_BUFFER_SIZE = 1048576
+MAPPED_BLOCK_SIZE = 1048576
+SPLIT_BLOCK_SIZE = 4194304
+COPY_CHUNK_SIZE = 1073741824
+# Errors from os.copy_file_range and os.sendfile when the files or
+# platform don't support them, to fall back to reading and writing.
+COPY_FALLBACK_ERRNOS = frozenset(
+    getattr(errno, name) for name in ('EXDEV', 'ENOSYS', 'EINVAL',
+                                      'EOPNOTSUPP', 'ENOTSUP', 'ENOTSOCK',
+                                      'EBADF')
+    if hasattr(errno, name))
+MAX_OPEN_FILES = 64
 WALK_SUB_DIR = 0
 WALK_FILES = 2
 
 __all__ = ['dump_dicts_to_json_file',
            'ensure_dir',
            'ensure_file_path_dir',
+           'csv_record_ranges',
+           'file_byte_ranges',
+           'copy_file_range',
+           'csv_file_line_ending',
+           'file_line_ranges',
+           'file_line_split_offsets',
            'file_path_and_name',
            'i_get_csv_data',
+           'i_get_csv_range_data',
            'i_get_json_data',
            'i_read_buffered_file',
            'i_read_buffered_text_file',
            'i_read_buffered_text_file',
+           'i_read_line_range',
+           'i_read_mapped_blocks',
+           'i_read_mapped_file',
            'i_walk_dir_for_filepaths_names',
            'i_walk_dir_for_paths_names',
            'identity',
            'is_file_csv',
            'is_file_json',
            'raw_line_reader',
+           'scan_csv_range',
            'split_csv_file',
            'split_file',
+           'split_file_blocks',
            'split_file_output',
            'split_file_output_csv',
            'split_file_output_json',
+           'split_file_output_partitioned',
+           'split_file_output_partitioned_csv',
+           'split_file_output_partitioned_json',
+           'write_partitioned',
            'write_as_csv',
            'write_as_json']
 
@@ -95,6 +128,286 @@ i_read_buffered_text_file = partial(i_read_buffered_file, binary=False)
 i_read_buffered_binary_file = partial(i_read_buffered_file, binary=True)
 
 
+def _close_mapping(mapped):
+    """
+    Close a memory map, unless memoryviews of it are still held,
+    in which case it's closed when they are garbage collected.
+    """
+    try:
+        mapped.close()
+    except BufferError:
+        pass
+
+
+def i_read_mapped_blocks(file_name, block_size=MAPPED_BLOCK_SIZE,
+                         memoryviews=False):
+    """
+    Generator of blocks of about block_size bytes of a file, each
+    ending at the end of a line, read from a memory map of the file.
+
+    :param file_name: Path to file.
+    :param block_size: Number of bytes per block, blocks are longer
+     when a line is.
+    :type block_size: int
+    :param memoryviews: Yield `memoryview` slices of the mapping,
+     without copying, instead of bytes. The file stays mapped until
+     they are all released.
+    :type memoryviews: bool
+    """
+    with open(file_name, 'rb') as stream:
+        if not os.fstat(stream.fileno()).st_size:
+            return
+        mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    source = memoryview(mapped) if memoryviews else mapped
+    try:
+        start, end = 0, len(mapped)
+        while start < end:
+            stop = start + block_size
+            if stop >= end:
+                stop = end
+            else:
+                newline_at = mapped.rfind(b'\n', start, stop)
+                if newline_at < 0:
+                    newline_at = mapped.find(b'\n', stop)
+                stop = end if newline_at < 0 else newline_at + 1
+            yield source[start:stop]
+            start = stop
+    finally:
+        del source
+        _close_mapping(mapped)
+
+
+def i_read_mapped_file(file_name, block_size=MAPPED_BLOCK_SIZE,
+                       memoryviews=False):
+    """
+    Generator of the lines of a file, read from a memory map of
+    the file a block at a time, like i_read_buffered_binary_file.
+
+    The lines are split from large blocks, so the file is read with
+    few system calls. Lines of bytes are about as fast to get as
+    from i_read_buffered_binary_file, the gain is not copying every
+    block through a file buffer.
+
+    With memoryviews, the lines are `memoryview` slices of the
+    mapping, which copy nothing, but take longer to find per line.
+    They suit long lines that are mostly passed on, rather than
+    parsed, such as when written out with `file.write`. The file
+    stays mapped until they are all released.
+
+    ::
+
+        >>> split_file('big.json', file_reader=i_read_mapped_file)
+        >>> distribute_run_to_runners(count_rows, 'big.csv',
+        ...                           reader=i_read_mapped_file)
+
+    :param file_name: Path to file.
+    :param block_size: Number of bytes to split lines from at a time.
+    :type block_size: int
+    :param memoryviews: Yield `memoryview` lines instead of bytes.
+    :type memoryviews: bool
+    """
+    if not memoryviews:
+        for block in i_read_mapped_blocks(file_name, block_size=block_size):
+            for line in io.BytesIO(block):
+                yield line
+        return
+
+    with open(file_name, 'rb') as stream:
+        if not os.fstat(stream.fileno()).st_size:
+            return
+        mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    try:
+        find = mapped.find
+        start, end = 0, len(mapped)
+        while start < end:
+            stop = find(b'\n', start) + 1 or end
+            yield view[start:stop]
+            start = stop
+    finally:
+        del view
+        _close_mapping(mapped)
+
+
+def file_line_ranges(file_path, ranges):
+    """
+    Divide a file into about equal byte ranges that each start at the
+    start of a line and end at the end of one, so each range can be
+    read on its own, such as by a worker process.
+
+    :param file_path: Path to file.
+    :param ranges: Number of ranges to divide the file into. There may
+     be fewer, when lines are longer than a range.
+    :type ranges: int
+    :returns: `list` of tuples of file_path, start and end offsets.
+    """
+    assert ranges > 0
+    size = os.path.getsize(file_path)
+    boundaries = [0]
+    with open(file_path, 'rb') as stream:
+        for index in range(1, ranges):
+            candidate = size * index // ranges
+            if candidate <= boundaries[-1]:
+                continue
+            # The line that holds the byte before the candidate ends
+            # at the boundary.
+            stream.seek(candidate - 1)
+            stream.readline()
+            boundary = min(stream.tell(), size)
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    if size > boundaries[-1]:
+        boundaries.append(size)
+    return [(file_path, start, end)
+            for start, end in zip(boundaries, boundaries[1:])]
+
+
+def i_read_line_range(file_path, start, end, buffering=FILE_BUFFER_SIZE):
+    """
+    Generator of the lines of a byte range of a file, such as from
+    file_line_ranges.
+
+    :param file_path: Path to file.
+    :param start: Offset of the start of the first line.
+    :type start: int
+    :param end: Offset of the end of the range.
+    :type end: int
+    :param buffering: number of bytes to buffer files
+    :type buffering: int
+    """
+    remaining = end - start
+    if remaining <= 0:
+        return
+    with open(file_path, 'rb', buffering) as stream:
+        stream.seek(start)
+        for line in stream:
+            yield line
+            remaining -= len(line)
+            if remaining <= 0:
+                return
+
+
+def file_byte_ranges(file_path, ranges):
+    """
+    Divide a file into equal byte ranges, without regard to lines.
+
+    :returns: `list` of tuples of file_path, start and end offsets.
+    """
+    assert ranges > 0
+    size = os.path.getsize(file_path)
+    offsets = sorted(set(size * index // ranges
+                         for index in range(ranges + 1)))
+    return [(file_path, start, end)
+            for start, end in zip(offsets, offsets[1:])]
+
+
+def scan_csv_range(byte_range, quotechar=b'"',
+                   block_size=MAPPED_BLOCK_SIZE):
+    """
+    Count the quote characters of a byte range of a csv file and
+    find where its first record ends, both if the range starts
+    outside a quoted field and if it starts inside one.
+
+    A newline ends a record when an even number of quote characters
+    come before it, counting the quote that opened a field the range
+    starts inside. Doubled quotes in a field count twice, so they
+    don't change that. Quote characters inside unquoted fields do,
+    see csv_record_ranges.
+
+    :param byte_range: tuple of the file path, start and end offsets.
+    :param quotechar: The quote character, as bytes.
+    :param block_size: Number of bytes to read at a time.
+    :type block_size: int
+    :returns: tuple of the number of quote characters in the range and
+     a `list` of the offset after the first record end if the range
+     starts outside quotes, and if it starts inside, None for no end.
+    """
+    file_path, start, end = byte_range
+    quotes = 0
+    record_ends = [None, None]
+    with open(file_path, 'rb') as stream:
+        stream.seek(start)
+        position = start
+        while position < end:
+            block = stream.read(min(block_size, end - position))
+            if not block:
+                break
+            counted = 0
+            while None in record_ends:
+                newline_at = block.find(b'\n', counted)
+                if newline_at < 0:
+                    break
+                quotes += block.count(quotechar, counted, newline_at)
+                counted = newline_at + 1
+                for start_parity in (0, 1):
+                    if (record_ends[start_parity] is None and
+                            not (start_parity + quotes) % 2):
+                        record_ends[start_parity] = position + counted
+            quotes += block.count(quotechar, counted)
+            position += len(block)
+    return quotes, record_ends
+
+
+def csv_record_ranges(byte_ranges, scans):
+    """
+    Move the boundaries between byte ranges of a csv file to the
+    ends of records, from the scans of the ranges.
+
+    The quote counts of the ranges before each range tell whether it
+    starts inside a quoted field, which picks where its first record
+    ends. A range without a record end is joined to the one before.
+
+    This assumes quote characters only appear in quoted fields, as
+    the default csv dialect writes them. Read the ranges with the csv
+    reader in strict mode to catch files where that isn't so, such as
+    with i_get_csv_range_data.
+
+    :param byte_ranges: `list` of tuples of the file path, start and
+     end offsets, in order, that cover the file, from file_byte_ranges.
+    :param scans: The result of scan_csv_range of each byte range.
+    :returns: `list` of tuples of the file path, start and end offsets
+     of ranges of whole records.
+    """
+    if not byte_ranges:
+        return []
+    file_path = byte_ranges[0][0]
+    boundaries = [byte_ranges[0][1]]
+    end = byte_ranges[-1][2]
+    parity = 0
+    for index, (quotes, record_ends) in enumerate(scans):
+        if index:
+            boundary = record_ends[parity]
+            if boundary is not None and boundaries[-1] < boundary < end:
+                boundaries.append(boundary)
+        parity = (parity + quotes) % 2
+    boundaries.append(end)
+    return [(file_path, start, stop)
+            for start, stop in zip(boundaries, boundaries[1:])
+            if stop > start]
+
+
+def i_get_csv_range_data(file_path, start, end, encoding='utf-8', **kwargs):
+    """
+    Generator of the csv rows of a byte range of whole records of a
+    csv file, such as from csv_record_ranges.
+
+    :param file_path: Path to file.
+    :param start: Offset of the start of the first record.
+    :type start: int
+    :param end: Offset of the end of the last record.
+    :type end: int
+    :param encoding: Encoding of the file.
+    :param kwargs: Arguments for the csv reader, such as strict=True.
+    """
+    lines = i_read_line_range(file_path, start, end)
+    if is_py3():
+        lines = codecs.iterdecode(lines, encoding)
+    else:
+        kwargs['encoding'] = encoding
+    for row in csv_reader(lines, **kwargs):
+        yield row
+
+
 def i_get_unicode_lines(file_name, encoding='utf-8', **kwargs):
     """
     A generator for reading a text file as unicode lines.
@@ -117,8 +430,11 @@ def i_get_unicode_lines(file_name, encoding='utf-8', **kwargs):
 
 def i_get_csv_data(file_name, *args, **kwargs):
     """A generator for reading a csv file.
+
+    Takes a buffering keyword argument for the file, the other
+    arguments are passed to the csv reader.
     """
-    buffering = kwargs.get('buffering', FILE_BUFFER_SIZE)
+    buffering = kwargs.pop('buffering', FILE_BUFFER_SIZE)
     read_file_kwargs = dict(buffering=buffering)
     if is_py3():
         read_file_kwargs.update(dict(binary=False))
@@ -133,10 +449,17 @@ def i_get_csv_data(file_name, *args, **kwargs):
 def i_get_json_data(file_name, *args, **kwargs):
     """A generator for reading file with json documents
     delimited by newlines.
+
+    Takes a reader keyword argument, a callable that takes the
+    file name and returns its lines as bytes, such as
+    i_read_mapped_file.
     """
-    buffering = kwargs.get('buffering', FILE_BUFFER_SIZE)
-    read_file_kwargs = dict(buffering=buffering)
-    data = i_read_buffered_file(file_name, **read_file_kwargs)
+    reader = kwargs.get('reader')
+    if reader is None:
+        buffering = kwargs.get('buffering', FILE_BUFFER_SIZE)
+        data = i_read_buffered_file(file_name, buffering=buffering)
+    else:
+        data = reader(file_name)
 
     for row in data:
         yield json.loads(row.decode())
@@ -312,13 +635,360 @@ def split_file_output(name, data, out_dir, max_lines=1100,
             shard_file.write(join_str.join(group))
 
 
+def open_csv_row_writer(file_name, buffering=FILE_BUFFER_SIZE,
+                        get_csv_row_writer=get_csv_row_writer):
+    """
+    Open a file to append csv rows to.
+
+    :returns: tuple of the file and its csv row writer function.
+    """
+    kwargs = dict(buffering=buffering)
+    if is_py3():
+        mode = 'at'
+        kwargs.update(dict(newline=''))
+    else:
+        mode = 'ab'
+    csv_file = open(file_name, mode, **kwargs)
+    return csv_file, get_csv_row_writer(csv_file)
+
+
+def open_json_row_writer(file_name, buffering=FILE_BUFFER_SIZE):
+    """
+    Open a file to append rows of json to.
+
+    :returns: tuple of the file and its json row writer function.
+    """
+    json_file = open(file_name, 'a', buffering=buffering)
+
+    def write_row(item):
+        json_file.write(json.dumps(item) + os.linesep)
+
+    return json_file, write_row
+
+
+def open_line_writer(file_name, buffering=FILE_BUFFER_SIZE):
+    """
+    Open a file to append lines to.
+
+    :returns: tuple of the file and its write method.
+    """
+    line_file = open(file_name, 'ab', buffering=buffering)
+    return line_file, line_file.write
+
+
+def write_partitioned(items, file_names, partitioner, open_row_writer,
+                      max_open_files=MAX_OPEN_FILES):
+    """
+    Write each item to the file of its partition.
+
+    The partition files are truncated, then items are appended to
+    them. No more than max_open_files are kept open at once, the least
+    recently written file is closed to make room for another.
+
+    :param items: An iterable of items.
+    :param file_names: Sequence of the paths of the partition files.
+    :param partitioner: Callable that takes an item and returns
+     the index of its partition in file_names.
+    :param open_row_writer: Callable that takes a path and returns
+     a tuple of an open file and a function to write an item to it,
+     such as open_csv_row_writer.
+    :param max_open_files: Max number of files open at once.
+    :type max_open_files: int
+    """
+    assert max_open_files > 0
+    for file_name in file_names:
+        open(file_name, 'wb').close()
+
+    open_writers = OrderedDict()
+    try:
+        for item in items:
+            index = partitioner(item)
+            writer = open_writers.pop(index, None)
+            if writer is None:
+                if len(open_writers) >= max_open_files:
+                    _, (least_recent_file, _) = open_writers.popitem(
+                        last=False)
+                    least_recent_file.close()
+                writer = open_row_writer(file_names[index])
+            open_writers[index] = writer
+            writer[1](item)
+    finally:
+        for partition_file, _ in open_writers.values():
+            partition_file.close()
+
+
+def _partition_file_names(filename, out_dir, partitions):
+    """
+    Names of partition files, named like the shards of split output.
+    """
+    if out_dir is None:
+        out_dir = os.path.abspath(os.path.dirname(filename))
+    basename = os.path.basename(filename)
+    return [os.path.join(out_dir, "{0}_{1}".format(index, basename))
+            for index in range(partitions)]
+
+
+def _get_partitioner(key, partitions, partitioner):
+    assert key is not None or partitioner is not None
+    if partitioner is None:
+        partitioner = hash_partitioner(key, partitions)
+    return partitioner
+
+
+def split_file_output_partitioned_csv(
+        filename, data, partitions, key=None, out_dir=None,
+        partitioner=None, max_open_files=MAX_OPEN_FILES,
+        buffering=PARTITION_FILE_BUFFER_SIZE,
+        get_csv_row_writer=get_csv_row_writer):
+    """
+    Split an iterable of csv serializable rows of data into
+    partitions files by the hash of a key, so all rows with the
+    same key are in the same partition.
+
+    Each partition can then be sorted, merged and grouped
+    independently, such as with
+    `karld.run_together.pool_run_files_to_files`.
+
+    :param filename: Each partition file will use this in its name.
+    :param data: Iterable of rows of data to write.
+    :param partitions: Number of partition files.
+    :type partitions: int
+    :param key: Key function to partition by the hash of.
+    :param out_dir: Path to directory to write the partitions, defaults
+     to the directory of filename.
+    :param partitioner: Callable that takes a row and returns the index
+     of its partition, used instead of hashing key.
+    :param max_open_files: Max number of partition files open at once.
+    :type max_open_files: int
+    :param buffering: number of bytes to buffer each open file
+    :type buffering: int
+    :param get_csv_row_writer: callable that returns a csv row writer
+     function.
+    :returns: `list` of the partition file paths.
+    """
+    file_names = _partition_file_names(filename, out_dir, partitions)
+    write_partitioned(
+        data, file_names, _get_partitioner(key, partitions, partitioner),
+        partial(open_csv_row_writer, buffering=buffering,
+                get_csv_row_writer=get_csv_row_writer),
+        max_open_files=max_open_files)
+    return file_names
+
+
+def split_file_output_partitioned_json(
+        filename, dict_list, partitions, key=None, out_dir=None,
+        partitioner=None, max_open_files=MAX_OPEN_FILES,
+        buffering=PARTITION_FILE_BUFFER_SIZE):
+    """
+    Split an iterable of JSON serializable rows of data into
+    partitions files by the hash of a key.
+    See split_file_output_partitioned_csv.
+
+    :returns: `list` of the partition file paths.
+    """
+    file_names = _partition_file_names(filename, out_dir, partitions)
+    write_partitioned(
+        dict_list, file_names, _get_partitioner(key, partitions, partitioner),
+        partial(open_json_row_writer, buffering=buffering),
+        max_open_files=max_open_files)
+    return file_names
+
+
+def split_file_output_partitioned(
+        name, data, out_dir, partitions, key=None, partitioner=None,
+        max_open_files=MAX_OPEN_FILES,
+        buffering=PARTITION_FILE_BUFFER_SIZE):
+    """
+    Split an iterable of lines into partitions files by the hash
+    of a key. See split_file_output_partitioned_csv.
+
+    :returns: `list` of the partition file paths.
+    """
+    file_names = _partition_file_names(name, out_dir, partitions)
+    write_partitioned(
+        data, file_names, _get_partitioner(key, partitions, partitioner),
+        partial(open_line_writer, buffering=buffering),
+        max_open_files=max_open_files)
+    return file_names
+
+
+def _nth_newline(block, start, nth, line_length):
+    """
+    Find the nth newline of block from start, which must be there,
+    counting the newlines of spans of about nth average lines at a
+    time rather than finding each line.
+    """
+    while True:
+        stop = min(len(block), start + max(nth * line_length, 1))
+        found = block.count(b'\n', start, stop)
+        if found >= nth:
+            break
+        nth -= found
+        start = stop
+    position = stop
+    for _ in range(found - nth + 1):
+        position = block.rfind(b'\n', start, position)
+    return position
+
+
+def _line_split_offsets(file_path, max_lines, block_size):
+    """
+    Get the offsets that split a file into shards of max_lines lines,
+    see file_line_split_offsets, and count its carriage returns not
+    followed by a newline.
+
+    :returns: `tuple` of the `list` of offsets and the number of bare
+     carriage returns.
+    """
+    assert max_lines > 0
+    offsets = [0]
+    needed = max_lines
+    position = 0
+    bare_returns = 0
+    last = b''
+    with open(file_path, 'rb', 0) as stream:
+        while True:
+            block = stream.read(block_size)
+            if not block:
+                break
+            bare_returns += block.count(b'\r') - block.count(b'\r\n')
+            if last == b'\r' and block[:1] == b'\n':
+                bare_returns -= 1
+            last = block[-1:]
+            newlines = block.count(b'\n')
+            line_length = len(block) // max(newlines, 1)
+            start = 0
+            while newlines >= needed:
+                newline_at = _nth_newline(block, start, needed, line_length)
+                newlines -= needed
+                start = newline_at + 1
+                offsets.append(position + start)
+                needed = max_lines
+            needed -= newlines
+            position += len(block)
+    if position > offsets[-1]:
+        offsets.append(position)
+    return offsets, bare_returns
+
+
+def file_line_split_offsets(file_path, max_lines,
+                            block_size=SPLIT_BLOCK_SIZE):
+    """
+    Get the offsets that split a file into shards of max_lines
+    lines, counting newlines a block at a time with bytes.count,
+    without making an object of each line.
+
+    :param file_path: Path to the file.
+    :param max_lines: Max number of lines in each shard.
+    :type max_lines: int
+    :param block_size: Number of bytes to read at a time.
+    :type block_size: int
+    :returns: `list` of the offsets of the start of each shard,
+     then of the end of the file.
+    """
+    return _line_split_offsets(file_path, max_lines, block_size)[0]
+
+
+def copy_file_range(in_file, out_file, offset, length,
+                    buffering=FILE_BUFFER_SIZE):
+    """
+    Copy length bytes of in_file from offset to the position of
+    out_file, within the kernel with `os.copy_file_range` or
+    `os.sendfile` where the platform and files allow, otherwise
+    with large reads and writes.
+
+    :param in_file: File opened for binary reading.
+    :param out_file: Unbuffered file opened for binary writing.
+    :param offset: Offset in in_file to copy from.
+    :type offset: int
+    :param length: Number of bytes to copy.
+    :type length: int
+    :param buffering: Number of bytes to read and write at a time
+     without the kernel copies.
+    :type buffering: int
+    """
+    in_fd, out_fd = in_file.fileno(), out_file.fileno()
+    copiers = []
+    if hasattr(os, 'copy_file_range'):
+        copiers.append(lambda position, size: os.copy_file_range(
+            in_fd, out_fd, size, position))
+    if hasattr(os, 'sendfile'):
+        copiers.append(lambda position, size: os.sendfile(
+            out_fd, in_fd, position, size))
+
+    copied = 0
+    for copier in copiers:
+        try:
+            while copied < length:
+                sent = copier(offset + copied,
+                              min(length - copied, COPY_CHUNK_SIZE))
+                if not sent:
+                    break
+                copied += sent
+            return copied
+        except OSError as error:
+            if copied or error.errno not in COPY_FALLBACK_ERRNOS:
+                raise
+
+    in_file.seek(offset)
+    while copied < length:
+        data = in_file.read(min(buffering, length - copied))
+        if not data:
+            break
+        out_file.write(data)
+        copied += len(data)
+    return copied
+
+
+def split_file_blocks(file_path, out_dir=None, max_lines=200000,
+                      block_size=SPLIT_BLOCK_SIZE):
+    """
+    Shard a file of newline delimited lines like split_file, with
+    byte identical shards, but without iterating lines in python.
+
+    Newlines are counted a block at a time to find the offsets of
+    the shards, see file_line_split_offsets, then each shard is
+    copied from the file with copy_file_range, so splitting is
+    bound by I/O rather than by the interpreter.
+
+    :param file_path: Path to the large input file.
+    :type file_path: str
+    :param out_dir: Path of directory to put the shards, defaults to
+     the directory of the file.
+    :type out_dir: str
+    :param max_lines: Max number of lines in each shard.
+    :type max_lines: int
+    :param block_size: Number of bytes to read at a time.
+    :type block_size: int
+    :returns: `list` of the paths of the shards.
+    """
+    base_name = os.path.basename(file_path)
+    if out_dir is None:
+        out_dir = os.path.abspath(os.path.dirname(file_path))
+    else:
+        ensure_dir(out_dir)
+
+    offsets = file_line_split_offsets(file_path, max_lines,
+                                      block_size=block_size)
+    shard_paths = []
+    with open(file_path, 'rb') as in_file:
+        for index, (start, end) in enumerate(zip(offsets, offsets[1:])):
+            shard_path = os.path.join(out_dir,
+                                      "{0}_{1}".format(index, base_name))
+            with open(shard_path, 'wb', 0) as shard_file:
+                copy_file_range(in_file, shard_file, start, end - start)
+            shard_paths.append(shard_path)
+    return shard_paths
+
+
 def raw_line_reader(file_object):
     return (line for line in file_object)
 
 
 def split_file(file_path, out_dir=None, max_lines=200000,
                buffering=FILE_BUFFER_SIZE, line_reader=raw_line_reader,
-               split_file_writer=split_file_output, read_binary=True):
+               split_file_writer=split_file_output, read_binary=True,
+               file_reader=None):
     """
     Opens then shards the file.
 
@@ -330,6 +1000,9 @@ def split_file(file_path, out_dir=None, max_lines=200000,
     :type out_dir: str
     :param buffering: number of bytes to buffer files
     :type buffering: int
+    :param file_reader: Callable that takes the file path and returns
+     its lines, instead of opening it with buffering, such as
+     i_read_mapped_file.
     """
     dir_name = os.path.abspath(os.path.dirname(file_path))
 
@@ -342,44 +1015,214 @@ def split_file(file_path, out_dir=None, max_lines=200000,
     else:
         ensure_dir(out_dir)
 
-    data_file = i_read_buffered_file(file_path, buffering, binary=read_binary)
+    if file_reader is None:
+        data_file = i_read_buffered_file(file_path, buffering,
+                                         binary=read_binary)
+    else:
+        data_file = file_reader(file_path)
     data = line_reader(data_file)
     split_file_writer(base_name, data, out_dir, max_lines=max_lines,
                       buffering=buffering)
 
 
-split_csv_file = partial(split_file,
-                         line_reader=csv_reader,
-                         split_file_writer=split_file_output_csv,
-                         read_binary=True)
-if is_py3():
-    split_csv_file = partial(split_file,
-                             line_reader=csv_reader,
-                             split_file_writer=split_file_output_csv,
-                             read_binary=False)
-
-split_csv_file.__doc__ = """
-Split a large csv file without separating newlines in quotes. Runs slower
-than split_file.
-the csv reader and writer use the default dialect.
-    customize this for non-default options:
-     `custom_reader = partial(csv_reader, delimiter="|");`
-     `split_multi_line_csv_file('input_file.csv', line_reader=custom_reader)`
-
-     Writing the csv data with a non-default dialect requires defining
-     a split_file_writer with a custom write_as_csv with a custom
-     csv row writer factory.
-
-     ```my_split_file_writer = partial(
-            split_file_output_csv,
-            write_as_csv=partial(
-                write_as_csv,
-                get_csv_row_writer=partial(
-                    get_csv_row_writer, delimiter="|")))```
-     `split_multi_line_csv_file('input_file.csv',
-      split_file_writer=my_split_file_writer)`
-
-"""
+def _csv_range_line_ending(stream, start, end, quotechar, block_size):
+    """
+    Scan a byte range of a csv file, see csv_file_line_ending.
+
+    :param end: Offset of the end of the range, or None for the
+     end of the file.
+    """
+    returns = newlines = crlfs = 0
+    last = b''
+    stream.seek(start)
+    remaining = end - start if end is not None else None
+    while remaining is None or remaining > 0:
+        size = block_size if remaining is None else min(block_size,
+                                                        remaining)
+        block = stream.read(size)
+        if not block:
+            break
+        if remaining is not None:
+            remaining -= len(block)
+        if quotechar in block:
+            return None
+        returns += block.count(b'\r')
+        newlines += block.count(b'\n')
+        crlfs += block.count(b'\r\n')
+        if last == b'\r' and block[:1] == b'\n':
+            crlfs += 1
+        last = block[-1:]
+    if not returns:
+        return b'\n'
+    if returns == crlfs == newlines:
+        return b'\r\n'
+    return None
+
+
+def csv_file_line_ending(file_path, quotechar=b'"',
+                         block_size=SPLIT_BLOCK_SIZE):
+    """
+    Scan a csv file for what would make its lines differ from its
+    rows written back by the default csv writer.
+
+    A file without quotechar has no quoted newlines, nor quoted
+    fields the writer would write differently, so each line is a
+    row, written back the same but terminated with b'\\r\\n'. That
+    holds if all its lines end with b'\\n' and there is no b'\\r',
+    or they all end with b'\\r\\n' and there is no other b'\\r'.
+
+    :param file_path: Path to the csv file.
+    :param quotechar: The quote character of the csv dialect.
+    :type quotechar: bytes
+    :param block_size: Number of bytes to read at a time.
+    :type block_size: int
+    :returns: The line ending of the file, b'\\n' or b'\\r\\n', or
+     None if the file must be split reading and writing its rows.
+    """
+    with open(file_path, 'rb', 0) as stream:
+        return _csv_range_line_ending(stream, 0, None, quotechar,
+                                      block_size)
+
+
+def _write_csv_shard(file_path, in_file, shard_path, start, end,
+                     line_ending, buffering=FILE_BUFFER_SIZE):
+    """
+    Write the lines of a byte range of a csv file to a shard, as the
+    default csv writer would write their rows.
+
+    :param line_ending: The line ending of the range, see
+     csv_file_line_ending. None reads and writes the rows.
+    """
+    if line_ending is None:
+        write_as_csv(i_get_csv_range_data(file_path, start, end),
+                     shard_path, buffering=buffering)
+        return
+
+    with open(shard_path, 'wb', 0) as shard_file:
+        if line_ending == b'\r\n':
+            copy_file_range(in_file, shard_file, start, end - start)
+        else:
+            in_file.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                data = in_file.read(min(buffering, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                shard_file.write(data.replace(b'\n', b'\r\n'))
+        in_file.seek(end - 1)
+        if in_file.read(1) != b'\n':
+            shard_file.write(b'\r\n')
+
+
+def _split_csv_file_blocks(file_path, out_dir, offsets, line_ending=None,
+                           buffering=FILE_BUFFER_SIZE):
+    """
+    Shard a csv file, without newlines in quotes or bare carriage
+    returns, by its lines, writing them as the default csv writer
+    would.
+
+    :param offsets: Offsets of the shards, see
+     file_line_split_offsets.
+    :param line_ending: The line ending of the file, see
+     csv_file_line_ending. If None, each shard is scanned,
+     and shards with quotes have their rows read and written.
+    """
+    base_name = os.path.basename(file_path)
+    with open(file_path, 'rb') as in_file:
+        for index, (start, end) in enumerate(zip(offsets, offsets[1:])):
+            shard_path = os.path.join(out_dir,
+                                      "{0}_{1}".format(index, base_name))
+            shard_line_ending = line_ending
+            if shard_line_ending is None:
+                shard_line_ending = _csv_range_line_ending(
+                    in_file, start, end, b'"', SPLIT_BLOCK_SIZE)
+            _write_csv_shard(file_path, in_file, shard_path, start, end,
+                             shard_line_ending, buffering=buffering)
+
+
+def split_csv_file(file_path, out_dir=None, max_lines=200000,
+                   buffering=FILE_BUFFER_SIZE, line_reader=csv_reader,
+                   split_file_writer=split_file_output_csv,
+                   read_binary=not is_py3(), file_reader=None,
+                   quoted_newlines=None):
+    """
+    Split a large csv file without separating newlines in quotes.
+
+    With the default csv reader and writer, the file is first
+    scanned for quotes, see csv_file_line_ending. A file without
+    them is split by its lines, like split_file_blocks, into
+    shards byte identical to those of reading and writing its
+    rows. Otherwise the rows are read and written, which runs
+    slower than split_file.
+
+    The csv reader and writer use the default dialect.
+        customize this for non-default options:
+         `custom_reader = partial(csv_reader, delimiter="|");`
+         `split_multi_line_csv_file('input_file.csv', line_reader=custom_reader)`
+
+         Writing the csv data with a non-default dialect requires defining
+         a split_file_writer with a custom write_as_csv with a custom
+         csv row writer factory.
+
+         ```my_split_file_writer = partial(
+                split_file_output_csv,
+                write_as_csv=partial(
+                    write_as_csv,
+                    get_csv_row_writer=partial(
+                        get_csv_row_writer, delimiter="|")))```
+         `split_multi_line_csv_file('input_file.csv',
+          split_file_writer=my_split_file_writer)`
+
+    :param quoted_newlines: Whether the file may have newlines in
+     quotes. None scans the file to find out. True always reads
+     and writes the rows. False trusts the file has none, so it is
+     cut by its lines without the scan for quotes, and only the
+     shards with quotes have their rows read and written. A file
+     with bare carriage returns, which end rows but not lines, has
+     all its rows read and written. The shards are the same either
+     way. False only works with
+     the default line_reader, split_file_writer and file_reader.
+    :type quoted_newlines: bool
+
+    For the rest of the parameters, see split_file.
+    """
+    defaults = (line_reader is csv_reader and
+                split_file_writer is split_file_output_csv and
+                file_reader is None)
+    if quoted_newlines is False and not defaults:
+        raise ValueError("quoted_newlines=False only works with the "
+                         "default line_reader, split_file_writer and "
+                         "file_reader")
+
+    line_ending = None
+    offsets = None
+    if quoted_newlines is None and defaults:
+        line_ending = csv_file_line_ending(file_path)
+        if line_ending is not None:
+            offsets = file_line_split_offsets(file_path, max_lines)
+    elif quoted_newlines is False:
+        # Universal newlines reading the rows would also end lines
+        # at bare carriage returns, so only cut files without them.
+        offsets, bare_returns = _line_split_offsets(file_path, max_lines,
+                                                    SPLIT_BLOCK_SIZE)
+        if bare_returns:
+            offsets = None
+
+    if offsets is None:
+        split_file(file_path, out_dir=out_dir, max_lines=max_lines,
+                   buffering=buffering, line_reader=line_reader,
+                   split_file_writer=split_file_writer,
+                   read_binary=read_binary, file_reader=file_reader)
+        return
+
+    if out_dir is None:
+        out_dir = os.path.abspath(os.path.dirname(file_path))
+    else:
+        ensure_dir(out_dir)
+    _split_csv_file_blocks(file_path, out_dir, offsets,
+                           line_ending=line_ending, buffering=buffering)
+
 
 split_multi_line_csv_file = split_csv_file
 
@@ -1,6 +1,12 @@
+from bisect import bisect_left
+from bisect import bisect_right
 from functools import partial
+from functools import reduce
+from itertools import chain
 from itertools import groupby
+from itertools import islice
 from operator import attrgetter
+from operator import itemgetter
 
 try:
     from itertools import ifilter
@@ -13,7 +19,60 @@ except ImportError:
 import logging
 import heapq
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from iter_karld_tools import i_batch
+
 from karld import is_py3
+from karld.spill import spill
+
+MAX_IN_MEMORY = 200000
+MERGE_BLOCK_SIZE = 1000
+COMBINE_BATCH_SIZE = 100000
+# Max number of spilled runs read at once by a merge.
+MERGE_FAN_IN = 64
+
+# Key types numpy can sort in the same order as python.
+VECTOR_KEY_TYPES = (bool, int, float, bytes, type(u''))
+
+decorated_key = itemgetter(0)
+decorated_value = itemgetter(1)
+
+
+def composite_key(key, secondary_key, item):
+    """
+    Get the tuple of the key and the secondary key of an item.
+    """
+    return key(item), secondary_key(item)
+
+
+def secondary_sort_key(key, secondary_key):
+    """
+    Create a key function that sorts by key, then by secondary_key
+    within equal keys.
+
+    :param key: Key function.
+    :param secondary_key: Key function to order items of equal key.
+    :returns: picklable key function.
+    """
+    return partial(composite_key, key, secondary_key)
+
+
+def decorated_primary_key(pair):
+    """
+    Get the key of a pair decorated with a composite key.
+    """
+    return pair[0][0]
+
+
+def decorated_secondary_key(pair):
+    """
+    Get the secondary key of a pair decorated with a composite key.
+    """
+    return pair[0][1]
 
 #generator that gets sorted iterator
 
@@ -67,30 +126,548 @@ def merge(*iterables, **kwargs):
             return
 
 
+def _read_block(source, key, block_size):
+    """
+    Read the next block of a merge source.
+
+    :returns: `list` of the block items, `list` of their keys and
+     whether the source is exhausted.
+    """
+    block = list(islice(source, block_size))
+    keys = block if key is None else list(map(key, block))
+    return block, keys, len(block) < block_size
+
+
+def block_merge(*iterables, **kwargs):
+    """Merge multiple sorted inputs into a single sorted output.
+
+    A drop-in replacement for merge, for merging a large number of
+    inputs. Instead of maintaining a heap with each item, it reads a
+    block of items from each input and repeatedly takes every buffered
+    item up to the smallest last buffered key of all the inputs, which
+    is then safe to output. Those items are ordered with one stable
+    sort, which merges the already sorted pieces at C speed, so the
+    per item cost barely grows with the number of inputs.
+
+    Like merge, items with equal keys are output in the order
+    of the inputs they came from.
+
+    Memory use is about block_size items per input.
+
+    :param iterables: Iterables, each sorted by key.
+    :param key: Key function, optional.
+    :param block_size: Number of items to read from an input at a time.
+    :type block_size: int
+    """
+    key = kwargs.get('key')
+    block_size = kwargs.get('block_size', MERGE_BLOCK_SIZE)
+    return chain.from_iterable(
+        _i_merged_blocks(iterables, key, block_size))
+
+
+def _i_merged_blocks(iterables, key, block_size):
+    """
+    Generator of the sorted blocks of items that make up
+    the merge of the iterables. See block_merge.
+    """
+    key_is_None = key is None
+    # The state of each input, in input order, is a list of its
+    # buffered items, their keys, whether it's exhausted, its
+    # iterator and the position of its next buffered item.
+    states = []
+    for source in map(iter, iterables):
+        block, keys, exhausted = _read_block(source, key, block_size)
+        if block:
+            states.append([block, keys, exhausted, source, 0])
+
+    while states:
+        # The bound is the smallest last buffered key of the inputs
+        # that may have more items. Nothing smaller can come later.
+        bound = None
+        bound_at = None
+        for position, state in enumerate(states):
+            if not state[2]:
+                last = state[1][-1]
+                if bound_at is None or last < bound:
+                    bound, bound_at = last, position
+
+        taken_items = []
+        taken_keys = []
+        if bound_at is None:
+            for block, keys, exhausted, source, start in states:
+                taken_items.extend(block[start:])
+                if not key_is_None:
+                    taken_keys.extend(keys[start:])
+            states = []
+        else:
+            # Items equal to the bound may be taken only from the
+            # inputs up to the one that set the bound, later inputs
+            # must wait for all its equal items.
+            refilled = []
+            for position, state in enumerate(states):
+                block, keys, exhausted, source, start = state
+                if position <= bound_at:
+                    cut = bisect_right(keys, bound, start)
+                else:
+                    cut = bisect_left(keys, bound, start)
+                if cut > start:
+                    taken_items.extend(block[start:cut])
+                    if not key_is_None:
+                        taken_keys.extend(keys[start:cut])
+                    state[4] = cut
+                if cut == len(block):
+                    if exhausted:
+                        continue
+                    block, keys, exhausted = _read_block(
+                        source, key, block_size)
+                    if not block:
+                        continue
+                    state[:] = [block, keys, exhausted, source, 0]
+                refilled.append(state)
+            states = refilled
+
+        if key_is_None:
+            taken_items.sort()
+            yield taken_items
+        else:
+            taken = list(zip(taken_keys, taken_items))
+            taken.sort(key=decorated_key)
+            yield imap(decorated_value, taken)
+
+
 def sorted_by(key, items):
     return sorted(items, key=key)
 
 
-def sort_iterables(iterables, key=None):
+def _sorted_by_keys(keys, items):
+    """
+    Sort items by their already computed keys.
+    """
+    return [items[index]
+            for index in sorted(range(len(keys)), key=keys.__getitem__)]
+
+
+def _take(items, order):
+    """
+    Get the list of items in the order of an array of indexes.
+    """
+    try:
+        objects = numpy.fromiter(items, dtype=object, count=len(items))
+    except (TypeError, ValueError):
+        # numpy before 1.23 can't make object arrays with fromiter.
+        return list(itemgetter(*order.tolist())(items))
+    return objects[order].tolist()
+
+
+def vector_sorted_by(key, items):
+    """
+    Sort items by key with a numpy argsort when the keys are all
+    ints, floats, bools or strings of one type, which is faster
+    than comparing python objects. Otherwise, or without numpy,
+    falls back to sorted. The sort is stable either way.
+
+    Ints too large for 64 bits fall back to sorted. String keys
+    ending in null characters may tie with the same string without
+    them, as numpy ignores trailing nulls.
+
+    :param key: Sort key function.
+    :param items: An iterable of items.
+    :returns: `list` of the sorted items.
+    """
+    items = list(items)
+    if numpy is None or len(items) < 2:
+        return sorted_by(key, items)
+
+    keys = list(map(key, items))
+    key_types = set(map(type, keys))
+    if len(key_types) != 1 or not key_types <= set(VECTOR_KEY_TYPES):
+        return _sorted_by_keys(keys, items)
+    try:
+        keys_array = numpy.array(keys)
+    except (OverflowError, ValueError):
+        return _sorted_by_keys(keys, items)
+    if keys_array.dtype.kind not in 'biufSU':
+        return _sorted_by_keys(keys, items)
+
+    return _take(items, numpy.argsort(keys_array, kind='stable'))
+
+
+def i_sorted_runs(iterable, key=None, max_in_memory=MAX_IN_MEMORY,
+                  tmp_dir=None, sorter=sorted_by):
+    """
+    Sort the iterable in chunks of at most max_in_memory items,
+    spilling each sorted chunk to a temporary run file.
+
+    :param iterable: An iterable of picklable items.
+    :param key: Sort key function.
+    :param max_in_memory: Max number of items to sort in memory at once.
+    :type max_in_memory: int
+    :param tmp_dir: Directory for the run files, defaults to the system
+     temporary directory.
+    :param sorter: Function that takes key and items and returns
+     a sorted list, such as vector_sorted_by.
+    :yields: `karld.spill.SpilledItems` of each sorted run.
+    """
+    for batch in i_batch(max_in_memory, iterable):
+        yield spill(sorter(key, batch), dir=tmp_dir)
+
+
+def merge_runs_down(runs, key=None, fan_in=MERGE_FAN_IN, tmp_dir=None):
+    """
+    Merge spilled runs fan_in at a time into larger runs, pass after
+    pass, until no more than fan_in runs remain.
+
+    Each merge reads a chunk at a time from at most fan_in runs, so
+    the files open and the items read ahead are bounded by fan_in,
+    however many runs there are. Merged runs keep the order of the
+    runs, so merging the result is stable.
+
+    :param runs: Sequence of `karld.spill.SpilledItems`, each
+     sorted by key. Runs that are merged are closed.
+    :param key: Sort key function.
+    :param fan_in: Max number of runs to merge at once.
+    :type fan_in: int
+    :param tmp_dir: Directory for the merged runs, defaults to the
+     system temporary directory.
+    :returns: `list` of at most fan_in sorted runs.
+    """
+    assert fan_in > 1
+    runs = list(runs)
+    while len(runs) > fan_in:
+        merged = []
+        for group in i_batch(fan_in, runs):
+            merged.append(spill(merge(*group, key=key), dir=tmp_dir))
+            for run in group:
+                run.close()
+        runs = merged
+    return runs
+
+
+def external_sort(iterable, key=None, max_in_memory=MAX_IN_MEMORY,
+                  tmp_dir=None, sorter=sorted_by, secondary_key=None,
+                  fan_in=MERGE_FAN_IN):
+    """
+    Sort an iterable that doesn't fit in memory.
+
+    Bounded chunks of the items are sorted and spilled to temporary
+    run files, then the runs are streamed back through merge, after
+    merging them down to fan_in runs with merge_runs_down if there
+    are more. Peak memory depends on max_in_memory and fan_in, not
+    on the size of the iterable. The sort is stable.
+
+    :param iterable: An iterable of picklable items.
+    :param key: Sort key function.
+    :param max_in_memory: Max number of items to sort in memory at once.
+    :type max_in_memory: int
+    :param tmp_dir: Directory for the run files, defaults to the system
+     temporary directory.
+    :param sorter: Function that takes key and items and returns
+     a sorted list, such as vector_sorted_by.
+    :param secondary_key: Key function to order items of equal key,
+     such as by timestamp. It must be picklable.
+    :param fan_in: Max number of runs to merge at once.
+    :type fan_in: int
+    :returns: generator of the sorted items.
+    """
+    if secondary_key is not None:
+        key = secondary_sort_key(key, secondary_key)
+    runs = merge_runs_down(i_sorted_runs(iterable, key=key,
+                                         max_in_memory=max_in_memory,
+                                         tmp_dir=tmp_dir, sorter=sorter),
+                           key=key, fan_in=fan_in, tmp_dir=tmp_dir)
+    return merge(*runs, key=key)
+
+
+def sort_iterables(iterables, key=None, max_in_memory=None, tmp_dir=None,
+                   sorter=sorted_by, secondary_key=None,
+                   fan_in=MERGE_FAN_IN):
+    """
+    Sort each of the iterables by key.
+
+    When max_in_memory is given, the iterables are sorted externally:
+    each is sorted in chunks of at most max_in_memory items and the
+    result is a list of sorted runs spilled to temporary files,
+    merged down to at most fan_in runs, see merge_runs_down.
+    The number of runs may differ from the number of iterables,
+    but merging them gives the same result.
+
+    :param iterables: An iterable of iterables.
+    :param key: Sort key function.
+    :param max_in_memory: Max number of items to sort in memory at once.
+    :type max_in_memory: int
+    :param tmp_dir: Directory for the run files, defaults to the system
+     temporary directory.
+    :param sorter: Function that takes key and items and returns
+     a sorted list. Use vector_sorted_by to sort numeric or
+     string keys with numpy.
+    :param secondary_key: Key function to order items of equal key,
+     such as by timestamp.
+    :param fan_in: Max number of spilled runs to return.
+    :type fan_in: int
+    :returns: `list` of sorted iterables.
+    """
     assert key is not None
-    sorted_by_key = partial(sorted_by, key)
+    if secondary_key is not None:
+        key = secondary_sort_key(key, secondary_key)
+    if max_in_memory is not None:
+        return merge_runs_down(chain.from_iterable(
+            i_sorted_runs(iterable, key=key,
+                          max_in_memory=max_in_memory,
+                          tmp_dir=tmp_dir, sorter=sorter)
+            for iterable in iterables), key=key, fan_in=fan_in,
+            tmp_dir=tmp_dir)
+    sorted_by_key = partial(sorter, key)
     return list(map(sorted_by_key, iterables))
 
 
-def i_merge_group_sorted(iterables, key=None):
+def collect_group(values, max_group_size=None, tmp_dir=None):
+    """
+    Collect the values of a group.
+
+    Groups of up to max_group_size values are collected
+    into a list, larger groups are spilled to a temporary file.
+
+    :param values: An iterable of the values of a group.
+    :param max_group_size: Max number of values to keep in memory.
+    :type max_group_size: int
+    :param tmp_dir: Directory for spilled groups, defaults to the system
+     temporary directory.
+    :returns: `list` or `karld.spill.SpilledItems` of the values.
+    """
+    if max_group_size is None:
+        return list(values)
+    values = iter(values)
+    head = list(islice(values, max_group_size + 1))
+    if len(head) <= max_group_size:
+        return head
+    return spill(chain(head, values), dir=tmp_dir)
+
+
+class GroupIterator(object):
+    """
+    Single pass iterator of the values of a group, read straight
+    from the merge stream, so a group of any size takes no memory.
+
+    The values must be read before the next group is taken from
+    the stream, and can't be iterated again once exhausted. To read
+    them more than once, call reiterable before reading any, which
+    collects them, to a temporary file if there are more than
+    max_group_size.
+
+    :param values: Iterator of the values of the group.
+    :param max_group_size: Max number of values to keep in memory
+     when made reiterable, defaults to spilling every group.
+    :type max_group_size: int
+    :param tmp_dir: Directory for spilled groups, defaults to the system
+     temporary directory.
+    """
+    def __init__(self, values, max_group_size=None, tmp_dir=None):
+        self._values = iter(values)
+        self._max_group_size = max_group_size
+        self._tmp_dir = tmp_dir
+        self._started = False
+        self._exhausted = False
+        self._expired = False
+        self._collected = None
+
+    def __iter__(self):
+        if self._collected is not None:
+            return iter(self._collected)
+        if self._exhausted:
+            raise RuntimeError("The values of a group can only be iterated "
+                               "once, call reiterable before iterating "
+                               "to read them again.")
+        return self
+
+    def __next__(self):
+        if self._expired and not self._exhausted:
+            raise RuntimeError("The merge has moved past this group, read "
+                               "its values before taking the next group.")
+        self._started = True
+        try:
+            return next(self._values)
+        except StopIteration:
+            self._exhausted = True
+            raise
+
+    next = __next__
+
+    def expire(self):
+        """
+        Mark the group as passed by the merge stream.
+        """
+        self._expired = True
+
+    def reiterable(self):
+        """
+        Collect the values so they can be iterated any number of times.
+
+        :returns: `list` or `karld.spill.SpilledItems` of the values.
+        """
+        if self._collected is None:
+            if self._started:
+                raise RuntimeError("Can't make a group reiterable after "
+                                   "iterating it.")
+            if self._expired:
+                raise RuntimeError("The merge has moved past this group.")
+            self._collected = collect_group(self._values,
+                                            max_group_size=(
+                                                self._max_group_size or 0),
+                                            tmp_dir=self._tmp_dir)
+        return self._collected
+
+
+def i_lazy_groups(grouped, max_group_size=None, tmp_dir=None):
+    """
+    Generator of the key value and a GroupIterator of the values
+    of each group, expiring each group when the next is taken.
+
+    :param grouped: An iterable of key values and iterators of
+     their values, such as from `itertools.groupby`.
+    """
+    group = None
+    for key_value, values in grouped:
+        if group is not None:
+            group.expire()
+        group = GroupIterator(values, max_group_size=max_group_size,
+                              tmp_dir=tmp_dir)
+        yield key_value, group
+    if group is not None:
+        group.expire()
+
+
+def i_decorate(key, iterable):
+    """
+    Generator of (key value, item) pairs, calling key once per item.
+
+    :param key: Key function.
+    :param iterable: An iterable of items.
+    """
+    for value in iterable:
+        yield key(value), value
+
+
+def i_merge_group_sorted(iterables, key=None, max_group_size=None,
+                         tmp_dir=None, value=None, lazy=False,
+                         secondary_key=None):
+    """
+    Merge sorted iterables and group the items by key,
+    yielding the groups as the merge produces them.
+
+    :param iterables: An iterable of iterables sorted by key.
+    :param key: Key function.
+    :param max_group_size: Max number of values of a group to keep in
+     memory, larger groups are spilled to disk. Defaults to no limit.
+    :type max_group_size: int
+    :param tmp_dir: Directory for spilled groups, defaults to the system
+     temporary directory.
+    :param value: Optional function applied to each item
+     as it's collected into its group.
+    :param lazy: Yield each group's items as a single pass
+     GroupIterator read from the merge, rather than collecting them,
+     so one huge group doesn't take memory. Read them before taking
+     the next group, or call reiterable on it first to read them
+     more than once.
+    :type lazy: bool
+    :param secondary_key: Key function the iterables are also sorted
+     by within equal keys, see secondary_sort_key. The merge keeps
+     that order, so each group's items come out ordered by it.
+    :yields: tuples of the key value and a sized iterable of its items,
+     or a GroupIterator if lazy.
+    """
     assert key is not None
-    all_sorted = merge(*iterables, key=key)
+    if secondary_key is None:
+        all_sorted = merge(*iterables, key=key)
+    else:
+        all_sorted = merge(*iterables,
+                           key=secondary_sort_key(key, secondary_key))
     grouped = groupby(all_sorted, key=key)
-    grouped_voters = ((key_value, list(grouped))
+    if value is not None:
+        grouped = ((key_value, imap(value, items))
+                   for key_value, items in grouped)
+    if lazy:
+        return i_lazy_groups(grouped, max_group_size=max_group_size,
+                             tmp_dir=tmp_dir)
+    grouped_voters = ((key_value, collect_group(grouped,
+                                                max_group_size=max_group_size,
+                                                tmp_dir=tmp_dir))
                       for key_value, grouped in grouped)
     return grouped_voters
 
 
-def sort_merge_group(iterables, key=None):
+def i_sort_merge_group(iterables, key=None, max_in_memory=None,
+                       max_group_size=None, tmp_dir=None, decorate=False,
+                       lazy=False, secondary_key=None):
+    """
+    Sort, merge and group the items of the iterables by key, lazily.
+
+    Groups are yielded as the merge produces them. With max_in_memory
+    and max_group_size, memory is bounded no matter how large the
+    iterables are.
+
+    :param iterables: An iterable of iterables.
+    :param key: Key function.
+    :param max_in_memory: Max number of items to sort in memory at once.
+    :type max_in_memory: int
+    :param max_group_size: Max number of values of a group to keep in
+     memory, larger groups are spilled to disk.
+    :type max_group_size: int
+    :param tmp_dir: Directory for spilled runs and groups, defaults
+     to the system temporary directory.
+    :param decorate: Compute the key of each item only once and carry
+     it with the item through the sort, merge and group, rather than
+     calling key in each phase. Use this when key is expensive.
+     The groups are the same either way.
+    :type decorate: bool
+    :param lazy: Yield each group's items as a single pass
+     GroupIterator, see i_merge_group_sorted.
+    :type lazy: bool
+    :param secondary_key: Key function to order the items of each
+     group by, such as by timestamp. Items are sorted and merged by
+     key and secondary_key together, so groups come out ordered
+     without sorting each one. It must be picklable to sort
+     externally.
+    :yields: tuples of the key value and a sized iterable of its items,
+     or a GroupIterator if lazy.
+    """
     assert key is not None
-    return list(i_merge_group_sorted(
-        sort_iterables(iterables, key=key),
-        key=key))
+    if decorate:
+        if secondary_key is None:
+            group_key, group_secondary_key = decorated_key, None
+        else:
+            key = secondary_sort_key(key, secondary_key)
+            group_key = decorated_primary_key
+            group_secondary_key = decorated_secondary_key
+        return i_merge_group_sorted(
+            sort_iterables((i_decorate(key, iterable)
+                            for iterable in iterables),
+                           key=decorated_key,
+                           max_in_memory=max_in_memory, tmp_dir=tmp_dir),
+            key=group_key,
+            max_group_size=max_group_size,
+            tmp_dir=tmp_dir,
+            value=decorated_value,
+            lazy=lazy,
+            secondary_key=group_secondary_key)
+    return i_merge_group_sorted(
+        sort_iterables(iterables, key=key,
+                       max_in_memory=max_in_memory, tmp_dir=tmp_dir,
+                       secondary_key=secondary_key),
+        key=key,
+        max_group_size=max_group_size,
+        tmp_dir=tmp_dir,
+        lazy=lazy,
+        secondary_key=secondary_key)
+
+
+def sort_merge_group(iterables, key=None, max_in_memory=None, tmp_dir=None,
+                     decorate=False, secondary_key=None):
+    assert key is not None
+    return list(i_sort_merge_group(iterables, key=key,
+                                   max_in_memory=max_in_memory,
+                                   tmp_dir=tmp_dir,
+                                   decorate=decorate,
+                                   secondary_key=secondary_key))
 
 
 def get_first_if_any(values):
@@ -107,7 +684,160 @@ def get_first_type_instance_of_group(instance_type, group):
         logging.exception("couldn't unpack {0}".format(group))
 
 
-def i_get_multi_groups(iterables, key=None):
+def i_get_multi_groups(iterables, key=None, max_in_memory=None,
+                       max_group_size=None, tmp_dir=None, decorate=False):
+    """
+    Lazily yield the groups of items that share a key
+    with at least one other item.
+
+    :param iterables: An iterable of iterables.
+    :param key: Key function.
+    :param max_in_memory: Max number of items to sort in memory at once.
+    :type max_in_memory: int
+    :param max_group_size: Max number of values of a group to keep in
+     memory, larger groups are spilled to disk.
+    :type max_group_size: int
+    :param tmp_dir: Directory for spilled runs and groups, defaults
+     to the system temporary directory.
+    :param decorate: Compute the key of each item only once.
+    :type decorate: bool
+    """
     assert key is not None
     return ifilter(lambda v: len(v[1]) > 1,
-                   sort_merge_group(iterables, key=key))
+                   i_sort_merge_group(iterables, key=key,
+                                      max_in_memory=max_in_memory,
+                                      max_group_size=max_group_size,
+                                      tmp_dir=tmp_dir,
+                                      decorate=decorate))
+
+
+def combine_by_key(key, reducer, items, value=None):
+    """
+    Reduce the values of items that share a key, in memory.
+
+    This is a map side combiner: run it over each batch of
+    items before they are sorted, so that only one pair per key
+    per batch is sorted, spilled and merged. It may be given
+    to a pool runner, such as
+    `partial(combine_by_key, itemgetter(0), operator.add)`.
+
+    :param key: Key function, the key values must be hashable.
+    :param reducer: Function of two values that returns one value.
+     It must be associative, as values are reduced in parts.
+    :param items: An iterable of items.
+    :param value: Function to get the value to reduce from an item,
+     defaults to the item itself.
+    :returns: `list` of tuples of a key value and its reduced value.
+    """
+    combined = {}
+    for item in items:
+        key_value = key(item)
+        item_value = item if value is None else value(item)
+        if key_value in combined:
+            combined[key_value] = reducer(combined[key_value], item_value)
+        else:
+            combined[key_value] = item_value
+    return list(combined.items())
+
+
+def i_combine_batches(key, reducer, iterable, value=None,
+                      batch_size=COMBINE_BATCH_SIZE):
+    """
+    Generator of key value and combined value pairs, combining the
+    iterable a batch of batch_size items at a time.
+    See combine_by_key.
+    """
+    for batch in i_batch(batch_size, iterable):
+        for pair in combine_by_key(key, reducer, batch, value=value):
+            yield pair
+
+
+def i_reduce_sorted(reducer, pairs):
+    """
+    Generator reducing the values of key value and value pairs,
+    sorted by key value, to one pair per key value.
+
+    :param reducer: Function of two values that returns one value.
+    :param pairs: An iterable of key value and value pairs,
+     sorted by key value.
+    """
+    for key_value, group in groupby(pairs, key=decorated_key):
+        yield key_value, reduce(reducer, imap(decorated_value, group))
+
+
+def i_recombine(reducer, hot_keys, reduced):
+    """
+    Generator of key value and reduced value pairs, combining the
+    partial reductions of hot keys that were spread over several
+    partitions, such as by `karld.partition.skew_partitioner`.
+
+    Pairs of other keys are passed through as they come, the pairs
+    of the hot keys follow them.
+
+    :param reducer: Function of two values that returns one value,
+     the one the partitions were reduced with.
+    :param hot_keys: Collection of the key values that were spread.
+    :param reduced: An iterable of iterables of key value and
+     reduced value pairs, one per partition.
+    """
+    hot_values = {}
+    for key_value, value in chain.from_iterable(reduced):
+        if key_value not in hot_keys:
+            yield key_value, value
+        elif key_value in hot_values:
+            hot_values[key_value] = reducer(hot_values[key_value], value)
+        else:
+            hot_values[key_value] = value
+    for pair in hot_values.items():
+        yield pair
+
+
+def reduce_by_key(iterables, key=None, reducer=None, value=None,
+                  combine=True, batch_size=COMBINE_BATCH_SIZE,
+                  max_in_memory=None, tmp_dir=None):
+    """
+    Reduce the values of the items of iterables that share a key
+    to one value per key, streaming the result in key order.
+
+    With combine, the values are first pre-aggregated per batch
+    of each iterable with combine_by_key, so only one pair per
+    key per batch goes through the sort and merge.
+
+    To reduce the results of `combine_by_key` run in a pool,
+    use `key=decorated_key, value=decorated_value`.
+
+    :param iterables: An iterable of iterables.
+    :param key: Key function.
+    :param reducer: Function of two values that returns one value.
+     It must be associative when combining.
+    :param value: Function to get the value to reduce from an item,
+     defaults to the item itself.
+    :param combine: Whether to combine each batch before sorting.
+    :type combine: bool
+    :param batch_size: Number of items to combine at a time.
+    :type batch_size: int
+    :param max_in_memory: Max number of pairs to sort in memory at once,
+     see sort_iterables.
+    :type max_in_memory: int
+    :param tmp_dir: Directory for spilled runs, defaults to the system
+     temporary directory.
+    :returns: generator of tuples of a key value and its reduced value.
+    """
+    assert key is not None
+    assert reducer is not None
+    if combine:
+        pairs_iterables = (i_combine_batches(key, reducer, iterable,
+                                             value=value,
+                                             batch_size=batch_size)
+                           for iterable in iterables)
+    elif value is None:
+        pairs_iterables = (i_decorate(key, iterable)
+                           for iterable in iterables)
+    else:
+        pairs_iterables = (((key(item), value(item)) for item in iterable)
+                           for iterable in iterables)
+
+    sorted_pairs = sort_iterables(pairs_iterables, key=decorated_key,
+                                  max_in_memory=max_in_memory,
+                                  tmp_dir=tmp_dir)
+    return i_reduce_sorted(reducer, merge(*sorted_pairs, key=decorated_key))
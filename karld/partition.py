@@ -0,0 +1,442 @@
+"""
+Partitioners route items to one of a number of partitions,
+such as the partition files of
+`karld.loadump.split_file_output_partitioned_csv`.
+
+A partitioner is a callable that takes an item and returns the
+index of its partition. Items that share a key always go to the same
+partition, so each partition can be sorted, merged, grouped and
+reduced independently, on its own core.
+"""
+from bisect import bisect_right
+from collections import Counter
+from functools import partial
+import hashlib
+import random
+import struct
+import zlib
+
+from karld import is_py3
+
+if is_py3():
+    unicode = str
+    long = int
+
+_INTEGRAL_TYPES = (int, long)
+
+HOT_KEY_FRACTION = 0.01
+SKETCH_WIDTH = 2048
+SKETCH_DEPTH = 4
+HOT_KEY_MIN_COUNT = 1000
+
+__all__ = ['CountMinSketch',
+           'HotKeyDetector',
+           'HotKeyPartitioner',
+           'hash_partition',
+           'hash_partitioner',
+           'hash_positions',
+           'hot_keys_from_sample',
+           'range_partition',
+           'range_partitioner',
+           'reservoir_sample',
+           'salted_hash_partition',
+           'skew_partition',
+           'skew_partitioner',
+           'split_points',
+           'stable_hash',
+           'value_bytes']
+
+
+def value_bytes(value):
+    """
+    Get bytes that identify a value, for hashing.
+
+    Values are normalized so equal values get the same bytes, across
+    types and across python 2 and 3. Text is utf-8 encoded, ints,
+    bools and integral floats are formatted as decimal ints, so
+    1, 1.0 and True are the same, and tuples and lists are made of
+    the bytes of their items. Other values use their repr, which is
+    only stable where the repr is.
+
+    :param value: bytes, a unicode string, a number, a tuple or list
+     of those, or a value with a stable repr.
+    :returns: bytes
+    """
+    if isinstance(value, bytes):
+        return value
+    elif isinstance(value, unicode):
+        return value.encode('utf-8')
+    elif isinstance(value, _INTEGRAL_TYPES):
+        return ('%d' % value).encode('ascii')
+    elif isinstance(value, float):
+        if value.is_integer():
+            return ('%d' % value).encode('ascii')
+        return repr(value).encode('ascii')
+    elif isinstance(value, (tuple, list)):
+        # Length prefix each item, so ('a,', 'b') and ('a', ',b')
+        # differ.
+        parts = [value_bytes(item) for item in value]
+        return b'(' + b''.join(
+            ('%d:' % len(part)).encode('ascii') + part
+            for part in parts) + b')'
+    return repr(value).encode('utf-8')
+
+
+def stable_hash(value):
+    """
+    Hash a value the same way in every process.
+
+    The builtin hash of strings is randomized per process,
+    so it can't be used to partition data that is read or
+    written by multiple processes. Values are hashed by their
+    value_bytes, so equal keys of different types, such as 1 and
+    1.0, or str and unicode on python 2, hash the same, and so
+    do keys on python 2 and 3.
+
+    :param value: bytes, a unicode string, a number, a tuple or list
+     of those, or a value with a stable repr.
+    :returns: `int` from 0 to 2**32 - 1
+    """
+    return zlib.crc32(value_bytes(value)) & 0xffffffff
+
+
+def hash_partition(key, partitions, item):
+    """
+    Get the partition of the item by the hash of its key.
+
+    :param key: Key function.
+    :param partitions: Number of partitions.
+    :type partitions: int
+    :param item: The item to partition.
+    :returns: `int` index of the partition.
+    """
+    return stable_hash(key(item)) % partitions
+
+
+def salted_hash_partition(key, partitions, salt, item):
+    """
+    Get the partition of the item by the hash of its key and a salt.
+
+    Re-partitioning a partition with a different salt spreads its
+    keys across the new partitions.
+
+    :param key: Key function.
+    :param partitions: Number of partitions.
+    :type partitions: int
+    :param salt: Value hashed with the key.
+    :param item: The item to partition.
+    :returns: `int` index of the partition.
+    """
+    return stable_hash((salt, key(item))) % partitions
+
+
+def hash_partitioner(key, partitions, salt=None):
+    """
+    Create a partitioner that routes items by the hash of their key.
+
+    :param key: Key function.
+    :param partitions: Number of partitions.
+    :type partitions: int
+    :param salt: Optional value to hash with the key.
+    :returns: picklable callable that takes an item and returns the
+     index of its partition.
+    """
+    if salt is None:
+        return partial(hash_partition, key, partitions)
+    return partial(salted_hash_partition, key, partitions, salt)
+
+
+def reservoir_sample(size, iterable, rand=None):
+    """
+    Uniformly sample up to size items of an iterable in one pass,
+    holding no more than size items in memory.
+
+    :param size: Number of items to sample.
+    :type size: int
+    :param iterable: An iterable of items.
+    :param rand: `random.Random` instance, for repeatable samples.
+    :returns: `list` of the sampled items.
+    """
+    if rand is None:
+        rand = random
+    sample = []
+    for index, item in enumerate(iterable):
+        if index < size:
+            sample.append(item)
+        else:
+            replace_at = rand.randint(0, index)
+            if replace_at < size:
+                sample[replace_at] = item
+    return sample
+
+
+def split_points(keys, partitions):
+    """
+    Choose the keys that split a sample of keys into
+    partitions of about equal size.
+
+    :param keys: A sample of key values.
+    :param partitions: Number of partitions.
+    :type partitions: int
+    :returns: sorted `list` of partitions - 1 key values.
+    """
+    ordered = sorted(keys)
+    if not ordered:
+        return []
+    return [ordered[len(ordered) * index // partitions]
+            for index in range(1, partitions)]
+
+
+def range_partition(key, points, item):
+    """
+    Get the partition of the item by the range its key falls in.
+
+    :param key: Key function.
+    :param points: sorted `list` of split points, from split_points.
+    :param item: The item to partition.
+    :returns: `int` index of the partition.
+    """
+    return bisect_right(points, key(item))
+
+
+def range_partitioner(key, points):
+    """
+    Create a partitioner that routes items by ranges of their key,
+    so every key in a partition sorts before every key in the next.
+
+    :param key: Key function.
+    :param points: sorted `list` of split points, from split_points.
+    :returns: picklable callable that takes an item and returns the
+     index of its partition.
+    """
+    return partial(range_partition, key, list(points))
+
+
+def hash_positions(value, count, size):
+    """
+    Get count positions from 0 to size - 1 for a value, the same in
+    every process, by double hashing its md5 digest.
+
+    :param value: bytes, a unicode string, or a value with a stable repr.
+    :param count: Number of positions.
+    :type count: int
+    :param size: Number of possible positions.
+    :type size: int
+    :returns: `list` of `int` positions.
+    """
+    digest = hashlib.md5(value_bytes(value)).digest()
+    first, second = struct.unpack('<QQ', digest)
+    return [(first + index * second) % size for index in range(count)]
+
+
+class CountMinSketch(object):
+    """
+    Estimate how many times each value was added, in a fixed
+    amount of memory. Estimates are never too low, and are too
+    high by at most a small fraction of the total count.
+
+    Sketches of the same size can be combined with update, so
+    each worker can count its own batches.
+
+    :param width: Number of counters per row, more lowers the error.
+    :type width: int
+    :param depth: Number of rows, more lowers the chance of an error.
+    :type depth: int
+    """
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        assert width > 0 and depth > 0
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._counts = [0] * (width * depth)
+
+    def _cells(self, value):
+        width = self.width
+        return [row * width + position
+                for row, position
+                in enumerate(hash_positions(value, self.depth, width))]
+
+    def add(self, value, count=1):
+        """
+        Count a value.
+
+        :returns: The estimated count of the value after adding it.
+        """
+        counts = self._counts
+        estimate = None
+        for cell in self._cells(value):
+            counts[cell] += count
+            if estimate is None or counts[cell] < estimate:
+                estimate = counts[cell]
+        self.total += count
+        return estimate
+
+    def estimate(self, value):
+        """
+        :returns: The estimated count of the value.
+        """
+        counts = self._counts
+        return min(counts[cell] for cell in self._cells(value))
+
+    def update(self, other):
+        """
+        Add the counts of another sketch of the same size.
+        """
+        assert (self.width, self.depth) == (other.width, other.depth)
+        self._counts = [count + other_count for count, other_count
+                        in zip(self._counts, other._counts)]
+        self.total += other.total
+
+
+def hot_keys_from_sample(keys, fraction=HOT_KEY_FRACTION, sample_size=10000,
+                         rand=None):
+    """
+    Find the keys that make up more than a fraction of a uniform
+    sample of the keys.
+
+    :param keys: An iterable of key values.
+    :param fraction: Share of the sample a key must exceed to be hot.
+    :type fraction: float
+    :param sample_size: Number of keys to sample.
+    :type sample_size: int
+    :param rand: `random.Random` instance, for repeatable samples.
+    :returns: `set` of the hot key values.
+    """
+    sample = reservoir_sample(sample_size, keys, rand=rand)
+    threshold = fraction * len(sample)
+    return set(key_value for key_value, count in Counter(sample).items()
+               if count > threshold)
+
+
+class HotKeyDetector(object):
+    """
+    Find the keys that make up more than a fraction of a stream of
+    keys, as it goes, with a CountMinSketch.
+
+    :param fraction: Share of the keys so far a key must exceed to be hot.
+    :type fraction: float
+    :param min_count: Number of keys to see before any is hot, so
+     the first few keys aren't mistaken for hot ones.
+    :type min_count: int
+    :param width: Width of the sketch.
+    :type width: int
+    :param depth: Depth of the sketch.
+    :type depth: int
+    """
+    def __init__(self, fraction=HOT_KEY_FRACTION, min_count=HOT_KEY_MIN_COUNT,
+                 width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        assert 0 < fraction < 1
+        self.fraction = fraction
+        self.min_count = min_count
+        self.sketch = CountMinSketch(width=width, depth=depth)
+        self.hot_keys = set()
+
+    def add(self, key_value):
+        """
+        Count a key.
+
+        :returns: Whether the key is hot.
+        """
+        if key_value in self.hot_keys:
+            self.sketch.total += 1
+            return True
+        estimate = self.sketch.add(key_value)
+        total = self.sketch.total
+        if total >= self.min_count and estimate > self.fraction * total:
+            self.hot_keys.add(key_value)
+            return True
+        return False
+
+
+def _spread_index(counters, key_value, spread):
+    """
+    Get the next of spread offsets of a key, round robin, so even
+    identical items of the key are spread evenly.
+    """
+    count = counters.get(key_value, 0)
+    counters[key_value] = count + 1
+    return count % spread
+
+
+def skew_partition(key, partitions, hot_keys, spread, counters, item):
+    """
+    Get the partition of the item by the hash of its key, spreading
+    the items of hot keys round robin over spread partitions.
+
+    :param key: Key function.
+    :param partitions: Number of partitions.
+    :type partitions: int
+    :param hot_keys: Collection of the hot key values.
+    :param spread: Number of partitions to spread each hot key over.
+    :type spread: int
+    :param counters: `dict` of the number of items of each hot key
+     partitioned so far, updated.
+    :param item: The item to partition.
+    :returns: `int` index of the partition.
+    """
+    key_value = key(item)
+    index = stable_hash(key_value)
+    if key_value in hot_keys:
+        index += _spread_index(counters, key_value, spread)
+    return index % partitions
+
+
+def skew_partitioner(key, partitions, hot_keys, spread=None):
+    """
+    Create a partitioner that routes items by the hash of their key,
+    except the items of hot keys, which are spread over several
+    partitions so one key doesn't leave one worker with most of the
+    work. The partial results of the hot keys must be recombined,
+    such as with `karld.merger.i_recombine`.
+
+    :param key: Key function.
+    :param partitions: Number of partitions.
+    :type partitions: int
+    :param hot_keys: Collection of the hot key values, such as from
+     hot_keys_from_sample.
+    :param spread: Number of partitions to spread each hot key over,
+     defaults to all of them.
+    :type spread: int
+    :returns: picklable callable that takes an item and returns the
+     index of its partition.
+    """
+    return partial(skew_partition, key, partitions, frozenset(hot_keys),
+                   spread or partitions, {})
+
+
+class HotKeyPartitioner(object):
+    """
+    A partitioner that finds hot keys while partitioning, with a
+    HotKeyDetector, and spreads the items of a key over spread
+    partitions from when it is found to be hot, like skew_partitioner.
+
+    Items of a key seen before it was hot are in its hash partition,
+    so the partial results of every key in hot_keys after partitioning
+    must be recombined, such as with `karld.merger.i_recombine`.
+
+    :param key: Key function.
+    :param partitions: Number of partitions.
+    :type partitions: int
+    :param spread: Number of partitions to spread each hot key over,
+     defaults to all of them.
+    :type spread: int
+    :param detector: HotKeyDetector, defaults to one with the default
+     fraction.
+    """
+    def __init__(self, key, partitions, spread=None, detector=None):
+        self.key = key
+        self.partitions = partitions
+        self.spread = spread or partitions
+        self.detector = detector or HotKeyDetector()
+        self._counters = {}
+
+    @property
+    def hot_keys(self):
+        return self.detector.hot_keys
+
+    def __call__(self, item):
+        key_value = self.key(item)
+        index = stable_hash(key_value)
+        if self.detector.add(key_value):
+            index += _spread_index(self._counters, key_value, self.spread)
+        return index % self.partitions
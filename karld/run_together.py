@@ -9,16 +9,47 @@ except ImportError:
     imap = map
     ifilter = filter
 
+import logging
 import os
+import shutil
+import tempfile
+import time
 
 from iter_karld_tools import i_batch
 from iter_karld_tools import yield_nth_of
 
+from karld.loadump import FILE_BUFFER_SIZE
+from karld.loadump import csv_record_ranges
 from karld.loadump import ensure_dir
+from karld.loadump import file_byte_ranges
+from karld.loadump import file_line_ranges
 from karld.loadump import i_get_csv_data
+from karld.loadump import i_get_csv_range_data
 from karld.loadump import i_walk_dir_for_filepaths_names
 from karld.loadump import i_read_buffered_binary_file
+from karld.loadump import i_read_line_range
+from karld.loadump import scan_csv_range
+from karld.loadump import split_file_output_partitioned_csv
 from karld.loadump import write_as_csv
+from karld.join import INNER
+from karld.join import i_hash_join
+from karld.merger import MAX_IN_MEMORY
+from karld.merger import external_sort
+from karld.merger import i_recombine
+from karld.merger import merge
+from karld.merger import reduce_by_key
+from karld.merger import sorted_by
+from karld.partition import HotKeyDetector
+from karld.partition import HotKeyPartitioner
+from karld.partition import hash_partitioner
+from karld.partition import range_partitioner
+from karld.partition import reservoir_sample
+from karld.partition import split_points
+from karld.spill import i_read_run_file
+from karld.spill import write_run_file
+
+# Smallest buffer of each input of a merge, however many there are.
+MIN_MERGE_BUFFER_SIZE = 65536
 
 
 def csv_file_consumer(csv_rows_consumer, file_path_name):
@@ -148,7 +179,9 @@ def distribute_run_to_runners(items_func, in_url, reader=None, batch_size=1100):
     for the items function.
 
     :param items_func: Callable that takes multiple items of the data.
-    :param reader: URL reader callable.
+    :param reader: URL reader callable, defaults to reading lines
+     with i_read_buffered_binary_file. Use
+     `karld.loadump.i_read_mapped_file` for large local files.
     :param in_url: Url of content
     :param batch_size: size of batches.
     """
@@ -164,6 +197,158 @@ def distribute_run_to_runners(items_func, in_url, reader=None, batch_size=1100):
         return list(pool.map(items_func, batches))
 
 
+def run_line_range(items_func, range_reader, byte_range):
+    """
+    Read the lines of a byte range of a file and pass them to
+    items_func, in a worker.
+
+    :param items_func: Callable that takes an iterator of the lines.
+    :param range_reader: Callable that takes the file path, start
+     and end offsets and returns the lines of the range.
+    :param byte_range: tuple of the file path, start and end offsets.
+    :returns: The result of items_func.
+    """
+    return items_func(range_reader(*byte_range))
+
+
+def distribute_ranges_to_runners(items_func, in_path, ranges=None,
+                                 range_reader=None, max_workers=None):
+    """
+    With a multi-process pool, map line aligned byte ranges of a
+    file to an items processing function.
+
+    Unlike distribute_run_to_runners, the parent doesn't read the
+    file. It only sends the path and the offsets of each range to a
+    worker, which reads the lines of its range itself, so the work
+    of the parent and the data sent to workers don't grow with the
+    size of the file.
+
+    :param items_func: Callable that takes an iterator of the lines
+     of a range. It must be picklable.
+    :param in_path: Path to the file.
+    :param ranges: Number of ranges to divide the file into, defaults
+     to four times the number of cpus.
+    :type ranges: int
+    :param range_reader: Callable that takes the file path, start and
+     end offsets and returns the lines of the range, defaults to
+     `karld.loadump.i_read_line_range`. It must be picklable.
+    :param max_workers: Max number of worker processes, defaults
+     to the number of cpus.
+    :type max_workers: int
+    :returns: `list` of the results of items_func, in file order.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import cpu_count
+
+    if ranges is None:
+        ranges = cpu_count() * 4
+    if not range_reader:
+        range_reader = i_read_line_range
+
+    byte_ranges = file_line_ranges(in_path, ranges)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(partial(run_line_range, items_func,
+                                     range_reader),
+                             byte_ranges))
+
+
+def csv_file_record_ranges(in_path, ranges=None, quotechar='"',
+                           max_workers=None):
+    """
+    Divide a csv file, which may have newlines in quoted fields, into
+    byte ranges of whole records, scanning the file in parallel.
+
+    The file is cut into equal byte ranges, then a multi-process pool
+    counts the quote characters of each range and finds where its
+    first record ends both if it starts inside and outside a quoted
+    field. The counts of the ranges before each range tell which, so
+    each cut is moved to the end of a record.
+    See `karld.loadump.csv_record_ranges`.
+
+    :param in_path: Path to the csv file.
+    :param ranges: Number of ranges, defaults to four times the
+     number of cpus.
+    :type ranges: int
+    :param quotechar: The quote character of the csv dialect.
+    :param max_workers: Max number of worker processes, defaults
+     to the number of cpus.
+    :type max_workers: int
+    :returns: `list` of tuples of the file path, start and end offsets.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import cpu_count
+
+    if ranges is None:
+        ranges = cpu_count() * 4
+
+    byte_ranges = file_byte_ranges(in_path, ranges)
+    scan = partial(scan_csv_range, quotechar=quotechar.encode('ascii'))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        scans = list(pool.map(scan, byte_ranges))
+    return csv_record_ranges(byte_ranges, scans)
+
+
+def run_csv_range(items_func, csv_kwargs, byte_range):
+    """
+    Read the csv rows of a byte range of a file in strict mode and
+    pass them to items_func, in a worker.
+
+    :returns: The result of items_func.
+    """
+    return items_func(i_get_csv_range_data(*byte_range, strict=True,
+                                           **csv_kwargs))
+
+
+def distribute_csv_ranges_to_runners(items_func, in_path, ranges=None,
+                                     max_workers=None, csv_kwargs=None,
+                                     batch_size=1100):
+    """
+    With a multi-process pool, map ranges of the rows of a csv file,
+    which may have newlines in quoted fields, to an items processing
+    function, each worker parsing its own range.
+
+    The ranges are found with csv_file_record_ranges. Workers parse
+    their range with the csv reader in strict mode, which fails on a
+    range that starts or ends inside a quoted field. If any range
+    fails, such as when quote characters appear in unquoted fields
+    and throw off the boundaries, the results are discarded and the
+    file is read serially, mapping batches of batch_size rows to
+    items_func instead.
+
+    :param items_func: Callable that takes an iterator of csv rows.
+     It must be picklable.
+    :param in_path: Path to the csv file.
+    :param ranges: Number of ranges, defaults to four times the
+     number of cpus.
+    :type ranges: int
+    :param max_workers: Max number of worker processes, defaults
+     to the number of cpus.
+    :type max_workers: int
+    :param csv_kwargs: Arguments for the csv reader, such as delimiter.
+    :type csv_kwargs: dict
+    :param batch_size: Number of rows per batch when read serially.
+    :type batch_size: int
+    :returns: `list` of the results of items_func, in file order.
+    """
+    import csv
+    from concurrent.futures import ProcessPoolExecutor
+
+    csv_kwargs = csv_kwargs or {}
+    record_ranges = csv_file_record_ranges(
+        in_path, ranges=ranges, quotechar=csv_kwargs.get('quotechar', '"'),
+        max_workers=max_workers)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        try:
+            return list(pool.map(partial(run_csv_range, items_func,
+                                         csv_kwargs),
+                                 record_ranges))
+        except csv.Error:
+            logging.warning("{0} couldn't be split into csv records, "
+                            "reading it serially".format(in_path))
+        batches = i_batch(batch_size, i_get_csv_data(in_path, **csv_kwargs))
+        return list(pool.map(items_func, batches))
+
+
 def distribute_multi_run_to_runners(items_func, in_dir,
                                     reader=None,
                                     walker=None,
@@ -251,3 +436,443 @@ def serial_run_files_to_files(file_to_file, in_dir, filter_func=None):
         results_final = results
 
     return list(map(file_to_file, results_final))
+
+
+def merge_files_to_run_file(key, reader, merger, out_path, in_paths):
+    """
+    Merge the sorted files at in_paths into one sorted run file.
+
+    :param key: Sort key function, it must be picklable.
+    :param reader: Callable that takes a path and returns an iterator
+     of its items.
+    :param merger: Merge function, such as `karld.merger.merge`.
+    :param out_path: Path of the run file to write.
+    :param in_paths: Paths of the sorted input files.
+    :returns: out_path
+    """
+    return write_run_file(
+        merger(*[reader(in_path) for in_path in in_paths], key=key),
+        out_path)
+
+
+def i_merge_tree(in_paths, key=None, reader=None, fan_in=64,
+                 max_workers=None, tmp_dir=None, merger=merge):
+    """
+    Merge a large number of sorted files in a tree of merges.
+
+    Groups of fan_in files are merged into intermediate run files
+    with a multi-process pool, level by level, until no more than
+    fan_in runs remain, which are then merged into the
+    returned stream. Each merge holds at most fan_in files open, so
+    no more than fan_in * max_workers files are open at once.
+
+    The merge is stable, items with equal keys come out in the order
+    of the in_paths they came from.
+
+    :param in_paths: Paths of files, each sorted by key.
+    :param key: Sort key function, it must be picklable, so use
+     a module level function or `operator.itemgetter`, not a lambda.
+    :param reader: Callable that takes a path and returns an iterator
+     of its items, defaults to `karld.loadump.i_get_csv_data`. It must
+     be picklable.
+    :param fan_in: Max number of files merged together.
+    :type fan_in: int
+    :param max_workers: Max number of worker processes, defaults
+     to the number of cpus.
+    :type max_workers: int
+    :param tmp_dir: Directory for the intermediate run files, defaults
+     to the system temporary directory.
+    :param merger: Merge function, such as `karld.merger.merge`
+     or `karld.merger.block_merge`.
+    :yields: The merged items.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    assert key is not None
+    assert fan_in > 1
+
+    if not reader:
+        reader = i_get_csv_data
+
+    paths = list(in_paths)
+    work_dir = tempfile.mkdtemp(dir=tmp_dir)
+    try:
+        level = 0
+        level_reader = reader
+        if len(paths) > fan_in:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                while len(paths) > fan_in:
+                    groups = list(i_batch(fan_in, paths))
+                    out_paths = [
+                        os.path.join(work_dir,
+                                     "{0}_{1}.run".format(level, index))
+                        for index in range(len(groups))]
+                    merge_level = partial(merge_files_to_run_file,
+                                          key, level_reader, merger)
+                    merged_paths = list(pool.map(merge_level,
+                                                 out_paths, groups))
+                    if level:
+                        for path in paths:
+                            os.remove(path)
+                    paths = merged_paths
+                    level_reader = i_read_run_file
+                    level += 1
+
+        for item in merger(*[level_reader(path) for path in paths], key=key):
+            yield item
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def sort_csv_file(key, max_in_memory, out_path, in_path):
+    """
+    Sort the rows of a csv file into another csv file.
+
+    :param key: Sort key function.
+    :param max_in_memory: Max number of rows to sort in memory at once,
+     or None to sort the file in memory.
+    :param out_path: Path of the sorted output file.
+    :param in_path: Path of the input csv file.
+    :returns: out_path
+    """
+    rows = i_get_csv_data(in_path)
+    if max_in_memory is None:
+        sorted_rows = sorted_by(key, rows)
+    else:
+        sorted_rows = external_sort(rows, key=key,
+                                    max_in_memory=max_in_memory)
+    write_as_csv(sorted_rows, out_path)
+    return out_path
+
+
+def range_sort_csv_files(in_paths, key, out_dir, name, partitions=None,
+                         sample_size=10000, max_in_memory=None,
+                         max_workers=None, tmp_dir=None):
+    """
+    Totally order the rows of csv files into range partitioned,
+    sorted, csv files, sorting the partitions in parallel.
+
+    A first pass samples the keys to choose split points so the
+    partitions are about equal size. A second pass writes each
+    row to the partition of its key range. Then each partition is
+    sorted by a multi-process pool. Every key in a partition sorts
+    before every key of the next, so reading the output files in
+    order, such as with `itertools.chain`, gives all the rows in order.
+
+    :param in_paths: Paths of the input csv files.
+    :param key: Sort key function, it must be picklable.
+    :param out_dir: Directory to write the sorted partitions.
+    :param name: Each sorted partition will use this in its name.
+    :param partitions: Number of partitions, defaults to the
+     number of cpus.
+    :type partitions: int
+    :param sample_size: Number of keys to sample.
+    :type sample_size: int
+    :param max_in_memory: Max number of rows to sort in memory at once,
+     per worker, see `karld.merger.external_sort`.
+    :type max_in_memory: int
+    :param max_workers: Max number of worker processes, defaults
+     to the number of cpus.
+    :type max_workers: int
+    :param tmp_dir: Directory for the unsorted partitions, defaults to
+     the system temporary directory.
+    :returns: `list` of the paths of the sorted partitions, in order.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import cpu_count
+
+    in_paths = list(in_paths)
+    if partitions is None:
+        partitions = cpu_count()
+
+    sample = reservoir_sample(
+        sample_size,
+        imap(key, chain.from_iterable(imap(i_get_csv_data, in_paths))))
+    partitioner = range_partitioner(key, split_points(sample, partitions))
+
+    ensure_dir(out_dir)
+    work_dir = tempfile.mkdtemp(dir=tmp_dir)
+    try:
+        partition_paths = split_file_output_partitioned_csv(
+            name, chain.from_iterable(imap(i_get_csv_data, in_paths)),
+            partitions, out_dir=work_dir, partitioner=partitioner)
+        out_paths = [os.path.join(out_dir, os.path.basename(path))
+                     for path in partition_paths]
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(partial(sort_csv_file, key, max_in_memory),
+                                 out_paths, partition_paths))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _i_counted(stats, items):
+    """
+    Generator of the items, counting them in stats['rows'].
+    """
+    for item in items:
+        stats['rows'] += 1
+        yield item
+
+
+def merge_sorted_csv_files(in_paths, key, out_path,
+                           buffering=FILE_BUFFER_SIZE, line_buffer_size=None,
+                           merger=merge, csv_kwargs=None):
+    """
+    Merge csv files, each sorted by key, into one sorted csv file.
+
+    The buffering bytes are a budget split evenly between the
+    inputs, so buffers don't grow with the number of files, down to
+    MIN_MERGE_BUFFER_SIZE each. The output is written in batches of
+    line_buffer_size rows, so a merge makes few, large, reads and
+    writes. Rows with equal keys come out in the order of the
+    in_paths they came from.
+
+    ::
+
+        >>> stats = merge_sorted_csv_files(i_walk_csv_paths('shards'),
+        ...                                itemgetter(1), 'merged.csv')
+        >>> stats['rows_per_second']
+
+    :param in_paths: Paths of the input csv files, each sorted by key.
+    :param key: Sort key function, such as `itemgetter(1)`.
+    :param out_path: Path of the merged csv file.
+    :param buffering: Number of bytes to buffer all the input
+     files together, and to buffer the output file.
+    :type buffering: int
+    :param line_buffer_size: Number of rows to write at a time,
+     see `karld.loadump.write_as_csv`.
+    :type line_buffer_size: int
+    :param merger: Merge function, such as `karld.merger.merge`
+     or `karld.merger.block_merge` for many files.
+    :param csv_kwargs: Extra keyword arguments for the csv reader,
+     such as delimiter.
+    :type csv_kwargs: dict
+    :returns: `dict` of the number of rows merged, the seconds
+     it took, and the rows per second.
+    """
+    assert key is not None
+    in_paths = list(in_paths)
+    in_buffering = max(MIN_MERGE_BUFFER_SIZE,
+                       buffering // max(len(in_paths), 1))
+    reader_kwargs = dict(csv_kwargs or {}, buffering=in_buffering)
+    stats = dict(rows=0)
+
+    start = time.time()
+    merged = merger(*[i_get_csv_data(in_path, **reader_kwargs)
+                      for in_path in in_paths], key=key)
+    write_as_csv(_i_counted(stats, merged), out_path,
+                 line_buffer_size=line_buffer_size, buffering=buffering)
+    seconds = time.time() - start
+
+    stats['seconds'] = seconds
+    stats['rows_per_second'] = stats['rows'] / seconds if seconds else 0.0
+    logging.info("merged {0} rows of {1} files into {2} in {3:.2f}s, "
+                 "{4:.0f} rows/s".format(stats['rows'], len(in_paths),
+                                         out_path, seconds,
+                                         stats['rows_per_second']))
+    return stats
+
+
+def reduce_csv_file(key, reducer, value, max_in_memory, in_path):
+    """
+    Reduce the rows of a csv file by key, see `karld.merger.reduce_by_key`.
+
+    :returns: `list` of tuples of a key value and its reduced value.
+    """
+    return list(reduce_by_key([i_get_csv_data(in_path)], key=key,
+                              reducer=reducer, value=value,
+                              max_in_memory=max_in_memory))
+
+
+def reduce_csv_files_by_key(in_paths, key, reducer, value=None,
+                            partitions=None, hot_fraction=0.01,
+                            max_in_memory=None, max_workers=None,
+                            tmp_dir=None):
+    """
+    Reduce the rows of csv files that share a key to one value per
+    key, reducing hash partitions of the rows in parallel.
+
+    While partitioning, keys with more than hot_fraction of the rows
+    so far are found with a count-min sketch, and the rest of their
+    rows are spread over all the partitions, so a dominant key
+    doesn't leave one worker with most of the rows. The partial
+    results of the hot keys are then recombined in the parent.
+
+    :param in_paths: Paths of the input csv files.
+    :param key: Key function, it must be picklable.
+    :param reducer: Function of two values that returns one value.
+     It must be associative and commutative, and picklable.
+    :param value: Function to get the value to reduce from a row,
+     defaults to the row itself. It must be picklable.
+    :param partitions: Number of partitions, defaults to the
+     number of cpus.
+    :type partitions: int
+    :param hot_fraction: Share of the rows a key must exceed to be
+     spread over the partitions.
+    :type hot_fraction: float
+    :param max_in_memory: Max number of pairs to sort in memory at once,
+     per worker, see `karld.merger.reduce_by_key`.
+    :type max_in_memory: int
+    :param max_workers: Max number of worker processes, defaults
+     to the number of cpus.
+    :type max_workers: int
+    :param tmp_dir: Directory for the partitions, defaults to the
+     system temporary directory.
+    :returns: `list` of tuples of a key value and its reduced value,
+     in no particular order.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import cpu_count
+
+    assert key is not None
+    assert reducer is not None
+    if partitions is None:
+        partitions = cpu_count()
+
+    partitioner = HotKeyPartitioner(
+        key, partitions, detector=HotKeyDetector(fraction=hot_fraction))
+
+    work_dir = tempfile.mkdtemp(dir=tmp_dir)
+    try:
+        partition_paths = split_file_output_partitioned_csv(
+            'partition.csv',
+            chain.from_iterable(imap(i_get_csv_data, in_paths)),
+            partitions, out_dir=work_dir, partitioner=partitioner)
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            reduced = list(pool.map(
+                partial(reduce_csv_file, key, reducer, value, max_in_memory),
+                partition_paths))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return list(i_recombine(reducer, partitioner.hot_keys, reduced))
+
+
+def csv_files_width(paths):
+    """
+    Get the number of columns of the first row of csv files.
+
+    :param paths: Paths of csv files.
+    :returns: `int` number of columns, 0 if the files have no rows.
+    """
+    for path in paths:
+        for row in i_get_csv_data(path):
+            return len(row)
+    return 0
+
+
+def concat_joined_rows(left_width, right_width, left_row, right_row):
+    """
+    Combine a left and right csv row into one row, a missing row
+    of a left or outer join is filled with empty fields, its side's
+    width, so the columns line up.
+    """
+    if left_row is None:
+        left_row = [''] * left_width
+    if right_row is None:
+        right_row = [''] * right_width
+    return list(left_row) + list(right_row)
+
+
+def hash_join_csv_files_to_file(left_key, right_key, how, max_in_memory,
+                                left_width, right_width,
+                                out_path, left_path, right_path):
+    """
+    Hash join two csv files into a csv file of the concatenated
+    left and right rows, see concat_joined_rows.
+
+    :returns: out_path
+    """
+    joined = i_hash_join(i_get_csv_data(left_path),
+                         i_get_csv_data(right_path),
+                         how=how, left_key=left_key, right_key=right_key,
+                         max_in_memory=max_in_memory)
+    write_as_csv((concat_joined_rows(left_width, right_width,
+                                     left_row, right_row)
+                  for _, (left_row, right_row) in joined), out_path)
+    return out_path
+
+
+def hash_join_csv_files(left_paths, right_paths, out_dir, name, key=None,
+                        how=INNER, left_key=None, right_key=None,
+                        partitions=None, max_in_memory=MAX_IN_MEMORY,
+                        max_workers=None, tmp_dir=None, left_width=None,
+                        right_width=None):
+    """
+    Join unsorted csv files in parallel with a grace hash join.
+
+    The rows of both sides are hash partitioned by key to csv files,
+    then a multi-process pool joins each pair of partitions with
+    `karld.join.i_hash_join`, which spills to disk if the right side
+    of a partition is larger than max_in_memory. Each output row is
+    the left row followed by the right row. In left and outer joins,
+    a missing row is filled with empty fields, as many as its side
+    has columns.
+
+    :param left_paths: Paths of the left csv files.
+    :param right_paths: Paths of the right csv files, the smaller side.
+    :param out_dir: Directory to write the joined partitions.
+    :param name: Each joined partition will use this in its name.
+    :param key: Key function, used for both sides. It must be picklable.
+    :param how: `karld.join.INNER`, `LEFT` or `OUTER`.
+    :param left_key: Key function for the left rows, instead of key.
+    :param right_key: Key function for the right rows, instead of key.
+    :param partitions: Number of partitions, defaults to the
+     number of cpus.
+    :type partitions: int
+    :param max_in_memory: Max number of right rows per worker
+     to hold in memory.
+    :type max_in_memory: int
+    :param max_workers: Max number of worker processes, defaults
+     to the number of cpus.
+    :type max_workers: int
+    :param tmp_dir: Directory for the partitions, defaults to the
+     system temporary directory.
+    :param left_width: Number of columns of the left rows, defaults
+     to the number of columns of the first left row.
+    :type left_width: int
+    :param right_width: Number of columns of the right rows, defaults
+     to the number of columns of the first right row.
+    :type right_width: int
+    :returns: `list` of the paths of the joined partitions.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import cpu_count
+
+    left_key = left_key or key
+    right_key = right_key or key
+    assert left_key is not None and right_key is not None
+    if partitions is None:
+        partitions = cpu_count()
+    left_paths = list(left_paths)
+    right_paths = list(right_paths)
+    if left_width is None:
+        left_width = csv_files_width(left_paths)
+    if right_width is None:
+        right_width = csv_files_width(right_paths)
+
+    ensure_dir(out_dir)
+    work_dir = tempfile.mkdtemp(dir=tmp_dir)
+    try:
+        side_paths = []
+        for side, paths, side_key in (('left', left_paths, left_key),
+                                      ('right', right_paths, right_key)):
+            side_dir = os.path.join(work_dir, side)
+            ensure_dir(side_dir)
+            side_paths.append(split_file_output_partitioned_csv(
+                name, chain.from_iterable(imap(i_get_csv_data, paths)),
+                partitions, out_dir=side_dir,
+                partitioner=hash_partitioner(side_key, partitions)))
+
+        out_paths = [os.path.join(out_dir, os.path.basename(path))
+                     for path in side_paths[0]]
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(
+                partial(hash_join_csv_files_to_file, left_key, right_key,
+                        how, max_in_memory, left_width, right_width),
+                out_paths, side_paths[0], side_paths[1]))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
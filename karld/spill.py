@@ -0,0 +1,270 @@
+"""
+Spill iterables of python objects to disk and stream them back.
+
+Items are pickled in chunks, so reading a spilled run back only ever
+holds one chunk of it in memory. This is what lets sorting and grouping
+work within a memory budget instead of needing all the data in RAM.
+"""
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from itertools import chain
+import os
+import tempfile
+
+from iter_karld_tools import i_batch
+
+from karld.loadump import FILE_BUFFER_SIZE
+from karld.partition import hash_partitioner
+
+CHUNK_SIZE = 1000
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+SPILL_SUFFIX = '.spill'
+SPILL_PARTITIONS = 16
+# Partitions still too large after this many rounds of partitioning
+# are processed in memory anyway, they likely hold one very common key.
+MAX_PARTITION_DEPTH = 3
+
+__all__ = ['SpilledItems',
+           'can_partition',
+           'i_partitioned',
+           'i_read_run',
+           'i_read_run_file',
+           'spill',
+           'spill_partitioned',
+           'write_run',
+           'write_run_file']
+
+
+def write_run(items, stream, chunk_size=CHUNK_SIZE):
+    """
+    Pickle items to a binary stream in chunks.
+
+    :param items: An iterable of picklable items.
+    :param stream: A file like object opened for binary writing.
+    :param chunk_size: Number of items to pickle together.
+    :type chunk_size: int
+    :returns: Number of items written.
+    """
+    count = 0
+    for chunk in i_batch(chunk_size, items):
+        pickle.dump(chunk, stream, PICKLE_PROTOCOL)
+        count += len(chunk)
+    return count
+
+
+def i_read_run(stream):
+    """
+    Generator of the items pickled to a stream with write_run.
+
+    :param stream: A file like object opened for binary reading.
+    """
+    load = pickle.load
+    while True:
+        try:
+            chunk = load(stream)
+        except EOFError:
+            return
+        for item in chunk:
+            yield item
+
+
+def write_run_file(items, file_name, chunk_size=CHUNK_SIZE,
+                   buffering=FILE_BUFFER_SIZE):
+    """
+    Write items to a run file.
+
+    :param items: An iterable of picklable items.
+    :param file_name: path to the output file.
+    :param chunk_size: Number of items to pickle together.
+    :type chunk_size: int
+    :param buffering: number of bytes to buffer files
+    :type buffering: int
+    :returns: the file_name, so it can be used as a pool result.
+    """
+    with open(file_name, 'wb', buffering) as run_file:
+        write_run(items, run_file, chunk_size=chunk_size)
+    return file_name
+
+
+def i_read_run_file(file_name, buffering=FILE_BUFFER_SIZE):
+    """
+    Generator of the items of a run file written with write_run_file.
+
+    :param file_name: path to the run file.
+    :param buffering: number of bytes to buffer files
+    :type buffering: int
+    """
+    with open(file_name, 'rb', buffering) as run_file:
+        for item in i_read_run(run_file):
+            yield item
+
+
+class SpilledItems(object):
+    """
+    A sized, re-iterable sequence of items kept in a temporary file.
+    The file is removed when this is closed or garbage collected.
+
+    The file is only open while items are appended or iterated, so
+    any number of spilled items can be kept, such as the runs of an
+    external sort, without holding a file descriptor each. Each
+    iteration opens the file on its own, so multiple iterations
+    may be interleaved.
+    """
+    def __init__(self, items=(), chunk_size=CHUNK_SIZE, dir=None):
+        fd, self.path = tempfile.mkstemp(suffix=SPILL_SUFFIX, dir=dir)
+        os.close(fd)
+        self._chunks = 0
+        self._length = 0
+        self.chunk_size = chunk_size
+        self.extend(items)
+
+    def extend(self, items):
+        """
+        Append items to the end of the spilled items.
+
+        :param items: An iterable of picklable items.
+        """
+        chunks = i_batch(self.chunk_size, items)
+        first = next(chunks, None)
+        if first is None:
+            return
+        with open(self.path, 'r+b') as run_file:
+            run_file.seek(0, 2)
+            for chunk in chain([first], chunks):
+                pickle.dump(chunk, run_file, PICKLE_PROTOCOL)
+                self._chunks += 1
+                self._length += len(chunk)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        if not self._chunks:
+            return
+        with open(self.path, 'rb') as run_file:
+            load = pickle.load
+            # Chunks are appended one after the other, so they are
+            # read in order, including chunks added while iterating.
+            read = 0
+            while read < self._chunks:
+                for item in load(run_file):
+                    yield item
+                read += 1
+
+    def close(self):
+        """
+        Remove the temporary file.
+        """
+        path, self.path = self.path, None
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def __del__(self):
+        if getattr(self, 'path', None) is not None:
+            self.close()
+
+
+def spill(items, chunk_size=CHUNK_SIZE, dir=None):
+    """
+    Spill items to a temporary file.
+
+    :param items: An iterable of picklable items.
+    :param chunk_size: Number of items to pickle together.
+    :type chunk_size: int
+    :param dir: Directory for the temporary file, defaults
+     to the system temporary directory.
+    :returns: `SpilledItems` of the items.
+    """
+    return SpilledItems(items, chunk_size=chunk_size, dir=dir)
+
+
+def spill_partitioned(items, partitioner, partitions, chunk_size=CHUNK_SIZE,
+                      dir=None):
+    """
+    Spill items to a temporary file for each partition.
+
+    At most chunk_size items per partition are buffered in memory.
+
+    :param items: An iterable of picklable items.
+    :param partitioner: Callable that takes an item and returns the
+     index of its partition, see `karld.partition`.
+    :param partitions: Number of partitions.
+    :type partitions: int
+    :param chunk_size: Number of items to pickle together.
+    :type chunk_size: int
+    :param dir: Directory for the temporary files, defaults
+     to the system temporary directory.
+    :returns: `list` of `SpilledItems` of each partition.
+    """
+    spilled = [SpilledItems(chunk_size=chunk_size, dir=dir)
+               for _ in range(partitions)]
+    buffers = [[] for _ in range(partitions)]
+    for item in items:
+        index = partitioner(item)
+        buffer = buffers[index]
+        buffer.append(item)
+        if len(buffer) >= chunk_size:
+            spilled[index].extend(buffer)
+            buffers[index] = []
+    for index, buffer in enumerate(buffers):
+        spilled[index].extend(buffer)
+    return spilled
+
+
+def can_partition(depth):
+    """
+    Whether items partitioned depth times may be partitioned again,
+    see i_partitioned.
+
+    :param depth: How many times the items have been partitioned.
+    :type depth: int
+    """
+    return depth < MAX_PARTITION_DEPTH
+
+
+def i_partitioned(streams, keys, finish, partitions=SPILL_PARTITIONS,
+                  depth=0, dir=None):
+    """
+    Hash partition streams that don't fit in memory to temporary
+    files, then finish them a partition at a time.
+
+    Each stream is partitioned by the hash of its key, salted with
+    depth, so items with equal keys land in the same partition of
+    every stream, and a partition partitioned again is split
+    differently. Streams are spilled in order, one after the other.
+
+    ::
+
+        >>> def finish(depth, left_part, right_part):
+        ...     return join(left_part, right_part, depth=depth)
+        >>> i_partitioned([left, right], [key, key], finish, depth=depth)
+
+    :param streams: Sequence of iterables of picklable items.
+    :param keys: Sequence of a key function for each stream.
+    :param finish: Callable that takes the depth of the partitions,
+     then a partition of each stream, and returns an iterable of
+     results. It may partition further if can_partition(depth).
+    :param partitions: Number of partitions to spill to.
+    :type partitions: int
+    :param depth: How many times the items have been partitioned.
+    :type depth: int
+    :param dir: Directory for the temporary files, defaults
+     to the system temporary directory.
+    :yields: the results of finish for each partition in turn.
+    """
+    assert len(streams) == len(keys)
+    spilled = [spill_partitioned(stream,
+                                 hash_partitioner(key, partitions,
+                                                  salt=depth),
+                                 partitions, dir=dir)
+               for stream, key in zip(streams, keys)]
+    del streams
+
+    for parts in zip(*spilled):
+        for result in finish(depth + 1, *parts):
+            yield result
+        for part in parts:
+            part.close()
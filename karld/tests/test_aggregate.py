@@ -0,0 +1,117 @@
+from operator import itemgetter
+import random
+import unittest
+
+from nose.plugins.attrib import attr
+
+from karld.aggregate import COUNT
+from karld.aggregate import MAX
+from karld.aggregate import MEAN
+from karld.aggregate import MIN
+from karld.aggregate import SUM
+from karld.aggregate import aggregate_states
+from karld.aggregate import i_hash_aggregate
+from karld.aggregate import i_merge_states
+from karld.aggregate import merge_top_k
+from karld.aggregate import merge_top_k_by_key
+from karld.aggregate import top_k
+from karld.aggregate import top_k_by_key
+
+
+class TestTopK(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(11)
+        self.rows = [(u'account{0}'.format(rnd.randint(0, 9)),
+                      rnd.randint(0, 1000), index)
+                     for index in range(500)]
+        self.amount = itemgetter(1)
+
+    def test_top_k_of_batches(self):
+        """
+        Ensure merging the top k of each batch gives
+        the top k of all the rows.
+        """
+        partials = [top_k(5, self.rows[start:start + 100], key=self.amount)
+                    for start in range(0, 500, 100)]
+
+        self.assertEqual(
+            sorted(self.rows, key=self.amount, reverse=True)[:5],
+            merge_top_k(5, partials, key=self.amount))
+
+    def test_top_k_by_key(self):
+        """
+        Ensure the top k of each key are kept, largest first, and
+        merging batches gives the same result as all the rows at once.
+        """
+        expected = {}
+        for row in sorted(self.rows, key=self.amount, reverse=True):
+            group = expected.setdefault(row[0], [])
+            if len(group) < 3:
+                group.append(row)
+
+        whole = top_k_by_key(3, self.rows, itemgetter(0), key=self.amount)
+        self.assertEqual(expected, whole)
+
+        partials = [top_k_by_key(3, self.rows[start:start + 100],
+                                 itemgetter(0), key=self.amount)
+                    for start in range(0, 500, 100)]
+        self.assertEqual(expected, merge_top_k_by_key(3, partials,
+                                                      key=self.amount))
+
+
+class TestHashAggregate(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(5)
+        self.rows = [(u'account{0}'.format(rnd.randint(0, 49)),
+                      rnd.randint(0, 1000))
+                     for _ in range(2000)]
+        self.aggregations = [(COUNT, None),
+                             (SUM, itemgetter(1)),
+                             (MIN, itemgetter(1)),
+                             (MAX, itemgetter(1)),
+                             (MEAN, itemgetter(1))]
+        expected = {}
+        for account, amount in self.rows:
+            expected.setdefault(account, []).append(amount)
+        self.expected = dict(
+            (account, (len(amounts), sum(amounts), min(amounts),
+                       max(amounts), sum(amounts) / float(len(amounts))))
+            for account, amounts in expected.items())
+
+    def test_hash_aggregate(self):
+        """
+        Ensure each aggregate of each key is computed.
+        """
+        self.assertEqual(self.expected,
+                         dict(i_hash_aggregate(self.rows, itemgetter(0),
+                                               self.aggregations)))
+
+    @attr('integration')
+    def test_hash_aggregate_spills(self):
+        """
+        Ensure the aggregates are the same when there are more keys
+        than max_in_memory and the states are partitioned to disk.
+        """
+        results = list(i_hash_aggregate(self.rows, itemgetter(0),
+                                        self.aggregations, max_in_memory=8,
+                                        partitions=3))
+
+        self.assertEqual(len(self.expected), len(results))
+        self.assertEqual(self.expected, dict(results))
+
+    @attr('integration')
+    def test_merge_states_of_batches(self):
+        """
+        Ensure the states of batches, as aggregated in pool workers,
+        merge into the aggregates of all the items.
+        """
+        partials = [aggregate_states(itemgetter(0), self.aggregations,
+                                     self.rows[start:start + 300])
+                    for start in range(0, len(self.rows), 300)]
+
+        self.assertEqual(self.expected,
+                         dict(i_merge_states(self.aggregations, partials)))
+        self.assertEqual(self.expected,
+                         dict(i_merge_states(self.aggregations, partials,
+                                             max_in_memory=8,
+                                             partitions=3)))
@@ -0,0 +1,127 @@
+from operator import itemgetter
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from nose.plugins.attrib import attr
+
+from karld.compaction import RunStore
+
+
+@attr('integration')
+class TestRunStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        rnd = random.Random(9)
+        # Batches of rows of key, batch number and value.
+        self.batches = [[(rnd.randint(0, 40), batch, rnd.randint(0, 99))
+                         for _ in range(10)]
+                        for batch in range(9)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_runs_merge_by_level(self):
+        """
+        Ensure runs are merged fan_in at a time into larger levels,
+        and reading gives every item sorted, stably.
+        """
+        store = RunStore(self.directory, key=itemgetter(0), fan_in=2,
+                         min_run_size=10)
+        for batch in self.batches:
+            runs = store.add(batch)
+
+        # 9 runs of 10 merge like binary counting: one run of 80
+        # and one of 10.
+        self.assertEqual([80, 10], [run.count for run in runs])
+        self.assertEqual([3, 0], [run.level for run in runs])
+        self.assertEqual(2, len(os.listdir(self.directory)))
+        all_rows = [row for batch in self.batches for row in batch]
+        self.assertEqual(sorted(all_rows, key=itemgetter(0)), list(store))
+
+    def test_dedup_last_write_wins(self):
+        """
+        Ensure with dedup only the last added item of each key is
+        kept, whether or not its runs have been merged.
+        """
+        store = RunStore(self.directory, key=itemgetter(0), fan_in=3,
+                         min_run_size=5, dedup=True)
+        latest = {}
+        for batch in self.batches:
+            store.add(batch)
+            for row in batch:
+                latest[row[0]] = row
+
+            self.assertEqual(sorted(latest.values()), list(store))
+
+    def test_reopen_and_interrupted_merge(self):
+        """
+        Ensure a store reopened on the same directory continues where
+        it left off, ignoring runs left behind by a merge.
+        """
+        store = RunStore(self.directory, key=itemgetter(0), fan_in=2,
+                         min_run_size=10)
+        store.add(self.batches[0])
+        store.add(self.batches[1])
+        merged_run = store.runs()[0]
+        # Put back a run that was merged, as if the merge was
+        # interrupted before removing it.
+        leftover = os.path.join(self.directory, "{0:012d}-{0:012d}_L0_10.run"
+                                .format(merged_run.first))
+        shutil.copy(merged_run.path, leftover)
+
+        reopened = RunStore(self.directory, key=itemgetter(0), fan_in=2,
+                            min_run_size=10)
+        reopened.add(self.batches[2], presorted=False)
+
+        self.assertEqual([(0, 1), (2, 2)],
+                         [(run.first, run.last) for run in reopened.runs()])
+        all_rows = [row for batch in self.batches[:3] for row in batch]
+        self.assertEqual(sorted(all_rows, key=itemgetter(0)),
+                         list(reopened))
+
+    def test_stale_files_removed(self):
+        """
+        Ensure runs covered by a merged run and unfinished temporary
+        runs, left by an interrupted merge, are left alone when the
+        store is opened, and removed by remove_stale and when it
+        compacts.
+        """
+        store = RunStore(self.directory, key=itemgetter(0), fan_in=2,
+                         min_run_size=10)
+        store.add(self.batches[0])
+        store.add(self.batches[1])
+        merged_run = store.runs()[0]
+        # The merge was interrupted after renaming the merged run,
+        # before removing its inputs, and another merge before
+        # renaming its run.
+        covered = [os.path.join(self.directory,
+                                "{0:012d}-{0:012d}_L0_10.run".format(batch))
+                   for batch in (0, 1)]
+        for path in covered:
+            shutil.copy(merged_run.path, path)
+        unfinished = os.path.join(self.directory,
+                                  "000000000000-000000000003.tmp")
+        with open(unfinished, 'wb') as stream:
+            stream.write(b'partial')
+
+        reopened = RunStore(self.directory, key=itemgetter(0), fan_in=2,
+                            min_run_size=10)
+
+        self.assertEqual(4, len(os.listdir(self.directory)))
+        self.assertEqual([merged_run.path],
+                         [run.path for run in reopened.runs()])
+
+        reopened.remove_stale()
+
+        self.assertEqual([os.path.basename(merged_run.path)],
+                         os.listdir(self.directory))
+
+        with open(unfinished, 'wb') as stream:
+            stream.write(b'partial')
+        store.compact()
+
+        self.assertEqual([os.path.basename(merged_run.path)],
+                         os.listdir(self.directory))
@@ -0,0 +1,90 @@
+from operator import itemgetter
+import unittest
+
+from nose.plugins.attrib import attr
+
+from karld.distinct import BloomFilter
+from karld.distinct import distinct_items
+from karld.distinct import i_distinct
+from karld.distinct import i_distinct_approximate
+from karld.distinct import i_distinct_results
+
+
+class TestDistinct(unittest.TestCase):
+    def setUp(self):
+        self.items = [(index % 37, index) for index in range(200)]
+        self.firsts = [(index, index) for index in range(37)]
+
+    def test_in_memory(self):
+        """
+        Ensure the first item of each key is kept, in order.
+        """
+        self.assertEqual(self.firsts,
+                         list(i_distinct(self.items, key=itemgetter(0))))
+        self.assertEqual([3, 1, 2], list(i_distinct([3, 1, 3, 2, 1])))
+
+    @attr('integration')
+    def test_spilled(self):
+        """
+        Ensure the same items are kept when the keys seen
+        don't fit in memory, and the partitions are partitioned again.
+        """
+        distinct = list(i_distinct(self.items, key=itemgetter(0),
+                                   max_in_memory=5, partitions=2))
+
+        self.assertEqual(self.firsts, sorted(distinct))
+        self.assertEqual(self.firsts[:5], distinct[:5])
+
+    def test_across_batches(self):
+        """
+        Ensure duplicates across batches deduplicated in workers
+        are dropped.
+        """
+        results = [distinct_items(self.items[:100], key=itemgetter(0)),
+                   distinct_items(self.items[100:], key=itemgetter(0))]
+
+        self.assertEqual(37, len(results[0]))
+        self.assertEqual(
+            self.firsts,
+            list(i_distinct_results(results, key=itemgetter(0))))
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_added_values_are_found(self):
+        """
+        Ensure values added are always in the filter, and
+        few values not added are reported as in it.
+        """
+        bloom = BloomFilter(1000, error_rate=0.01)
+        self.assertFalse(bloom.add(u'v0'))
+        self.assertTrue(bloom.add(u'v0'))
+        for value in range(1, 1000):
+            bloom.add(u'v{0}'.format(value))
+
+        self.assertTrue(all(u'v{0}'.format(value) in bloom
+                            for value in range(1000)))
+        false_positives = sum(u'w{0}'.format(value) in bloom
+                              for value in range(1000))
+        self.assertTrue(false_positives < 50)
+
+    def test_types_are_distinct(self):
+        """
+        Ensure values that have the same bytes but not the same
+        type are not found as each other.
+        """
+        values = [1, 1.0, True, u'1', b'1', (1, u'a'), (u'1', u'a')]
+        for index, value in enumerate(values):
+            bloom = BloomFilter(100, error_rate=0.001)
+            bloom.add(value)
+            self.assertEqual([index],
+                             [found for found, other in enumerate(values)
+                              if other in bloom])
+
+    def test_approximate_distinct(self):
+        """
+        Ensure every duplicate is dropped.
+        """
+        items = [index % 50 for index in range(500)]
+
+        self.assertEqual(list(range(50)),
+                         list(i_distinct_approximate(items, 100)))
@@ -0,0 +1,134 @@
+from operator import itemgetter
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.plugins.attrib import attr
+
+from karld.join import INNER
+from karld.join import LEFT
+from karld.join import OUTER
+from karld.join import i_hash_join
+from karld.join import i_merge_join
+from karld.join import i_merge_join_dirs
+
+
+class TestMergeJoin(unittest.TestCase):
+    def setUp(self):
+        self.people = [(1, 'John'), (2, 'Sally'), (4, 'Ann')]
+        self.pets = [(1, 'cat'), (1, 'dog'), (3, 'fish')]
+
+    def test_inner(self):
+        """
+        Ensure only keys in both iterables are joined, one row
+        for each pair of items.
+        """
+        self.assertEqual(
+            [(1, ((1, 'John'), (1, 'cat'))), (1, ((1, 'John'), (1, 'dog')))],
+            list(i_merge_join([self.people, self.pets], key=itemgetter(0),
+                              how=INNER)))
+
+    def test_left(self):
+        """
+        Ensure keys of the first iterable are kept, filled
+        where the second is missing them.
+        """
+        self.assertEqual(
+            [(1, ((1, 'John'), (1, 'cat'))), (1, ((1, 'John'), (1, 'dog'))),
+             (2, ((2, 'Sally'), None)), (4, ((4, 'Ann'), None))],
+            list(i_merge_join([self.people, self.pets], key=itemgetter(0),
+                              how=LEFT)))
+
+    def test_outer_with_keys(self):
+        """
+        Ensure outer joins keep keys of any iterable, and each
+        iterable can have its own key.
+        """
+        owners = [('cat', 1), ('fish', 3)]
+        joined = list(i_merge_join([self.people, owners],
+                                   keys=[itemgetter(0), itemgetter(1)],
+                                   how=OUTER, fill=()))
+
+        self.assertEqual([1, 2, 3, 4], [key_value for key_value, _ in joined])
+        self.assertEqual(((), ('fish', 3)), joined[2][1])
+
+    def test_unknown_how(self):
+        self.assertRaises(ValueError, i_merge_join, [[], []],
+                          key=itemgetter(0), how='sideways')
+
+
+def normalized(joined):
+    return sorted(joined, key=repr)
+
+
+class TestHashJoin(unittest.TestCase):
+    def setUp(self):
+        self.left = [(index % 23, 'left{0}'.format(index))
+                     for index in range(100)]
+        self.right = [(index % 31, 'right{0}'.format(index))
+                      for index in range(0, 90, 2)]
+
+    def assert_same_as_merge_join(self, how, **kwargs):
+        expected = i_merge_join([sorted(self.left), sorted(self.right)],
+                                key=itemgetter(0), how=how)
+        joined = i_hash_join(self.left, self.right, key=itemgetter(0),
+                             how=how, **kwargs)
+        self.assertEqual(normalized(expected), normalized(joined))
+
+    def test_in_memory(self):
+        """
+        Ensure the hash join gives the same rows as the
+        merge join, for each type of join.
+        """
+        for how in (INNER, LEFT, OUTER):
+            self.assert_same_as_merge_join(how)
+
+    @attr('integration')
+    def test_spilled_partitions(self):
+        """
+        Ensure the same rows are joined when the right side
+        is larger than max_in_memory, and partitions
+        are partitioned again.
+        """
+        for how in (INNER, LEFT, OUTER):
+            self.assert_same_as_merge_join(how, max_in_memory=3,
+                                           partitions=2)
+
+    def test_unknown_how(self):
+        self.assertRaises(ValueError, i_hash_join, [], [],
+                          key=itemgetter(0), how='sideways')
+
+
+@attr('integration')
+class TestMergeJoinDirs(unittest.TestCase):
+    def setUp(self):
+        from karld.loadump import write_as_csv
+
+        self.root = tempfile.mkdtemp()
+        self.dirs = []
+        shards = {'people': [[['1', 'John'], ['4', 'Ann']], [['2', 'Sally']]],
+                  'pets': [[['1', 'cat'], ['3', 'fish']], [['1', 'dog']]]}
+        for name in ('people', 'pets'):
+            in_dir = os.path.join(self.root, name)
+            os.makedirs(in_dir)
+            for number, rows in enumerate(shards[name]):
+                write_as_csv(rows, os.path.join(in_dir,
+                                                "{0}.csv".format(number)))
+            self.dirs.append(in_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_join_dirs(self):
+        """
+        Ensure the sorted shards of each directory are merged
+        and then joined.
+        """
+        joined = list(i_merge_join_dirs(self.dirs, key=itemgetter(0)))
+
+        self.assertEqual(2, len(joined))
+        self.assertEqual(
+            sorted([(['1', 'John'], ['1', 'cat']),
+                    (['1', 'John'], ['1', 'dog'])]),
+            sorted(rows for _, rows in joined))
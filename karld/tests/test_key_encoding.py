@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from operator import itemgetter
+import random
+import unittest
+
+from karld.key_encoding import decode_key
+from karld.key_encoding import encode_key
+from karld.key_encoding import key_encoder
+
+
+def random_row(rnd):
+    return (rnd.choice([u'', u'a', u'a\x00', u'ab', u'\xf3', u'ż',
+                        u'b', u'a\x00b']),
+            rnd.randint(-2 ** 70, 2 ** 70) // rnd.choice([1, 2 ** 60]),
+            rnd.choice([-1.5, -0.0, 0.0, 1e-300, 2.5, 1e300, -1e300]),
+            rnd.choice([b'', b'\x00', b'\x00\x01', b'\xff', b'a']))
+
+
+class TestKeyEncoding(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(13)
+        self.rows = [random_row(rnd) for _ in range(500)]
+
+    def test_ascending_order(self):
+        """
+        Ensure the encoded keys sort the same as the keys.
+        """
+        self.assertEqual(sorted(self.rows),
+                         sorted(self.rows, key=encode_key))
+
+    def test_descending_columns(self):
+        """
+        Ensure columns marked descending sort in reverse.
+        """
+        encode = key_encoder(itemgetter(1, 0), descending=[0])
+
+        expected = sorted(sorted(self.rows, key=itemgetter(0)),
+                          key=itemgetter(1), reverse=True)
+
+        self.assertEqual([row[:2] for row in expected],
+                         [row[:2] for row in sorted(self.rows, key=encode)])
+
+    def test_round_trip(self):
+        """
+        Ensure decoding gives back the values, with or
+        without descending columns.
+        """
+        for row in self.rows:
+            values = row + (None, True)
+            self.assertEqual(values, decode_key(encode_key(values)))
+            self.assertEqual(values,
+                             decode_key(encode_key(values, [0, 2, 3, 4])))
+
+    def test_unsupported(self):
+        self.assertRaises(TypeError, encode_key, [object()])
@@ -10,17 +10,29 @@ except ImportError:
 
 from operator import itemgetter
 import os
+import shutil
 import tempfile
 import unittest
 
 from mock import patch
 from nose.plugins.attrib import attr
 
+from karld import is_py3
+from karld.loadump import csv_record_ranges
 from karld.loadump import ensure_dir
+from karld.loadump import file_byte_ranges
+from karld.loadump import file_line_ranges
 from karld.loadump import i_get_unicode_lines
+from karld.loadump import i_get_csv_data
+from karld.loadump import i_get_csv_range_data
 from karld.loadump import i_get_json_data
+from karld.loadump import i_read_buffered_binary_file
+from karld.loadump import i_read_line_range
+from karld.loadump import i_read_mapped_blocks
+from karld.loadump import i_read_mapped_file
 from karld.loadump import i_walk_dir_for_filepaths_names
 from karld.loadump import is_file_csv
+from karld.loadump import scan_csv_range
 from karld.merger import sort_merge_group
 
 
@@ -138,6 +150,143 @@ class TestReadJSONLines(unittest.TestCase):
         self.assertEqual({u'last': u'smith', u'first': u'John'}, first)
         self.assertEqual({u'last': u'Jones', u'first': u'Sally'}, second)
 
+    def test_i_get_json_data_mapped(self):
+        """
+        Ensure json lines can be read with the memory mapped reader.
+        """
+        self.assertEqual(
+            list(i_get_json_data(self.input_data_path)),
+            list(i_get_json_data(self.input_data_path,
+                                 reader=i_read_mapped_file)))
+
+
+@attr('integration')
+class TestReadMappedFile(unittest.TestCase):
+    def setUp(self):
+        self.input_data_path = os.path.join(os.path.dirname(__file__),
+                                            "test_data",
+                                            "things_kinds",
+                                            "data_0.csv")
+
+    def test_mapped_lines(self):
+        """
+        Ensure the mapped reader gives the same lines as the buffered
+        reader, whatever the block size.
+        """
+        expected = list(i_read_buffered_binary_file(self.input_data_path))
+
+        for block_size in (1, 7, 1048576):
+            self.assertEqual(expected,
+                             list(i_read_mapped_file(self.input_data_path,
+                                                     block_size=block_size)))
+
+    def test_mapped_memoryviews(self):
+        """
+        Ensure memoryview lines can be held after the reader is done.
+        """
+        expected = list(i_read_buffered_binary_file(self.input_data_path))
+
+        lines = list(i_read_mapped_file(self.input_data_path,
+                                        memoryviews=True))
+
+        self.assertEqual(expected, [line.tobytes() for line in lines])
+
+    def test_mapped_blocks_end_lines(self):
+        """
+        Ensure blocks end at line ends and make up the whole file.
+        """
+        with open(self.input_data_path, 'rb') as stream:
+            data = stream.read()
+
+        blocks = list(i_read_mapped_blocks(self.input_data_path,
+                                           block_size=20))
+
+        self.assertEqual(data, b''.join(blocks))
+        self.assertTrue(all(block.endswith(b'\n') for block in blocks))
+
+    def test_empty_file(self):
+        """
+        Ensure an empty file has no lines.
+        """
+        with tempfile.NamedTemporaryFile() as empty:
+            self.assertEqual([], list(i_read_mapped_file(empty.name)))
+
+
+@attr('integration')
+class TestLineRanges(unittest.TestCase):
+    def setUp(self):
+        self.input_data_path = os.path.join(os.path.dirname(__file__),
+                                            "test_data",
+                                            "things_kinds",
+                                            "data_0.csv")
+        self.lines = list(i_read_buffered_binary_file(self.input_data_path))
+
+    def test_ranges_split_at_lines(self):
+        """
+        Ensure the ranges start at line starts and together
+        read every line once, for any number of ranges.
+        """
+        for ranges in (1, 2, 3, 7, 1000):
+            byte_ranges = file_line_ranges(self.input_data_path, ranges)
+
+            self.assertTrue(len(byte_ranges) <= ranges)
+            range_lines = [list(i_read_line_range(*byte_range))
+                           for byte_range in byte_ranges]
+            self.assertTrue(all(range_lines))
+            self.assertEqual(self.lines, [line for lines in range_lines
+                                          for line in lines])
+
+    def test_range_without_trailing_newline(self):
+        """
+        Ensure the last line is read when the file doesn't end with
+        a newline.
+        """
+        with tempfile.NamedTemporaryFile() as data_file:
+            data_file.write(b'a\nbb\nccc')
+            data_file.flush()
+
+            byte_ranges = file_line_ranges(data_file.name, 2)
+
+            self.assertEqual([b'a\n', b'bb\n', b'ccc'],
+                             [line for byte_range in byte_ranges
+                              for line in i_read_line_range(*byte_range)])
+
+
+@attr('integration')
+class TestCSVRecordRanges(unittest.TestCase):
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.input_data_path = os.path.join(self.out_dir, "multiline.csv")
+        self.rows = [[u'1', u'first line\nsecond "quoted" line', u'x'],
+                     [u'2', u'plain', u'"all quoted"'],
+                     [u'3', u'a\n\nb', u''],
+                     [u'4', u'dr\xf3\u017ck\u0105', u'\n']] * 20
+        from karld.loadump import write_as_csv
+        write_as_csv(self.rows, self.input_data_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_ranges_end_at_records(self):
+        """
+        Ensure ranges moved to record ends read every row once,
+        even where the equal byte ranges cut quoted newlines.
+        """
+        self.assertEqual(self.rows,
+                         list(i_get_csv_data(self.input_data_path)))
+
+        for ranges in (1, 2, 3, 7, 50):
+            byte_ranges = file_byte_ranges(self.input_data_path, ranges)
+            record_ranges = csv_record_ranges(
+                byte_ranges, [scan_csv_range(byte_range)
+                              for byte_range in byte_ranges])
+
+            self.assertEqual(
+                self.rows,
+                [row for record_range in record_ranges
+                 for row in i_get_csv_range_data(*record_range,
+                                                 strict=True)])
+
 
 @attr('integration')
 class TestReadUnicodeLines(unittest.TestCase):
@@ -203,13 +352,12 @@ class TestJsonSplitOut(unittest.TestCase):
                       {'this': 4.3},
                       {"that": "hello\nworld"}]
 
-        loadump.split_file_output_json("outfile.json", data, max_lines=2)
+        ensure_dir(self.out_dir)
+        loadump.split_file_output_json("outfile.json", data,
+                                       out_dir=self.out_dir, max_lines=2)
 
-        if os.path.exists(self.expected_out_0):
-            os.remove(self.expected_out_0)
-
-        if os.path.exists(self.expected_out_1):
-            os.remove(self.expected_out_1)
+        self.assertTrue(os.path.exists(self.expected_out_0))
+        self.assertTrue(os.path.exists(self.expected_out_1))
 
     def tearDown(self):
         if os.path.exists(self.expected_out_0):
@@ -257,6 +405,22 @@ class TestSplitData(unittest.TestCase):
                              b'iron,metal\ndr\xc3\xb3\xc5\xbck\xc4\x85,'
                              b'utf-8 sample\n', data)
 
+    def test_data_splits_mapped(self):
+        """
+        Ensure the file is split the same way read with the memory
+        mapped reader.
+        """
+        from karld.loadump import split_file
+
+        split_file(self.input_data_path, self.out_dir, max_lines=5,
+                   file_reader=i_read_mapped_file)
+
+        with open(self.expected_out_0, 'rb') as stream:
+            data = stream.read()
+            self.assertEqual(b'mushroom,fungus\ntomato,fruit\ntopaz,mineral\n'
+                             b'iron,metal\ndr\xc3\xb3\xc5\xbck\xc4\x85,'
+                             b'utf-8 sample\n', data)
+
     def test_default_out_dir(self):
         """
         Ensure default output directory is the same as the directory
@@ -303,6 +467,221 @@ class TestSplitData(unittest.TestCase):
             os.remove(self.expected_out_1)
 
 
+@attr('integration')
+class TestSplitFileBlocks(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lines = [b'x' * (i % 7 * 300) + b'\n' for i in range(100)]
+
+    def write_file(self, data):
+        file_path = os.path.join(self.tmp_dir, "lines.txt")
+        with open(file_path, 'wb') as stream:
+            stream.write(data)
+        return file_path
+
+    def assert_same_shards(self, file_path, max_lines, block_size):
+        from karld.loadump import split_file
+        from karld.loadump import split_file_blocks
+
+        lines_dir = os.path.join(self.tmp_dir, "lines")
+        blocks_dir = os.path.join(self.tmp_dir, "blocks")
+        split_file(file_path, lines_dir, max_lines=max_lines)
+        shard_paths = split_file_blocks(file_path, blocks_dir,
+                                        max_lines=max_lines,
+                                        block_size=block_size)
+
+        self.assertEqual(sorted(os.listdir(lines_dir)),
+                         sorted(os.listdir(blocks_dir)))
+        self.assertEqual(sorted(shard_paths),
+                         sorted(os.path.join(blocks_dir, name)
+                                for name in os.listdir(blocks_dir)))
+        for name in os.listdir(lines_dir):
+            with open(os.path.join(lines_dir, name), 'rb') as stream:
+                expected = stream.read()
+            with open(os.path.join(blocks_dir, name), 'rb') as stream:
+                self.assertEqual(expected, stream.read())
+        shutil.rmtree(lines_dir)
+        shutil.rmtree(blocks_dir)
+
+    def test_shards_same_as_split_file(self):
+        """
+        Ensure the shards are byte identical to the shards of
+        split_file, with cuts inside and across blocks.
+        """
+        file_path = self.write_file(b''.join(self.lines))
+        for max_lines in (1, 3, 10, 100, 1000):
+            for block_size in (5, 1000, 1 << 20):
+                self.assert_same_shards(file_path, max_lines, block_size)
+
+    def test_without_trailing_newline(self):
+        """
+        Ensure a last line without a newline ends the last shard.
+        """
+        file_path = self.write_file(b''.join(self.lines) + b'end')
+        for max_lines in (1, 10, 100):
+            self.assert_same_shards(file_path, max_lines, 1000)
+
+    def test_split_offsets(self):
+        """
+        Ensure the offsets cut after every max_lines lines.
+        """
+        from karld.loadump import file_line_split_offsets
+
+        file_path = self.write_file(b'a\nbb\nccc\nd')
+        self.assertEqual([0, 5, 10], file_line_split_offsets(file_path, 2))
+        self.assertEqual([0, 2, 5, 9, 10],
+                         file_line_split_offsets(file_path, 1, block_size=3))
+
+    def test_empty_file(self):
+        """
+        Ensure an empty file makes no shards.
+        """
+        from karld.loadump import split_file_blocks
+
+        file_path = self.write_file(b'')
+        self.assertEqual([], split_file_blocks(
+            file_path, os.path.join(self.tmp_dir, "out")))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+@attr('integration')
+class TestSplitCSVFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, "rows.csv")
+
+    def write_file(self, data):
+        with open(self.file_path, 'wb') as stream:
+            stream.write(data)
+
+    def read_shards(self, out_dir):
+        shards = {}
+        for name in os.listdir(out_dir):
+            with open(os.path.join(out_dir, name), 'rb') as stream:
+                shards[name] = stream.read()
+        return shards
+
+    def split_rows(self, max_lines):
+        """
+        Split the file reading and writing its rows.
+        """
+        from karld.loadump import csv_reader
+        from karld.loadump import split_file
+        from karld.loadump import split_file_output_csv
+
+        out_dir = os.path.join(self.tmp_dir, "rows")
+        split_file(self.file_path, out_dir, max_lines=max_lines,
+                   line_reader=csv_reader,
+                   split_file_writer=split_file_output_csv,
+                   read_binary=not is_py3())
+        shards = self.read_shards(out_dir)
+        shutil.rmtree(out_dir)
+        return shards
+
+    def split_csv(self, max_lines, **kwargs):
+        from karld.loadump import split_csv_file
+
+        out_dir = os.path.join(self.tmp_dir, "csv")
+        split_csv_file(self.file_path, out_dir, max_lines=max_lines,
+                       **kwargs)
+        shards = self.read_shards(out_dir)
+        shutil.rmtree(out_dir)
+        return shards
+
+    def test_line_endings(self):
+        """
+        Ensure only files without quotes and with consistent
+        line endings are split by lines.
+        """
+        from karld.loadump import csv_file_line_ending
+
+        for data, line_ending in ((b'a,b\nc,d', b'\n'),
+                                  (b'a,b\r\n\r\nc,d\r\n', b'\r\n'),
+                                  (b'a,b\r\nc,d\n', None),
+                                  (b'a,b\rc,d\r', None),
+                                  (b'a,"b\nc",d\n', None)):
+            self.write_file(data)
+            self.assertEqual(line_ending,
+                             csv_file_line_ending(self.file_path))
+        self.write_file(b'a,b\r\nc,d\r\n')
+        self.assertEqual(b'\r\n', csv_file_line_ending(self.file_path,
+                                                        block_size=4))
+
+    def test_same_shards_as_rows(self):
+        """
+        Ensure the shards of files split by lines are byte identical
+        to the shards of reading and writing their rows.
+        """
+        for data in (b'a,b\nc,d\n\n,\ne, f \n',
+                     b'a,b\nc,d\n\n,\ne, f ',
+                     b'a,b\r\nc,d\r\n\r\n,\r\ne, f ',
+                     b'dr\xc3\xb3\xc5\xbck\xc4\x85,x\nb,c\n'):
+            self.write_file(data)
+            for max_lines in (1, 2, 10):
+                self.assertEqual(self.split_rows(max_lines),
+                                 self.split_csv(max_lines))
+
+    def test_quoted_newlines(self):
+        """
+        Ensure a file with quotes is split by its rows.
+        """
+        self.write_file(b'a,"b\nc"\nd,e\n')
+        shards = self.split_csv(1)
+        self.assertEqual(self.split_rows(1), shards)
+        self.assertEqual(b'a,"b\nc"\r\n', shards["0_rows.csv"])
+
+    def test_hint_without_quoted_newlines(self):
+        """
+        Ensure the shards of a file hinted to have no quoted newlines
+        are byte identical to those of reading and writing its rows,
+        for shards with and without quotes.
+        """
+        for data in (b'a,"b"\nc,d\ne,f\ng,"h,i"\r\n',
+                     b'a,b\r\nc,d\r\ne,f\n',
+                     b'a,b\nc,""\ne,f'):
+            self.write_file(data)
+            for max_lines in (1, 2, 10):
+                self.assertEqual(
+                    self.split_rows(max_lines),
+                    self.split_csv(max_lines, quoted_newlines=False))
+
+    def test_hint_with_bare_carriage_returns(self):
+        """
+        Ensure a file with carriage returns not followed by a
+        newline, which end rows read with universal newlines, is
+        split the same with and without the hint.
+        """
+        for data in (b'ba\rb\nc,"d"\ne,f\n',
+                     b'\n,a\r\r\r\n"b",c\n'):
+            self.write_file(data)
+            for max_lines in (1, 2, 10):
+                self.assertEqual(
+                    self.split_csv(max_lines),
+                    self.split_csv(max_lines, quoted_newlines=False))
+                self.assertEqual(
+                    self.split_rows(max_lines),
+                    self.split_csv(max_lines, quoted_newlines=False))
+
+    def test_hint_with_custom_reader(self):
+        """
+        Ensure the hint can't be combined with a custom reader,
+        which it would ignore.
+        """
+        from functools import partial
+        from karld.loadump import csv_reader
+        from karld.loadump import split_csv_file
+
+        self.write_file(b'a|b\n')
+        self.assertRaises(ValueError, split_csv_file, self.file_path,
+                          self.tmp_dir, quoted_newlines=False,
+                          line_reader=partial(csv_reader, delimiter="|"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
 @attr('integration')
 class TestFileSystemIntegration(unittest.TestCase):
     """
@@ -377,3 +756,64 @@ class TestFileSystemIntegration(unittest.TestCase):
 
         if os.path.exists(expected_file):
             os.remove(expected_file)
+
+
+@attr('integration')
+class TestPartitionedOutput(unittest.TestCase):
+    def setUp(self):
+        self.out_dir = os.path.join(tempfile.gettempdir(),
+                                    "karld_test_partitioned")
+        if os.path.exists(self.out_dir):
+            shutil.rmtree(self.out_dir)
+        ensure_dir(self.out_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_csv_partitions(self):
+        """
+        Ensure each row is written to the partition of its key,
+        all partition files are created, and rows are kept when
+        partition files are closed and reopened.
+        """
+        from karld.loadump import i_get_csv_data
+        from karld.loadump import split_file_output_partitioned_csv
+
+        rows = [[u'thing{0}'.format(index), u'kind{0}'.format(index % 7)]
+                for index in range(60)]
+
+        file_names = split_file_output_partitioned_csv(
+            "things.csv", rows, 5, key=itemgetter(1), out_dir=self.out_dir,
+            max_open_files=2)
+
+        self.assertEqual([os.path.join(self.out_dir,
+                                       "{0}_things.csv".format(index))
+                          for index in range(5)], file_names)
+
+        kinds_seen = {}
+        all_rows = []
+        for index, file_name in enumerate(file_names):
+            self.assertTrue(os.path.exists(file_name))
+            for row in i_get_csv_data(file_name):
+                all_rows.append(row)
+                self.assertEqual(index,
+                                 kinds_seen.setdefault(row[1], index))
+
+        self.assertEqual(sorted(rows), sorted(all_rows))
+
+    def test_line_partitions(self):
+        """
+        Ensure lines are partitioned with a custom partitioner.
+        """
+        from karld.loadump import split_file_output_partitioned
+
+        lines = [b'0\n', b'1\n', b'2\n', b'3\n', b'4\n']
+
+        file_names = split_file_output_partitioned(
+            "lines.txt", lines, self.out_dir, 2,
+            partitioner=lambda line: int(line) % 2)
+
+        with open(file_names[0], 'rb') as stream:
+            self.assertEqual(b'0\n2\n4\n', stream.read())
+        with open(file_names[1], 'rb') as stream:
+            self.assertEqual(b'1\n3\n', stream.read())
@@ -0,0 +1,467 @@
+from operator import add
+from operator import itemgetter
+import random
+import unittest
+
+from nose.plugins.attrib import attr
+
+from karld.merger import block_merge
+from karld.merger import combine_by_key
+from karld.merger import decorated_key
+from karld.merger import decorated_value
+from karld.merger import external_sort
+from karld.merger import i_get_multi_groups
+from karld.merger import i_merge_group_sorted
+from karld.merger import i_recombine
+from karld.merger import i_sort_merge_group
+from karld.merger import merge
+from karld.merger import reduce_by_key
+from karld.merger import secondary_sort_key
+from karld.merger import sort_iterables
+from karld.merger import sort_merge_group
+from karld.merger import vector_sorted_by
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def shuffled_pairs(count, seed=3):
+    """
+    Rows of key and sequence number, in random order.
+    """
+    rnd = random.Random(seed)
+    items = [(rnd.randint(0, count // 4), index) for index in range(count)]
+    rnd.shuffle(items)
+    return items
+
+
+class TestMerge(unittest.TestCase):
+    def test_merge_with_key(self):
+        """
+        Ensure sorted iterables are merged into one sorted
+        output by key.
+        """
+        merged = merge([[2, 1], [2, 3], [2, 5], [2, 7]],
+                       [[2, 0], [2, 2], [2, 4], [2, 8]],
+                       [[2, 5], [2, 10], [2, 15], [2, 20]],
+                       [], [[2, 25]], key=itemgetter(-1))
+
+        self.assertEqual([0, 1, 2, 3, 4, 5, 5, 7, 8, 10, 15, 20, 25],
+                         [value for _, value in merged])
+
+
+class TestBlockMerge(unittest.TestCase):
+    def test_same_as_merge(self):
+        """
+        Ensure block_merge gives the same output as merge, including
+        the order of items with equal keys, for many inputs.
+        """
+        rnd = random.Random(7)
+        iterables = [sorted(((rnd.randint(0, 30), number, index)
+                             for index in range(rnd.randint(0, 40))),
+                            key=itemgetter(0))
+                     for number in range(50)]
+
+        for block_size in (1, 3, 16, 1000):
+            self.assertEqual(
+                list(merge(*iterables, key=itemgetter(0))),
+                list(block_merge(*iterables, key=itemgetter(0),
+                                 block_size=block_size)))
+
+    def test_without_key(self):
+        """
+        Ensure the items themselves are compared without a key.
+        """
+        self.assertEqual(
+            [0, 1, 2, 3, 4, 5, 5, 7, 8, 10, 15, 20, 25],
+            list(block_merge([1, 3, 5, 7], [0, 2, 4, 8], [5, 10, 15, 20],
+                             [], [25], block_size=2)))
+
+
+@attr('integration')
+class TestExternalSort(unittest.TestCase):
+    def test_external_sort_matches_sorted(self):
+        """
+        Ensure spilling sorted runs and merging them gives the
+        same, stable, order as sorted.
+        """
+        items = shuffled_pairs(1000)
+
+        result = list(external_sort(iter(items), key=itemgetter(0),
+                                    max_in_memory=64))
+
+        self.assertEqual(sorted(items, key=itemgetter(0)), result)
+
+    def test_sort_iterables_spills_runs(self):
+        """
+        Ensure with max_in_memory, each iterable is sorted in
+        runs no larger than max_in_memory.
+        """
+        items = shuffled_pairs(100)
+
+        runs = sort_iterables([items[:70], items[70:]], key=itemgetter(0),
+                              max_in_memory=30)
+
+        self.assertEqual([30, 30, 10, 30], list(map(len, runs)))
+        for run in runs:
+            self.assertEqual(sorted(run, key=itemgetter(0)), list(run))
+
+    def test_sort_merge_group_external(self):
+        """
+        Ensure the groups are the same whether or not the
+        iterables are sorted externally.
+        """
+        items = shuffled_pairs(500)
+        iterables = [items[:200], items[200:]]
+
+        self.assertEqual(
+            sort_merge_group(iterables, key=itemgetter(0)),
+            sort_merge_group(iterables, key=itemgetter(0), max_in_memory=50))
+
+    def test_bounded_fan_in(self):
+        """
+        Ensure runs are merged down to fan_in at a time, removing
+        the merged runs, and the sort stays stable.
+        """
+        items = shuffled_pairs(1000)
+
+        result = list(external_sort(iter(items), key=itemgetter(0),
+                                    max_in_memory=10, fan_in=3))
+
+        self.assertEqual(sorted(items, key=itemgetter(0)), result)
+
+        runs = sort_iterables([items[:500], items[500:]], key=itemgetter(0),
+                              max_in_memory=10, fan_in=4)
+        self.assertTrue(len(runs) <= 4)
+        self.assertEqual(sorted(items, key=itemgetter(0)),
+                         list(merge(*runs, key=itemgetter(0))))
+
+    def test_merge_runs_down_closes_runs(self):
+        """
+        Ensure the runs merged into larger runs are removed.
+        """
+        import os
+        from karld.merger import merge_runs_down
+        from karld.spill import spill
+
+        runs = [spill(sorted(shuffled_pairs(20), key=itemgetter(0)))
+                for _ in range(5)]
+        paths = [run.path for run in runs]
+
+        merged = merge_runs_down(runs, key=itemgetter(0), fan_in=2)
+
+        self.assertEqual(2, len(merged))
+        self.assertEqual(100, sum(map(len, merged)))
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestVectorSort(unittest.TestCase):
+    def test_numeric_keys_match_sorted(self):
+        """
+        Ensure int and float keys sort in the same, stable,
+        order as sorted.
+        """
+        items = shuffled_pairs(1000)
+        floats = [(key / 3.0, index) for key, index in items]
+
+        self.assertEqual(sorted(items, key=itemgetter(0)),
+                         vector_sorted_by(itemgetter(0), items))
+        self.assertEqual(sorted(floats, key=itemgetter(0)),
+                         vector_sorted_by(itemgetter(0), floats))
+
+    def test_string_keys_match_sorted(self):
+        """
+        Ensure string keys sort in the same, stable, order as sorted.
+        """
+        items = [(str(key), index) for key, index in shuffled_pairs(1000)]
+
+        self.assertEqual(sorted(items, key=itemgetter(0)),
+                         vector_sorted_by(itemgetter(0), items))
+
+    def test_other_keys_fall_back(self):
+        """
+        Ensure tuple keys, mixed types and ints too large for numpy
+        are sorted like sorted.
+        """
+        items = shuffled_pairs(100)
+        big = [(2 ** 70, 'a'), (1, 'b'), (-2 ** 70, 'c')]
+        mixed = [(1, 'a'), (0.5, 'b'), (True, 'c')]
+
+        self.assertEqual(sorted(items), vector_sorted_by(tuple, items))
+        self.assertEqual(sorted(big, key=itemgetter(0)),
+                         vector_sorted_by(itemgetter(0), big))
+        self.assertEqual(sorted(mixed, key=itemgetter(0)),
+                         vector_sorted_by(itemgetter(0), mixed))
+
+    def test_external_sort_with_vector_sorter(self):
+        """
+        Ensure vector_sorted_by can sort the runs of external_sort.
+        """
+        items = shuffled_pairs(1000)
+
+        result = list(external_sort(iter(items), key=itemgetter(0),
+                                    max_in_memory=64,
+                                    sorter=vector_sorted_by))
+
+        self.assertEqual(sorted(items, key=itemgetter(0)), result)
+
+
+@attr('integration')
+class TestStreamingGroups(unittest.TestCase):
+    def test_groups_are_lazy(self):
+        """
+        Ensure the first group is yielded before the
+        sorted inputs are exhausted.
+        """
+        consumed = []
+
+        def watched(items):
+            for item in items:
+                consumed.append(item)
+                yield item
+
+        groups = i_merge_group_sorted(
+            [watched([(1, 'a'), (1, 'b'), (2, 'c'), (3, 'd'), (3, 'e')])],
+            key=itemgetter(0))
+
+        self.assertEqual((1, [(1, 'a'), (1, 'b')]), next(groups))
+        self.assertEqual(3, len(consumed))
+        self.assertEqual([2, 3], [key_value for key_value, _ in groups])
+
+    def test_sort_merge_group_external_lazy(self):
+        """
+        Ensure i_sort_merge_group with external sorting yields
+        the same groups as sort_merge_group.
+        """
+        items = shuffled_pairs(300)
+
+        self.assertEqual(
+            sort_merge_group([items], key=itemgetter(0)),
+            list(i_sort_merge_group([items], key=itemgetter(0),
+                                    max_in_memory=40)))
+
+    def test_large_groups_spill(self):
+        """
+        Ensure groups larger than max_group_size are spilled,
+        keep their length and can be iterated more than once.
+        """
+        items = [(index % 2, index) for index in range(20)] + [(5, 0)]
+
+        groups = list(i_get_multi_groups([items], key=itemgetter(0),
+                                         max_in_memory=7,
+                                         max_group_size=4))
+
+        self.assertEqual([0, 1], [key_value for key_value, _ in groups])
+        even = groups[0][1]
+        self.assertFalse(isinstance(even, list))
+        self.assertEqual(10, len(even))
+        self.assertEqual(list(range(0, 20, 2)), [v for _, v in even])
+        self.assertEqual(list(even), list(even))
+
+
+class TestLazyGroups(unittest.TestCase):
+    def test_lazy_groups_stream_values(self):
+        """
+        Ensure lazy groups read their values from the merge as they
+        are iterated, and give the same groups as collecting them.
+        """
+        consumed = []
+
+        def watched(items):
+            for item in items:
+                consumed.append(item)
+                yield item
+
+        items = [(1, 'a'), (1, 'b'), (1, 'c'), (2, 'd')]
+        groups = i_merge_group_sorted([watched(items)], key=itemgetter(0),
+                                      lazy=True)
+
+        key_value, values = next(groups)
+        self.assertEqual(1, key_value)
+        self.assertEqual((1, 'a'), next(values))
+        self.assertTrue(len(consumed) < len(items))
+        self.assertEqual([(1, 'b'), (1, 'c')], list(values))
+        self.assertEqual([(2, [(2, 'd')])],
+                         [(key_value, list(values))
+                          for key_value, values in groups])
+
+    def test_lazy_groups_iterate_once(self):
+        """
+        Ensure iterating a lazy group again, or after the merge has
+        moved past it, raises rather than silently missing values.
+        """
+        items = [(1, 'a'), (1, 'b'), (2, 'c')]
+        groups = i_merge_group_sorted([items], key=itemgetter(0), lazy=True)
+
+        _, first = next(groups)
+        self.assertEqual([(1, 'a'), (1, 'b')], list(first))
+        self.assertRaises(RuntimeError, list, first)
+
+        groups = i_merge_group_sorted([items], key=itemgetter(0), lazy=True)
+        _, first = next(groups)
+        next(first)
+        next(groups)
+        self.assertRaises(RuntimeError, next, first)
+
+    @attr('integration')
+    def test_reiterable_spills(self):
+        """
+        Ensure a group made reiterable before reading it can be
+        read more than once, spilling groups over max_group_size.
+        """
+        items = [(index % 2, index) for index in range(20)]
+
+        groups = [(key_value, values.reiterable())
+                  for key_value, values
+                  in i_sort_merge_group([items], key=itemgetter(0),
+                                        max_group_size=4, lazy=True,
+                                        decorate=True)]
+
+        even = groups[0][1]
+        self.assertFalse(isinstance(even, list))
+        self.assertEqual(list(range(0, 20, 2)), [v for _, v in even])
+        self.assertEqual(list(even), list(even))
+        self.assertEqual(sort_merge_group([items], key=itemgetter(0)),
+                         [(key_value, list(values))
+                          for key_value, values in groups])
+
+
+class TestSecondarySort(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(7)
+        # Rows of user, timestamp and sequence number.
+        self.rows = [(rnd.randint(0, 9), rnd.randint(0, 50), index)
+                     for index in range(300)]
+        self.expected = [
+            (user, sorted((row for row in self.rows if row[0] == user),
+                          key=itemgetter(1)))
+            for user in sorted(set(map(itemgetter(0), self.rows)))]
+
+    def test_groups_ordered_by_secondary_key(self):
+        """
+        Ensure the items of each group come out ordered by the
+        secondary key, stably, in memory and sorted externally.
+        """
+        iterables = [self.rows[:120], self.rows[120:]]
+
+        self.assertEqual(
+            self.expected,
+            sort_merge_group(iterables, key=itemgetter(0),
+                             secondary_key=itemgetter(1)))
+        self.assertEqual(
+            self.expected,
+            [(key_value, list(values))
+             for key_value, values
+             in i_sort_merge_group(iterables, key=itemgetter(0),
+                                   secondary_key=itemgetter(1),
+                                   max_in_memory=40, lazy=True)])
+
+    def test_decorated_groups_ordered_by_secondary_key(self):
+        """
+        Ensure decorate orders groups by the secondary key too.
+        """
+        self.assertEqual(
+            self.expected,
+            sort_merge_group([self.rows], key=itemgetter(0),
+                             secondary_key=itemgetter(1), decorate=True))
+
+    def test_merge_group_presorted(self):
+        """
+        Ensure iterables sorted by the composite key are merged and
+        grouped with each group ordered by the secondary key.
+        """
+        sort_key = secondary_sort_key(itemgetter(0), itemgetter(1))
+        iterables = [sorted(self.rows[:150], key=sort_key),
+                     sorted(self.rows[150:], key=sort_key)]
+
+        groups = i_merge_group_sorted(iterables, key=itemgetter(0),
+                                      secondary_key=itemgetter(1))
+
+        self.assertEqual(
+            [(user, [row[1] for row in values])
+             for user, values in self.expected],
+            [(user, [row[1] for row in values]) for user, values in groups])
+
+    def test_external_sort_secondary_key(self):
+        """
+        Ensure external_sort orders by key then secondary key.
+        """
+        result = list(external_sort(iter(self.rows), key=itemgetter(0),
+                                    secondary_key=itemgetter(1),
+                                    max_in_memory=50))
+
+        self.assertEqual(sorted(self.rows, key=itemgetter(0, 1)), result)
+
+
+class TestDecoratedGroups(unittest.TestCase):
+    def test_key_called_once_per_item(self):
+        """
+        Ensure with decorate, the key function is called once for
+        each item and the groups are the same as without.
+        """
+        calls = []
+
+        def kind(item):
+            calls.append(item)
+            return item[1].lower()
+
+        iterables = [[('pear', 'Fruit'), ('cat', 'animal')],
+                     [('iron', 'metal'), ('apple', 'fruit')],
+                     [('dog', 'Animal')]]
+
+        groups = sort_merge_group(iterables, key=kind, decorate=True)
+
+        self.assertEqual(5, len(calls))
+        self.assertEqual(sort_merge_group(iterables, key=kind), groups)
+        self.assertEqual(
+            ('fruit', [('pear', 'Fruit'), ('apple', 'fruit')]), groups[1])
+
+
+class TestReduceByKey(unittest.TestCase):
+    def setUp(self):
+        self.iterables = [[('fruit', 'pear'), ('metal', 'iron'),
+                           ('fruit', 'apple')],
+                          [('animal', 'cat'), ('fruit', 'peach')]]
+        self.expected = [('animal', 1), ('fruit', 3), ('metal', 1)]
+
+    def test_reduce_by_key(self):
+        """
+        Ensure the values of each key are reduced to one value,
+        in key order, with or without combining.
+        """
+        for combine in (True, False):
+            counts = reduce_by_key(self.iterables, key=itemgetter(0),
+                                   reducer=add, value=lambda item: 1,
+                                   combine=combine, batch_size=2)
+            self.assertEqual(self.expected, list(counts))
+
+    def test_reduce_combined_results(self):
+        """
+        Ensure results of combine_by_key, as from pool workers,
+        can be reduced in the parent.
+        """
+        partials = [combine_by_key(itemgetter(0), add, items,
+                                   value=lambda item: 1)
+                    for items in self.iterables]
+
+        counts = reduce_by_key(partials, key=decorated_key, reducer=add,
+                               value=decorated_value)
+
+        self.assertEqual(self.expected, list(counts))
+
+
+class TestRecombine(unittest.TestCase):
+    def test_recombine_hot_keys(self):
+        """
+        Ensure partial reductions of hot keys from several partitions
+        are combined and other pairs pass through.
+        """
+        reduced = [[(u'hot', 3), (u'a', 1)],
+                   [(u'b', 2), (u'hot', 4)],
+                   [(u'hot', 5)]]
+
+        self.assertEqual([(u'a', 1), (u'b', 2), (u'hot', 12)],
+                         list(i_recombine(add, set([u'hot']), reduced)))
@@ -0,0 +1,187 @@
+from operator import itemgetter
+import unittest
+
+from karld.partition import CountMinSketch
+from karld.partition import HotKeyDetector
+from karld.partition import HotKeyPartitioner
+from karld.partition import hash_partitioner
+from karld.partition import hot_keys_from_sample
+from karld.partition import range_partitioner
+from karld.partition import reservoir_sample
+from karld.partition import skew_partitioner
+from karld.partition import split_points
+from karld.partition import stable_hash
+
+
+class TestHashPartitioner(unittest.TestCase):
+    def test_stable_hash(self):
+        """
+        Ensure equal values hash the same and text hashes
+        the same as its utf-8 bytes.
+        """
+        self.assertEqual(stable_hash(u'dr\xf3żką'),
+                         stable_hash(u'dr\xf3żką'.encode('utf-8')))
+        self.assertEqual(stable_hash((1, u'a')), stable_hash((1, u'a')))
+        self.assertNotEqual(stable_hash(u'a'), stable_hash(u'b'))
+
+    def test_stable_hash_normalized(self):
+        """
+        Ensure equal numbers of different types hash the same, and
+        hashes don't depend on the python version's reprs.
+        """
+        self.assertEqual(stable_hash(1), stable_hash(1.0))
+        self.assertEqual(stable_hash(1), stable_hash(True))
+        self.assertEqual(stable_hash(2 ** 70),
+                         stable_hash(b'1180591620717411303424'))
+        self.assertEqual(stable_hash((1, u'a')), stable_hash([1.0, b'a']))
+        self.assertNotEqual(stable_hash((u'a,', u'b')),
+                            stable_hash((u'a', u',b')))
+        # Pinned, so a change in hashing, which moves keys to other
+        # partitions, is noticed.
+        self.assertEqual(658145433, stable_hash((1, u'a')))
+        self.assertEqual(2258563469, stable_hash(0.5))
+
+    def test_same_key_same_partition(self):
+        """
+        Ensure items with the same key go to the same partition,
+        within the range of partitions.
+        """
+        partitioner = hash_partitioner(itemgetter(1), 4)
+        rows = [(index, u'key{0}'.format(index % 10)) for index in range(100)]
+
+        by_key = {}
+        for row in rows:
+            partition = partitioner(row)
+            self.assertTrue(0 <= partition < 4)
+            by_key.setdefault(row[1], set()).add(partition)
+
+        self.assertEqual([1] * 10, [len(parts) for parts in by_key.values()])
+
+
+class TestRangePartitioner(unittest.TestCase):
+    def test_reservoir_sample(self):
+        """
+        Ensure the sample is of the items and no larger than size.
+        """
+        import random
+        sample = reservoir_sample(10, range(1000), rand=random.Random(1))
+
+        self.assertEqual(10, len(sample))
+        self.assertEqual(10, len(set(sample)))
+        self.assertTrue(all(0 <= item < 1000 for item in sample))
+        self.assertEqual([0, 1, 2], reservoir_sample(10, range(3)))
+
+    def test_ranges_are_ordered(self):
+        """
+        Ensure every key of a partition sorts before the keys of
+        the next partition.
+        """
+        points = split_points(range(100), 4)
+        partitioner = range_partitioner(itemgetter(0), points)
+
+        self.assertEqual([25, 50, 75], points)
+        partitions = [partitioner((value,)) for value in range(-5, 105)]
+        self.assertEqual(sorted(partitions), partitions)
+        self.assertEqual(0, partitioner((24,)))
+        self.assertEqual(1, partitioner((25,)))
+        self.assertEqual(3, partitioner((104,)))
+
+
+def skewed_keys(count):
+    """
+    Keys where u'hot' is half of them and the rest are rare.
+    """
+    return [u'hot' if index % 2 else u'key{0}'.format(index)
+            for index in range(count)]
+
+
+class TestHotKeys(unittest.TestCase):
+    def test_count_min_sketch(self):
+        """
+        Ensure estimates are never lower than the true counts,
+        and sketches can be combined.
+        """
+        keys = skewed_keys(1000)
+        sketch = CountMinSketch(width=64, depth=3)
+        other = CountMinSketch(width=64, depth=3)
+        for key_value in keys[:600]:
+            sketch.add(key_value)
+        for key_value in keys[600:]:
+            other.add(key_value)
+
+        sketch.update(other)
+
+        self.assertEqual(1000, sketch.total)
+        self.assertTrue(sketch.estimate(u'hot') >= 500)
+        for key_value in keys[:100:2]:
+            self.assertTrue(sketch.estimate(key_value) >= 1)
+
+    def test_detect_hot_keys(self):
+        """
+        Ensure a dominant key is found from a sample and from a sketch,
+        and rare keys are not.
+        """
+        import random
+
+        keys = skewed_keys(4000)
+        detector = HotKeyDetector(fraction=0.05, min_count=100)
+        for key_value in keys:
+            detector.add(key_value)
+
+        self.assertEqual(set([u'hot']),
+                         hot_keys_from_sample(keys, fraction=0.05,
+                                              sample_size=500,
+                                              rand=random.Random(1)))
+        self.assertEqual(set([u'hot']), detector.hot_keys)
+
+    def test_skew_partitioner(self):
+        """
+        Ensure items of hot keys are spread over partitions
+        and the other keys keep one partition each.
+        """
+        partitioner = skew_partitioner(itemgetter(1), 4, [u'hot'])
+        rows = [(index, key_value)
+                for index, key_value in enumerate(skewed_keys(400))]
+
+        by_key = {}
+        for row in rows:
+            by_key.setdefault(row[1], set()).add(partitioner(row))
+
+        self.assertEqual(4, len(by_key.pop(u'hot')))
+        self.assertEqual(set([1]), set(map(len, by_key.values())))
+
+    def test_duplicate_hot_rows_spread(self):
+        """
+        Ensure identical rows of a hot key are spread evenly,
+        not sent to one partition by their hash.
+        """
+        rows = [[u'hot']] * 10000
+        partitioners = [
+            skew_partitioner(itemgetter(0), 4, [u'hot']),
+            HotKeyPartitioner(
+                itemgetter(0), 4,
+                detector=HotKeyDetector(fraction=0.05, min_count=100))]
+
+        for partitioner in partitioners:
+            counts = [0] * 4
+            for row in rows:
+                counts[partitioner(row)] += 1
+            self.assertTrue(max(counts) <= 2600, counts)
+
+    def test_hot_key_partitioner(self):
+        """
+        Ensure a key found hot while partitioning is spread
+        from then on.
+        """
+        partitioner = HotKeyPartitioner(
+            itemgetter(1), 4,
+            detector=HotKeyDetector(fraction=0.05, min_count=100))
+        rows = [(index, key_value)
+                for index, key_value in enumerate(skewed_keys(400))]
+
+        partitions = [partitioner(row) for row in rows]
+
+        self.assertEqual(set([u'hot']), partitioner.hot_keys)
+        self.assertEqual(4, len(set(
+            partition for partition, row in zip(partitions, rows)
+            if row[1] == u'hot')))
@@ -21,6 +21,10 @@ def collect_first(items):
     return results
 
 
+def one(item):
+    return 1
+
+
 class TestDistributeMulti(unittest.TestCase):
     @attr('integration')
     def test_default_reader(self):
@@ -104,6 +108,77 @@ def json_values(items):
     return results
 
 
+class TestDistributeRanges(unittest.TestCase):
+    @attr('integration')
+    def test_distribute_ranges(self):
+        """
+        Ensure each worker reads its own range of lines and the
+        results are in file order.
+        """
+        from karld.loadump import i_read_buffered_binary_file
+        from karld.run_together import distribute_ranges_to_runners
+
+        input_path = os.path.join(os.path.dirname(__file__),
+                                  "test_data",
+                                  "things_kinds",
+                                  "data_0.csv")
+
+        results = distribute_ranges_to_runners(list, input_path, ranges=3,
+                                               max_workers=2)
+
+        self.assertEqual(3, len(results))
+        self.assertEqual(list(i_read_buffered_binary_file(input_path)),
+                         list(chain.from_iterable(results)))
+
+
+class TestDistributeCSVRanges(unittest.TestCase):
+    def setUp(self):
+        self.in_dir = tempfile.mkdtemp()
+        self.rows = [[str(index), 'one\n"two"\nthree' if index % 3 else 'x']
+                     for index in range(300)]
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.in_dir)
+
+    @attr('integration')
+    def test_distribute_csv_ranges(self):
+        """
+        Ensure each worker parses its own range of whole records.
+        """
+        from karld.loadump import write_as_csv
+        from karld.run_together import distribute_csv_ranges_to_runners
+
+        path = os.path.join(self.in_dir, "multiline.csv")
+        write_as_csv(self.rows, path)
+
+        results = distribute_csv_ranges_to_runners(list, path, ranges=5,
+                                                   max_workers=2)
+
+        self.assertEqual(5, len(results))
+        self.assertEqual(self.rows, list(chain.from_iterable(results)))
+
+    @attr('integration')
+    def test_stray_quote_falls_back(self):
+        """
+        Ensure a quote in an unquoted field, which throws off the
+        record boundaries, falls back to reading serially.
+        """
+        from karld.loadump import write_as_csv
+        from karld.run_together import distribute_csv_ranges_to_runners
+
+        path = os.path.join(self.in_dir, "stray_quote.csv")
+        with open(path, 'wb') as stray:
+            stray.write(b'0,5"10\r\n')
+        write_as_csv(self.rows, path, append=True)
+        rows = [['0', '5"10']] + self.rows
+
+        results = distribute_csv_ranges_to_runners(list, path, ranges=8,
+                                                   max_workers=2)
+
+        self.assertEqual(rows, list(chain.from_iterable(results)))
+
+
 class TestDistribute(unittest.TestCase):
     @attr('integration')
     def test_default_reader(self):
@@ -210,3 +285,257 @@ class TestCSVFileToFile(unittest.TestCase):
                          [u'celery', u'vegetable']), results)
 
 
+class TestMergeTree(unittest.TestCase):
+    def setUp(self):
+        self.in_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.in_dir)
+
+    @attr('integration')
+    def test_merge_tree(self):
+        """
+        Ensure merging more files than fan_in in multiple levels
+        gives the same result as merging them all at once.
+        """
+        from operator import itemgetter
+        from karld.loadump import write_as_csv
+        from karld.run_together import i_merge_tree
+
+        paths = []
+        for number in range(11):
+            rows = sorted([str((index * 7 + number) % 13), str(number)]
+                          for index in range(number + 2))
+            path = os.path.join(self.in_dir, "{0}.csv".format(number))
+            write_as_csv(rows, path)
+            paths.append(path)
+
+        expected = sorted(
+            chain.from_iterable(
+                sorted([str((index * 7 + number) % 13), str(number)]
+                       for index in range(number + 2))
+                for number in range(11)),
+            key=itemgetter(0))
+
+        merged = list(i_merge_tree(paths, key=itemgetter(0),
+                                   fan_in=3, max_workers=2))
+
+        self.assertEqual(expected, merged)
+
+
+class TestMergeSortedFiles(unittest.TestCase):
+    def setUp(self):
+        self.in_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.in_dir)
+
+    @attr('integration')
+    def test_merge_sorted_csv_files(self):
+        """
+        Ensure sorted csv files are merged into one sorted csv file,
+        with the number of rows reported.
+        """
+        from operator import itemgetter
+        from karld.loadump import i_get_csv_data
+        from karld.loadump import write_as_csv
+        from karld.run_together import merge_sorted_csv_files
+
+        shards = [sorted([str((index * 5 + number) % 9), str(number)]
+                         for index in range(number + 3))
+                  for number in range(4)]
+        paths = []
+        for number, rows in enumerate(shards):
+            path = os.path.join(self.in_dir, "{0}.csv".format(number))
+            write_as_csv(rows, path)
+            paths.append(path)
+        out_path = os.path.join(self.in_dir, "merged.csv")
+
+        stats = merge_sorted_csv_files(paths, itemgetter(0), out_path,
+                                       buffering=4096, line_buffer_size=2)
+
+        self.assertEqual(sorted(chain.from_iterable(shards),
+                                key=itemgetter(0)),
+                         list(i_get_csv_data(out_path)))
+        self.assertEqual(18, stats['rows'])
+        self.assertTrue(stats['rows_per_second'] >= 0)
+
+    @attr('integration')
+    def test_buffering_split_between_inputs(self):
+        """
+        Ensure the buffering budget is split between the inputs,
+        down to the smallest buffer of an input.
+        """
+        from operator import itemgetter
+        from mock import patch
+        from karld.loadump import i_get_csv_data
+        from karld.loadump import write_as_csv
+        from karld.run_together import MIN_MERGE_BUFFER_SIZE
+        from karld.run_together import merge_sorted_csv_files
+
+        paths = []
+        for number in range(4):
+            path = os.path.join(self.in_dir, "{0}.csv".format(number))
+            write_as_csv([[str(number)]], path)
+            paths.append(path)
+        out_path = os.path.join(self.in_dir, "merged.csv")
+
+        for buffering, expected in ((MIN_MERGE_BUFFER_SIZE * 8,
+                                     MIN_MERGE_BUFFER_SIZE * 2),
+                                    (4096, MIN_MERGE_BUFFER_SIZE)):
+            with patch('karld.run_together.i_get_csv_data',
+                       wraps=i_get_csv_data) as mock_reader:
+                merge_sorted_csv_files(paths, itemgetter(0), out_path,
+                                       buffering=buffering)
+            self.assertEqual(
+                [expected] * 4,
+                [call[1]['buffering'] for call in mock_reader.call_args_list])
+
+
+class TestRangeSort(unittest.TestCase):
+    def setUp(self):
+        self.in_dir = tempfile.mkdtemp()
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.in_dir)
+        shutil.rmtree(self.out_dir)
+
+    @attr('integration')
+    def test_range_sort_csv_files(self):
+        """
+        Ensure the sorted partitions, read in order, contain
+        all the rows in order.
+        """
+        import random
+        from operator import itemgetter
+        from karld.loadump import i_get_csv_data
+        from karld.loadump import write_as_csv
+        from karld.run_together import range_sort_csv_files
+
+        rnd = random.Random(5)
+        rows = [[u'{0:04d}'.format(rnd.randint(0, 500)), str(index)]
+                for index in range(300)]
+        paths = []
+        for number in range(3):
+            path = os.path.join(self.in_dir, "{0}.csv".format(number))
+            write_as_csv(rows[number::3], path)
+            paths.append(path)
+
+        sorted_paths = range_sort_csv_files(
+            paths, itemgetter(0), self.out_dir, "sorted.csv",
+            partitions=4, sample_size=50, max_in_memory=40, max_workers=2)
+
+        self.assertEqual(4, len(sorted_paths))
+        result = list(chain.from_iterable(
+            i_get_csv_data(path) for path in sorted_paths))
+        self.assertEqual(sorted(rows), sorted(result))
+        self.assertEqual(sorted(map(itemgetter(0), rows)),
+                         list(map(itemgetter(0), result)))
+
+
+class TestHashJoinFiles(unittest.TestCase):
+    def setUp(self):
+        self.in_dir = tempfile.mkdtemp()
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.in_dir)
+        shutil.rmtree(self.out_dir)
+
+    @attr('integration')
+    def test_hash_join_csv_files(self):
+        """
+        Ensure rows of the left and right files with the same key
+        are joined across the partitions.
+        """
+        from operator import itemgetter
+        from karld.loadump import i_get_csv_data
+        from karld.loadump import write_as_csv
+        from karld.run_together import hash_join_csv_files
+
+        people = os.path.join(self.in_dir, "people.csv")
+        pets = os.path.join(self.in_dir, "pets.csv")
+        write_as_csv([['1', 'John'], ['2', 'Sally'], ['4', 'Ann']], people)
+        write_as_csv([['cat', '1'], ['dog', '1'], ['fish', '3']], pets)
+
+        out_paths = hash_join_csv_files(
+            [people], [pets], self.out_dir, "joined.csv",
+            left_key=itemgetter(0), right_key=itemgetter(1),
+            partitions=3, max_in_memory=1, max_workers=2)
+
+        self.assertEqual(3, len(out_paths))
+        self.assertEqual(
+            [['1', 'John', 'cat', '1'], ['1', 'John', 'dog', '1']],
+            sorted(chain.from_iterable(
+                i_get_csv_data(path) for path in out_paths)))
+
+    @attr('integration')
+    def test_outer_join_pads_missing_rows(self):
+        """
+        Ensure rows missing from either side of an outer join are
+        filled with empty fields, so the columns line up.
+        """
+        from operator import itemgetter
+        from karld.join import OUTER
+        from karld.loadump import i_get_csv_data
+        from karld.loadump import write_as_csv
+        from karld.run_together import hash_join_csv_files
+
+        people = os.path.join(self.in_dir, "people.csv")
+        pets = os.path.join(self.in_dir, "pets.csv")
+        write_as_csv([['1', 'John'], ['2', 'Sally']], people)
+        write_as_csv([['cat', '1'], ['fish', '3']], pets)
+
+        out_paths = hash_join_csv_files(
+            [people], [pets], self.out_dir, "joined.csv", how=OUTER,
+            left_key=itemgetter(0), right_key=itemgetter(1),
+            partitions=2, max_workers=2)
+
+        self.assertEqual(
+            [['', '', 'fish', '3'],
+             ['1', 'John', 'cat', '1'],
+             ['2', 'Sally', '', '']],
+            sorted(chain.from_iterable(
+                i_get_csv_data(path) for path in out_paths)))
+
+
+class TestReduceFilesByKey(unittest.TestCase):
+    def setUp(self):
+        self.in_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.in_dir)
+
+    @attr('integration')
+    def test_reduce_skewed_csv_files(self):
+        """
+        Ensure counts per key are right when one key is
+        hot and spread over the partitions.
+        """
+        from operator import add
+        from operator import itemgetter
+        from karld.loadump import write_as_csv
+        from karld.run_together import reduce_csv_files_by_key
+
+        paths = []
+        for number in range(2):
+            rows = [['hot' if index % 3 else 'key{0}'.format(index % 30),
+                     str(index)]
+                    for index in range(1500)]
+            path = os.path.join(self.in_dir, "{0}.csv".format(number))
+            write_as_csv(rows, path)
+            paths.append(path)
+
+        counts = dict(reduce_csv_files_by_key(
+            paths, itemgetter(0), add, value=one, partitions=3,
+            hot_fraction=0.1, max_workers=2))
+
+        self.assertEqual(2000, counts.pop('hot'))
+        self.assertEqual(10, len(counts))
+        self.assertEqual(set([100]), set(counts.values()))
@@ -0,0 +1,57 @@
+from operator import itemgetter
+import unittest
+
+from nose.plugins.attrib import attr
+
+from karld.spill import MAX_PARTITION_DEPTH
+from karld.spill import can_partition
+from karld.spill import i_partitioned
+
+
+@attr('integration')
+class TestPartitioned(unittest.TestCase):
+    def test_equal_keys_same_partition(self):
+        """
+        Ensure items of every stream with equal keys are finished
+        together, a partition at a time, one level deeper.
+        """
+        left = [(number % 7, 'left', number) for number in range(50)]
+        right = [(number % 5, 'right', number) for number in range(20)]
+
+        def finish(depth, left_part, right_part):
+            yield depth, list(left_part), list(right_part)
+
+        finished = list(i_partitioned([left, right],
+                                      [itemgetter(0), itemgetter(0)],
+                                      finish, partitions=4, depth=1))
+
+        self.assertEqual(4, len(finished))
+        self.assertEqual(set([2]), set(depth for depth, _, _ in finished))
+        self.assertEqual(sorted(left),
+                         sorted(row for _, rows, _ in finished
+                                for row in rows))
+        self.assertEqual(sorted(right),
+                         sorted(row for _, _, rows in finished
+                                for row in rows))
+        partition_keys = [set(row[0] for row in left_rows + right_rows)
+                          for _, left_rows, right_rows in finished]
+        self.assertEqual(sum(len(keys) for keys in partition_keys),
+                         len(set.union(*partition_keys)))
+
+    def test_depth_limit(self):
+        """
+        Ensure finish that partitions while it can stops at the
+        max depth.
+        """
+        def finish(depth, part):
+            if can_partition(depth):
+                return i_partitioned([part], [itemgetter(0)], finish,
+                                     partitions=2, depth=depth)
+            return [(depth, row) for row in part]
+
+        finished = list(i_partitioned([[(1, 'a'), (1, 'b')]],
+                                      [itemgetter(0)], finish,
+                                      partitions=2))
+
+        self.assertEqual([(MAX_PARTITION_DEPTH, (1, 'a')),
+                          (MAX_PARTITION_DEPTH, (1, 'b'))], finished)